@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 
 application = get_asgi_application()
+
+# Apps are loaded, start loading the chat models on the Ollama server
+# and the rerank model of this process
+from chat.llm import warm_models_in_background  # noqa: E402
+from chat.rerank import warm_reranker_in_background  # noqa: E402
+
+warm_models_in_background()
+warm_reranker_in_background()
@@ -77,6 +77,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "app.wsgi.application"
+ASGI_APPLICATION = "app.asgi.application"
 
 
 # Database
@@ -151,10 +152,159 @@ SPECTACULAR_SETTINGS = {
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
-CHROMA_ROOT = BASE_DIR / 'chroma_storage'
-
-CELERY_BROKER_URL = "redis://127.0.0.1:6379/0"
+# Vector stores, one directory per project under CHROMA_ROOT/projects
+CHROMA_ROOT = Path(os.getenv("CHROMA_ROOT", BASE_DIR / 'chroma_stores'))
+# Roots used by older layouts, moved by `manage.py consolidate_vector_stores`
+CHROMA_LEGACY_ROOTS = [BASE_DIR / 'chroma_storage']
+# Backend new vector stores are written to: "chroma", or "local" for the
+# in-process flat index, see project.utils.vector_backends
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Local backend: projects with this many vectors get an IVF index, searches
+# scan the LOCAL_IVF_NPROBE lists closest to the query
+LOCAL_IVF_MIN_VECTORS = int(os.getenv("LOCAL_IVF_MIN_VECTORS", 50_000))
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", 8))
+# Local backend with float16/int8 vectors: candidates per result re-scored
+# against the float32 vectors
+LOCAL_RESCORE_FACTOR = int(os.getenv("LOCAL_RESCORE_FACTOR", 4))
+# Vector stores kept open per process, the least recently used is closed
+VECTOR_STORE_MAX_OPEN = int(os.getenv("VECTOR_STORE_MAX_OPEN", 32))
+
+# Chat answers, generated by Ollama from the retrieved chunks
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 120))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", 20))
+# How long Ollama keeps a model loaded after a request (durations like
+# 30m, 1h or -1 for forever). OLLAMA_KEEP_ALIVE is a plain duration, as
+# for the Ollama server, OLLAMA_MODEL_KEEP_ALIVE overrides it per model
+# as "model=duration,..."
+OLLAMA_DEFAULT_KEEP_ALIVE = os.getenv(
+    "OLLAMA_DEFAULT_KEEP_ALIVE", os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+)
+OLLAMA_MODEL_KEEP_ALIVE = dict(
+    item.split("=", 1)
+    for item in os.getenv("OLLAMA_MODEL_KEEP_ALIVE", "").split(",") if "=" in item
+)
+# Models loaded when a web or chat worker process starts, and loaded
+# again every OLLAMA_POOL_CHECK_INTERVAL seconds if the server evicted them
+OLLAMA_WARM_MODELS = [
+    name for name in os.getenv("OLLAMA_WARM_MODELS", "").split(",") if name
+]
+OLLAMA_POOL_CHECK_INTERVAL = int(os.getenv("OLLAMA_POOL_CHECK_INTERVAL", 60))
+CHAT_MODEL = os.getenv("CHAT_MODEL", "qwen3:1.7b")
+CHAT_SYSTEM_PROMPT = "You are a helpful assistant."
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 4))
+# Token budgets of the retrieved context and the chat history in the
+# prompt. CHAT_TOKENIZER is the Hugging Face tokenizer of CHAT_MODEL,
+# e.g. Qwen/Qwen3-1.7B, tokens are estimated from characters when unset
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", 1500))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", 1000))
+CHAT_TOKENIZER = os.getenv("CHAT_TOKENIZER", "")
+# Once the unsummarized messages of a chat pass this many tokens, all but
+# the last CHAT_SUMMARY_KEEP_MESSAGES are folded into its rolling summary
+CHAT_SUMMARY_THRESHOLD_TOKENS = int(os.getenv("CHAT_SUMMARY_THRESHOLD_TOKENS", 1500))
+CHAT_SUMMARY_KEEP_MESSAGES = int(os.getenv("CHAT_SUMMARY_KEEP_MESSAGES", 4))
+# Fuse vector and BM25 results, each side contributes RAG_FETCH_K candidates
+RAG_HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "1") == "1"
+RAG_FETCH_K = int(os.getenv("RAG_FETCH_K", 20))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", 60))
+# Optional cross-encoder reranking, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2.
+# RERANK_CANDIDATES chunks are retrieved and the best RAG_TOP_K are kept.
+# Past RERANK_TIME_BUDGET seconds the retrieval order is used instead
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 16))
+RERANK_TIME_BUDGET = float(os.getenv("RERANK_TIME_BUDGET", 0.5))
+# Reuse answers of questions at least this similar (cosine) to an
+# already answered one, per project. 0 disables the answer cache
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 500))
+# Cache of vector search results, in process and optionally in redis
+# shared by every process. 0 entries disables the cache, an empty url
+# keeps it in process only
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", 1024))
+RETRIEVAL_CACHE_REDIS_URL = os.getenv("RETRIEVAL_CACHE_REDIS_URL", "")
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", 60 * 60))
+# Threads running vector searches for the async chat views
+CHAT_RETRIEVAL_THREADS = int(os.getenv("CHAT_RETRIEVAL_THREADS", 8))
+
+# Document chunking
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
+
+# Limits of a single bulk upload request
+DOCUMENT_BULK_MAX_FILES = int(os.getenv("DOCUMENT_BULK_MAX_FILES", 500))
+DOCUMENT_BULK_MAX_BYTES = int(os.getenv("DOCUMENT_BULK_MAX_BYTES", 2 * 1024 ** 3))
+DATA_UPLOAD_MAX_NUMBER_FILES = DOCUMENT_BULK_MAX_FILES
+# Offload document downloads to the front proxy: "" serves them from
+# Django, "nginx" sets X-Accel-Redirect and "apache" sets X-Sendfile
+DOCUMENT_DOWNLOAD_SENDFILE = os.getenv("DOCUMENT_DOWNLOAD_SENDFILE", "")
+# nginx internal location aliased to MEDIA_ROOT
+DOCUMENT_DOWNLOAD_ACCEL_PREFIX = os.getenv(
+    "DOCUMENT_DOWNLOAD_ACCEL_PREFIX", "/protected-media/"
+)
+# Limits of resumable uploads sent in parts
+DOCUMENT_UPLOAD_MAX_BYTES = int(os.getenv("DOCUMENT_UPLOAD_MAX_BYTES", 1024 ** 3))
+DOCUMENT_UPLOAD_MAX_PART_BYTES = int(os.getenv("DOCUMENT_UPLOAD_MAX_PART_BYTES", 16 * 1024 ** 2))
+# Seconds an upload may go without a part before it is removed
+DOCUMENT_UPLOAD_EXPIRY = int(os.getenv("DOCUMENT_UPLOAD_EXPIRY", 24 * 3600))
+
+# Embedding models, loaded once per worker process
+EMBEDDING_MODEL_NAME = os.getenv(
+    "EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"
+)
+EMBEDDING_WARM_MODELS = [EMBEDDING_MODEL_NAME]
+# Chunks are encoded and written in micro-batches bounded by both limits
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 8192))
+# CPU threads used by torch for encoding, 0 keeps the torch default
+EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", 0))
+# Size of the persistent embedding cache in entries, 0 disables it
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200_000))
+# Seconds between two saves of a process' cache hit/miss counters
+CACHE_STATS_FLUSH_INTERVAL = float(os.getenv("CACHE_STATS_FLUSH_INTERVAL", 10))
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://127.0.0.1:6379/0")
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
-CELERY_RESULT_SERIALIZER = "json"
\ No newline at end of file
+CELERY_RESULT_SERIALIZER = "json"
+# Ingestion runs on its own queue so embedding work does not compete with
+# other tasks, start its workers with `-Q ingestion -O fair`
+INGESTION_QUEUE = "ingestion"
+CELERY_TASK_ROUTES = {
+    "project.tasks.process_document_task": {"queue": INGESTION_QUEUE},
+    "project.tasks.process_documents_task": {"queue": INGESTION_QUEUE},
+    "project.tasks.delete_document_vectors_task": {"queue": INGESTION_QUEUE},
+    "project.tasks.delete_project_vectors_task": {"queue": INGESTION_QUEUE},
+    "project.tasks.compact_vector_stores_task": {"queue": INGESTION_QUEUE},
+}
+# Each worker process reserves one task at a time
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Seconds between the runs reclaiming the space of deleted vectors
+VECTOR_COMPACTION_INTERVAL = int(os.getenv("VECTOR_COMPACTION_INTERVAL", 24 * 3600))
+# Periodic tasks, run by `celery -A app beat`
+CELERY_BEAT_SCHEDULE = {
+    "maintain-llm-pool": {
+        "task": "chat.tasks.maintain_llm_pool_task",
+        "schedule": OLLAMA_POOL_CHECK_INTERVAL,
+    },
+    "compact-vector-stores": {
+        "task": "project.tasks.compact_vector_stores_task",
+        "schedule": VECTOR_COMPACTION_INTERVAL,
+    },
+    "cleanup-uploads": {
+        "task": "project.tasks.cleanup_uploads_task",
+        "schedule": 3600,
+    },
+}
+
+# Per project write lock shared by the ingestion workers
+INGESTION_LOCK_URL = os.getenv("INGESTION_LOCK_URL", CELERY_BROKER_URL)
+INGESTION_LOCK_TIMEOUT = int(os.getenv("INGESTION_LOCK_TIMEOUT", 60 * 60))
+# Seconds `manage.py reindex` waits for the lock to switch collections
+REINDEX_LOCK_WAIT = int(os.getenv("REINDEX_LOCK_WAIT", 10 * 60))
+# Seconds before a document of a busy project is retried, doubled on
+# every retry up to the max delay. Past INGESTION_MAX_RETRIES the task fails
+INGESTION_RETRY_DELAY = int(os.getenv("INGESTION_RETRY_DELAY", 5))
+INGESTION_RETRY_MAX_DELAY = int(os.getenv("INGESTION_RETRY_MAX_DELAY", 5 * 60))
+INGESTION_MAX_RETRIES = int(os.getenv("INGESTION_MAX_RETRIES", 100))
\ No newline at end of file
@@ -32,4 +32,5 @@ urlpatterns = [
     ),
     path("api/user/", include("user.urls")),
     path("api/", include("project.urls")),
+    path("api/", include("chat.urls")),
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 
 application = get_wsgi_application()
+
+# Apps are loaded, start loading the rerank model of this process
+from chat.rerank import warm_reranker_in_background  # noqa: E402
+
+warm_reranker_in_background()
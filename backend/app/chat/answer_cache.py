@@ -0,0 +1,104 @@
+"""
+Per-project semantic cache of chat answers.
+Standalone questions are embedded and compared with the questions
+already answered in the project, a close enough match reuses its answer
+instead of running retrieval and generation again.
+"""
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from project.utils.cache_stats import CacheStats
+from project.utils.embeddings import get_embedding_model
+from .models import AnswerCacheEntry
+
+log = logging.getLogger(__name__)
+
+# Hit/miss counters of the lookups, per project
+stats = CacheStats("answer")
+
+
+def get_cache_stats():
+    """Hits, misses and hit rate of the answer cache in this process"""
+    return stats.get()
+
+
+def reset_cache_stats():
+    stats.reset()
+
+
+def is_enabled():
+    return settings.ANSWER_CACHE_SIMILARITY > 0
+
+
+def embed_question(question):
+    """Normalized float32 embedding of `question`"""
+    vector = np.asarray(
+        get_embedding_model().embed_query(question), dtype=np.float32
+    )
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def lookup_answer(project, question):
+    """
+    Cached answer of the most similar question of `project`, or None.
+    Also returns the question's vector so a miss can be stored without
+    embedding it again.
+    """
+    vector = embed_question(question)
+    entries = list(
+        AnswerCacheEntry.objects
+        .filter(project=project, model_name=settings.EMBEDDING_MODEL_NAME)
+        .only("pk", "vector", "answer")
+    )
+    if entries:
+        matrix = np.stack([
+            np.frombuffer(bytes(entry.vector), dtype=np.float32)
+            for entry in entries
+        ])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= settings.ANSWER_CACHE_SIMILARITY:
+            entry = entries[best]
+            AnswerCacheEntry.objects.filter(pk=entry.pk).update(
+                hits=F("hits") + 1, last_used_at=timezone.now()
+            )
+            stats.record(scope=project.id, hits=1)
+            log.info(
+                f"Answer cache hit for project {project.id} "
+                f"(similarity {scores[best]:.3f})"
+            )
+            return entry.answer, vector
+    stats.record(scope=project.id, misses=1)
+    return None, vector
+
+
+def store_answer(project, question, answer, vector):
+    """Cache `answer`, dropping the least recently used entries over the limit"""
+    AnswerCacheEntry.objects.create(
+        project=project,
+        question=question,
+        model_name=settings.EMBEDDING_MODEL_NAME,
+        vector=vector.astype(np.float32).tobytes(),
+        answer=answer
+    )
+    stale = list(
+        AnswerCacheEntry.objects
+        .filter(project=project)
+        .order_by("-last_used_at", "-pk")
+        .values_list("pk", flat=True)[settings.ANSWER_CACHE_MAX_ENTRIES:]
+    )
+    if stale:
+        AnswerCacheEntry.objects.filter(pk__in=stale).delete()
+
+
+def invalidate_answers(project_id):
+    """Forget the cached answers of a project, its documents changed"""
+    deleted, _ = AnswerCacheEntry.objects.filter(project_id=project_id).delete()
+    if deleted:
+        log.info(f"Invalidated {deleted} cached answers of project {project_id}")
+    return deleted
@@ -0,0 +1,144 @@
+"""
+Token budgeted assembly of the RAG prompt.
+Retrieved chunks overlap (chunk_overlap characters) and neighbours of
+the same page are often retrieved together, packing removes the repeated
+text, merges neighbours back into passages and keeps the most relevant
+passages that fit in RAG_CONTEXT_TOKENS. The chat history is trimmed to
+CHAT_HISTORY_TOKENS the same way, newest turns first.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from langchain_core.documents import Document as Chunk
+
+from project.utils.embeddings import estimate_tokens
+
+log = logging.getLogger(__name__)
+
+# Shortest overlap considered the shared text of two neighbour chunks,
+# shorter matches are likely coincidences
+MIN_OVERLAP = 20
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """
+    Tokenizer of the chat model (CHAT_TOKENIZER, a Hugging Face name),
+    None when not configured or it can't be loaded
+    """
+    global _tokenizer
+    if not settings.CHAT_TOKENIZER:
+        return None
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(settings.CHAT_TOKENIZER)
+            except Exception:
+                log.exception(
+                    f"Can't load tokenizer {settings.CHAT_TOKENIZER}, "
+                    "estimating token counts"
+                )
+                _tokenizer = False
+    return _tokenizer or None
+
+
+def count_tokens(text):
+    """Number of tokens of `text` for the chat model"""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def _overlap(head, tail):
+    """Length of the text ending `head` that also starts `tail`, or 0"""
+    longest = min(len(head), len(tail), settings.CHUNK_OVERLAP + MIN_OVERLAP)
+    for size in range(longest, MIN_OVERLAP - 1, -1):
+        if head.endswith(tail[:size]):
+            return size
+    return 0
+
+
+def _same_page(a, b):
+    keys = ("content_hash", "page")
+    return all(a.get(key) == b.get(key) for key in keys) and "page" in a
+
+
+def _merge(passage, chunk):
+    """Text of `passage` extended with `chunk` if they are neighbours"""
+    if not _same_page(passage.metadata, chunk.metadata):
+        return None
+    text, other = passage.page_content, chunk.page_content
+    size = _overlap(text, other)
+    if size:
+        return text + other[size:]
+    size = _overlap(other, text)
+    if size:
+        return other + text[size:]
+    return None
+
+
+def pack_context(chunks, budget=None):
+    """
+    Passages to send to the LLM, built from `chunks` in relevance order.
+    Repeated chunks are dropped, neighbours of the same page are merged
+    without their shared overlap, into the passage where that costs the
+    fewest tokens. Chunks that don't fit in `budget` tokens are skipped
+    and the next ones tried until the budget is full, so a smaller but
+    less relevant one may still fit.
+    """
+    budget = budget or settings.RAG_CONTEXT_TOKENS
+    passages, used = [], 0
+    for chunk in chunks:
+        if used >= budget:
+            break
+        text = chunk.page_content
+        if any(text in passage.page_content for passage in passages):
+            continue
+
+        # Cheapest way to add the chunk: merged into one of its neighbour
+        # passages, or as a passage of its own when it has none
+        options = []
+        for index, passage in enumerate(passages):
+            merged = _merge(passage, chunk)
+            if merged is not None:
+                cost = count_tokens(merged) - count_tokens(passage.page_content)
+                options.append((cost, index, merged))
+        if not options:
+            options.append((count_tokens(text), None, None))
+        cost, index, merged = min(options, key=lambda option: option[0])
+        if used + cost > budget:
+            continue
+
+        if index is None:
+            passages.append(chunk)
+        else:
+            passages[index] = Chunk(
+                page_content=merged, metadata=passages[index].metadata
+            )
+        used += cost
+    return passages
+
+
+def trim_history(chat_history, budget=None):
+    """
+    System messages and the most recent turns of `chat_history` that fit
+    in `budget` tokens, in their original order
+    """
+    budget = budget or settings.CHAT_HISTORY_TOKENS
+    system = [m for m in chat_history if m["role"] == "system"]
+    used = sum(count_tokens(m["content"]) for m in system)
+
+    kept = []
+    for message in reversed(chat_history):
+        if message["role"] == "system":
+            continue
+        used += count_tokens(message["content"])
+        if used > budget:
+            break
+        kept.append(message)
+    return system + kept[::-1]
@@ -0,0 +1,155 @@
+"""
+Gateway to the Ollama server.
+LLM clients are created once per model and process so their HTTP
+connections are pooled, every request carries the model's keep_alive, and
+the configured models can be loaded ahead of the first question.
+Receivers of `model_loaded` and `model_evicted` are told when a model
+enters or leaves the server's memory.
+"""
+import logging
+import threading
+
+import httpx
+from django.conf import settings
+from django.dispatch import Signal
+from langchain_ollama.llms import OllamaLLM
+
+log = logging.getLogger(__name__)
+
+# Sent with the Ollama base url as sender and `model`, plus `load_duration`
+# in seconds for model_loaded
+model_loaded = Signal()
+model_evicted = Signal()
+
+# Clients keyed by (base url, model), shared by every request
+_llms = {}
+_http = {}
+_lock = threading.Lock()
+# Models known to be loaded on the server, keyed by base url
+_loaded = {}
+
+
+def keep_alive_for(model):
+    """How long Ollama keeps `model` in memory after a request"""
+    return settings.OLLAMA_MODEL_KEEP_ALIVE.get(model, settings.OLLAMA_DEFAULT_KEEP_ALIVE)
+
+
+def client_kwargs():
+    """httpx options of the pooled connections to Ollama"""
+    return {
+        "timeout": settings.OLLAMA_TIMEOUT,
+        "limits": httpx.Limits(
+            max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS,
+        ),
+    }
+
+
+def get_llm(model=None):
+    """Return the shared LLM client for `model`, CHAT_MODEL by default"""
+    model = model or settings.CHAT_MODEL
+    key = (settings.OLLAMA_BASE_URL, model)
+    llm = _llms.get(key)
+    if llm is not None:
+        return llm
+
+    with _lock:
+        llm = _llms.get(key)
+        if llm is None:
+            llm = OllamaLLM(
+                model=model,
+                base_url=settings.OLLAMA_BASE_URL,
+                keep_alive=keep_alive_for(model),
+                client_kwargs=client_kwargs()
+            )
+            _llms[key] = llm
+    return llm
+
+
+def get_http():
+    """Pooled HTTP client for the Ollama management calls"""
+    base_url = settings.OLLAMA_BASE_URL
+    with _lock:
+        client = _http.get(base_url)
+        if client is None:
+            client = httpx.Client(base_url=base_url, **client_kwargs())
+            _http[base_url] = client
+    return client
+
+
+def _update_loaded(current):
+    """Record the models now loaded and send the load/eviction events"""
+    base_url = settings.OLLAMA_BASE_URL
+    with _lock:
+        previous = _loaded.get(base_url, set())
+        _loaded[base_url] = set(current)
+    for model in sorted(previous - set(current)):
+        log.info(f"Ollama evicted {model}")
+        model_evicted.send(sender=base_url, model=model)
+    return set(current) - previous
+
+
+def warm_model(model):
+    """Load `model` on the server, an empty prompt only loads it"""
+    response = get_http().post(
+        "/api/generate",
+        json={"model": model, "keep_alive": keep_alive_for(model)}
+    )
+    response.raise_for_status()
+    load_duration = response.json().get("load_duration", 0) / 1e9
+
+    base_url = settings.OLLAMA_BASE_URL
+    with _lock:
+        loaded = _loaded.setdefault(base_url, set())
+        is_new = model not in loaded
+        loaded.add(model)
+    if is_new:
+        log.info(f"Ollama loaded {model} in {load_duration:.1f}s")
+        model_loaded.send(sender=base_url, model=model, load_duration=load_duration)
+
+
+def warm_models(models=None):
+    """Load the configured models, failures are logged and skipped"""
+    for model in models or settings.OLLAMA_WARM_MODELS:
+        try:
+            warm_model(model)
+        except httpx.HTTPError:
+            log.warning(f"Could not warm Ollama model {model}", exc_info=True)
+
+
+def warm_models_in_background():
+    """Warm the models without holding up the process start"""
+    if settings.OLLAMA_WARM_MODELS:
+        threading.Thread(target=warm_models, name="ollama-warm", daemon=True).start()
+
+
+def refresh_loaded_models():
+    """
+    Ask the server which models are loaded and send an event for every
+    model loaded or evicted since the last check
+    """
+    response = get_http().get("/api/ps")
+    response.raise_for_status()
+    current = {model["name"] for model in response.json().get("models", [])}
+    for model in sorted(_update_loaded(current)):
+        log.info(f"Ollama loaded {model}")
+        model_loaded.send(
+            sender=settings.OLLAMA_BASE_URL, model=model, load_duration=None
+        )
+    return current
+
+
+def maintain_warm_pool():
+    """Load again the configured models the server evicted"""
+    current = refresh_loaded_models()
+    warm_models([m for m in settings.OLLAMA_WARM_MODELS if m not in current])
+
+
+def close_clients():
+    """Close the pooled connections, for worker shutdown and tests"""
+    with _lock:
+        for client in _http.values():
+            client.close()
+        _http.clear()
+        _llms.clear()
+        _loaded.clear()
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0001_initial"),
+        ("project", "0006_documentupload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnswerCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "question",
+                    models.TextField(help_text="Condensed, standalone question"),
+                ),
+                (
+                    "model_name",
+                    models.CharField(
+                        help_text="Embedding model that produced the vector",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "vector",
+                    models.BinaryField(help_text="float32 embedding of the question"),
+                ),
+                ("answer", models.TextField()),
+                (
+                    "hits",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Number of times the answer was reused"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "last_used_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text="Last time the answer was stored or reused",
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        help_text="Project the answer was generated from",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="answer_cache_entries",
+                        to="project.project",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["project", "model_name"],
+                        name="chat_answer_project_c4009a_idx",
+                    )
+                ],
+            },
+        ),
+    ]
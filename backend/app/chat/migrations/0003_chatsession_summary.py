@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0002_answercacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="summary",
+            field=models.TextField(
+                blank=True, help_text="Rolling summary of the older messages"
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="summary_last_message",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Last message folded into the summary",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="chat.chatmessage",
+            ),
+        ),
+    ]
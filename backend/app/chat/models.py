@@ -10,10 +10,23 @@ class ChatSession(models.Model):
     """
     title = models.CharField(max_length=255)
     project = models.ForeignKey(
-        'Project', 
+        'project.Project', 
         on_delete=models.CASCADE,
+        related_name="chat_sessions",
         help_text="The associated project"
     )
+    summary = models.TextField(
+        blank=True,
+        help_text="Rolling summary of the older messages"
+    )
+    summary_last_message = models.ForeignKey(
+        'ChatMessage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        help_text="Last message folded into the summary"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -21,7 +34,17 @@ class ChatSession(models.Model):
         # On first save, if no tile, got ot a default
         if not self.pk and not self.title:
             self.title = f"New chat {timezone.now():%Y-%m-%d %H:%M}"
-            super().save(*args, **kwargs)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.title
+
+    def unsummarized_messages(self):
+        """User and assistant messages not folded into the summary, oldest first"""
+        messages = self.messages.exclude(role=ChatMessage.ChatRoles.SYSTEM)
+        if self.summary_last_message_id:
+            messages = messages.filter(pk__gt=self.summary_last_message_id)
+        return messages
 
 
 class ChatMessage(models.Model):
@@ -33,11 +56,55 @@ class ChatMessage(models.Model):
         USER = ("user", "User")
         ASSISTANT = ("assistant", "Assistant")
     
-    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE)
+    session = models.ForeignKey(
+        ChatSession,
+        on_delete=models.CASCADE,
+        related_name="messages"
+    )
     role = models.CharField(choices=ChatRoles, max_length=20)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ["created_at"]
-        
\ No newline at end of file
+        ordering = ["created_at", "id"]
+
+
+class AnswerCacheEntry(models.Model):
+    """
+    Answer to a standalone question about a project, reused for
+    questions with a similar embedding
+    """
+    project = models.ForeignKey(
+        'project.Project',
+        on_delete=models.CASCADE,
+        related_name="answer_cache_entries",
+        help_text="Project the answer was generated from"
+    )
+    question = models.TextField(
+        help_text="Condensed, standalone question"
+    )
+    model_name = models.CharField(
+        max_length=255,
+        help_text="Embedding model that produced the vector"
+    )
+    vector = models.BinaryField(
+        help_text="float32 embedding of the question"
+    )
+    answer = models.TextField()
+    hits = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of times the answer was reused"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Last time the answer was stored or reused"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'model_name'])
+        ]
+
+    def __str__(self):
+        return self.question
@@ -0,0 +1,304 @@
+"""
+Retrieval augmented generation over a project's documents
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from langchain.chains import create_retrieval_chain
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+
+from project.models import Project
+from project.utils.vector_store import get_project_store
+from project.utils.retrieval_cache import CachedRetriever
+from chat import answer_cache, rerank
+from chat import llm as gateway
+from chat.context import pack_context, trim_history
+
+log = logging.getLogger(__name__)
+
+_retrieval_executor = None
+_retrieval_executor_lock = threading.Lock()
+
+CONTEXTUALIZE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "Given the chat history and the latest user question, which might "
+     "reference context in the chat history, rewrite it as a standalone "
+     "question. Do NOT answer it, only reformulate it if needed."),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "You are an assistant answering questions about the project's "
+     "documents. Use the following retrieved context to answer. If you "
+     "don't know the answer, say that you don't know.\n\n{context}"),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+
+def get_llm():
+    """LLM used to answer chat questions"""
+    return gateway.get_llm(settings.CHAT_MODEL)
+
+
+def get_collection_project(collection_name):
+    """Project owning `collection_name`, None before anything is indexed"""
+    if not collection_name:
+        return None
+    return Project.objects.filter(chroma_collection=collection_name).first()
+
+
+def scope_filter(project, scope, store=None):
+    """
+    Chroma `where` filter limiting retrieval to a scope of the project:
+    `document_ids` and an `uploaded_after`/`uploaded_before` range.
+    With the project's `store`, chunks the documents in scope share with
+    documents out of it, stored once under the first one, match as well.
+    """
+    conditions = []
+    documents = project.documents.all()
+    document_ids = scope.get("document_ids")
+    if document_ids:
+        documents = documents.filter(pk__in=document_ids)
+        ids = list(documents.values_list("pk", flat=True).order_by("pk"))
+        # Unknown documents must match nothing rather than everything
+        conditions.append({"document_id": {"$in": ids or [0]}})
+    if scope.get("uploaded_after"):
+        documents = documents.filter(created_at__gte=scope["uploaded_after"])
+        conditions.append(
+            {"uploaded_at": {"$gte": int(scope["uploaded_after"].timestamp())}}
+        )
+    if scope.get("uploaded_before"):
+        documents = documents.filter(created_at__lte=scope["uploaded_before"])
+        conditions.append(
+            {"uploaded_at": {"$lte": int(scope["uploaded_before"].timestamp())}}
+        )
+
+    if not conditions:
+        return None
+    where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+    if store is not None:
+        shared = store.scope_filter(list(documents.values_list("pk", flat=True)))
+        if shared is not None:
+            where = {"$or": [where, shared]}
+    return where
+
+
+def get_retriever(collection_name, scope=None):
+    """
+    Retriever over the project owning `collection_name`, limited to
+    `scope` when given. Projects without any indexed document retrieve
+    nothing.
+    """
+    project = get_collection_project(collection_name)
+    if project is None:
+        return RunnableLambda(lambda _: [])
+    store = get_project_store(project)
+    retriever = CachedRetriever(
+        vectorstore=store,
+        collection_name=collection_name,
+        collection_version=project.collection_version,
+        k=settings.RERANK_CANDIDATES if rerank.is_enabled() else settings.RAG_TOP_K,
+        filters=scope_filter(project, scope, store) if scope else None
+    )
+    if not rerank.is_enabled():
+        return retriever
+    return RunnableLambda(
+        lambda query: rerank.rerank(
+            query, retriever.invoke(query), settings.RAG_TOP_K
+        )
+    )
+
+
+def get_retrieval_executor():
+    """
+    Thread pool running the vector searches of the async chat path.
+    Searches are blocking, the pool bounds how many run at once so many
+    open chat streams don't pile up threads on the event loop's executor.
+    """
+    global _retrieval_executor
+    with _retrieval_executor_lock:
+        if _retrieval_executor is None:
+            _retrieval_executor = ThreadPoolExecutor(
+                max_workers=settings.CHAT_RETRIEVAL_THREADS,
+                thread_name_prefix="chat-retrieval"
+            )
+    return _retrieval_executor
+
+
+def bounded_retriever(retriever):
+    """Wrap `retriever` so awaiting it searches in the retrieval pool"""
+    async def aretrieve(query):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_retrieval_executor(), retriever.invoke, query
+        )
+    return RunnableLambda(retriever.invoke, afunc=aretrieve)
+
+
+def build_rag_chain(collection_name, retriever=None, llm=None, scope=None):
+    """
+    Retrieval chain answering a standalone question from the project
+    documents, the question is condensed from the history beforehand
+    """
+    llm = llm or get_llm()
+    if retriever is None:
+        retriever = get_retriever(collection_name, scope=scope)
+    search = (
+        RunnableLambda(lambda inputs: inputs["input"])
+        | retriever
+        | RunnableLambda(pack_context)
+    )
+    qa_chain = create_stuff_documents_chain(llm, QA_PROMPT)
+    return create_retrieval_chain(search, qa_chain)
+
+
+def _split_query(chat_history, query):
+    """The question and the history before it, given as role/content dicts"""
+    if query is None:
+        query = chat_history[-1]["content"]
+        chat_history = chat_history[:-1]
+    return query, chat_history
+
+
+def _has_turns(chat_history):
+    return any(message["role"] != "system" for message in chat_history)
+
+
+def condense_question(llm, query, chat_history):
+    """
+    Rewrite `query` as a question that stands on its own without the chat
+    history. First questions are already standalone and skip the LLM.
+    """
+    if not _has_turns(chat_history):
+        return query
+    chain = CONTEXTUALIZE_PROMPT | llm | StrOutputParser()
+    return chain.invoke({"input": query, "chat_history": chat_history})
+
+
+async def acondense_question(llm, query, chat_history):
+    """Async version of condense_question"""
+    if not _has_turns(chat_history):
+        return query
+    chain = CONTEXTUALIZE_PROMPT | llm | StrOutputParser()
+    return await chain.ainvoke({"input": query, "chat_history": chat_history})
+
+
+def lookup_answer(collection_name, question, scope=None):
+    """
+    Cached answer of the collection's project for `question`.
+    Returns (answer, project, vector), the last two are needed to store the
+    answer on a miss and are None when the cache doesn't apply.
+    Answers are only cached for questions about the whole project.
+    """
+    if scope:
+        return None, None, None
+    project = get_collection_project(collection_name)
+    if project is None or not answer_cache.is_enabled():
+        return None, None, None
+    answer, vector = answer_cache.lookup_answer(project, question)
+    return answer, project, vector
+
+
+def store_answer(project, question, answer, vector):
+    if project is not None and answer:
+        answer_cache.store_answer(project, question, answer, vector)
+
+
+def run_rag_and_llm(collection_name, chat_history, query=None, scope=None):
+    """
+    Answer `query` from the documents of the collection's project.
+    When `query` is None the last message of `chat_history` is the
+    question. `scope` limits the documents searched, see scope_filter.
+    Returns the answer text.
+    """
+    query, chat_history = _split_query(chat_history, query)
+    chat_history = trim_history(chat_history)
+    llm = get_llm()
+    question = condense_question(llm, query, chat_history)
+    answer, project, vector = lookup_answer(collection_name, question, scope)
+    if answer is not None:
+        return answer
+
+    chain = build_rag_chain(collection_name, llm=llm, scope=scope)
+    result = chain.invoke({
+        "input": question,
+        "chat_history": chat_history,
+    })
+    store_answer(project, question, result["answer"], vector)
+    return result["answer"]
+
+
+def stream_rag_and_llm(collection_name, chat_history, query=None, scope=None):
+    """
+    Same as run_rag_and_llm but yields the answer token by token as the
+    LLM generates it, right after retrieval.
+    """
+    query, chat_history = _split_query(chat_history, query)
+    chat_history = trim_history(chat_history)
+    llm = get_llm()
+    question = condense_question(llm, query, chat_history)
+    answer, project, vector = lookup_answer(collection_name, question, scope)
+    if answer is not None:
+        yield answer
+        return
+
+    chain = build_rag_chain(collection_name, llm=llm, scope=scope)
+    tokens = []
+    for chunk in chain.stream({
+        "input": question,
+        "chat_history": chat_history,
+    }):
+        token = chunk.get("answer")
+        if token:
+            tokens.append(token)
+            yield token
+    store_answer(project, question, "".join(tokens), vector)
+
+
+async def astream_rag_and_llm(collection_name, chat_history, query=None,
+                              scope=None):
+    """
+    Async version of stream_rag_and_llm for the ASGI chat views.
+    The LLM is called through Ollama's async client and the vector search
+    runs in the bounded retrieval pool, the event loop is never blocked.
+    """
+    query, chat_history = _split_query(chat_history, query)
+    chat_history = trim_history(chat_history)
+    llm = get_llm()
+    question = await acondense_question(llm, query, chat_history)
+    # Embedding the question and the cache lookup are blocking
+    answer, project, vector = await sync_to_async(lookup_answer)(
+        collection_name, question, scope
+    )
+    if answer is not None:
+        yield answer
+        return
+
+    # Looks up the project and opens its store, both blocking
+    retriever = await sync_to_async(get_retriever)(collection_name, scope=scope)
+    chain = build_rag_chain(collection_name, bounded_retriever(retriever), llm)
+    tokens = []
+    async for chunk in chain.astream({
+        "input": question,
+        "chat_history": chat_history,
+    }):
+        token = chunk.get("answer")
+        if token:
+            tokens.append(token)
+            yield token
+    await sync_to_async(store_answer)(project, question, "".join(tokens), vector)
+
+
+def get_sources(result):
+    """Source files of the documents a chain result was built from"""
+    return [doc.metadata.get("source") for doc in result.get("context", [])]
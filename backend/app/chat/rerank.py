@@ -0,0 +1,92 @@
+"""
+Optional cross-encoder reranking of the retrieved chunks.
+Retrieval returns a wide set of candidates, the cross-encoder scores each
+(question, chunk) pair and only the best ones are sent to the LLM.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+# Loaded cross-encoders keyed by model name, shared by every request
+_models = {}
+_lock = threading.Lock()
+
+
+def is_enabled():
+    return bool(settings.RERANK_MODEL_NAME)
+
+
+def get_reranker(model_name=None):
+    """Return the shared cross-encoder, loading it on first use"""
+    model_name = model_name or settings.RERANK_MODEL_NAME
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(model_name)
+        if model is None:
+            from sentence_transformers import CrossEncoder
+
+            log.info(f"Loading rerank model {model_name}")
+            model = CrossEncoder(model_name, device="cpu")
+            _models[model_name] = model
+    return model
+
+
+def warm_reranker():
+    """Load the configured cross-encoder, failures are logged"""
+    try:
+        get_reranker()
+    except Exception:
+        log.warning(
+            f"Could not load rerank model {settings.RERANK_MODEL_NAME}",
+            exc_info=True
+        )
+
+
+def warm_reranker_in_background():
+    """Load the cross-encoder without holding up the process start"""
+    if is_enabled():
+        threading.Thread(target=warm_reranker, name="rerank-warm", daemon=True).start()
+
+
+def rerank(query, chunks, top_n, budget=None):
+    """
+    Best `top_n` of `chunks` for `query` by cross-encoder score.
+    Chunks are scored in batches of RERANK_BATCH_SIZE. A batch is only
+    started when, at the pace of the batches before it, it ends within the
+    `budget` seconds (RERANK_TIME_BUDGET). Otherwise the remaining work is
+    dropped and the retrieval order is kept, a slow rerank costs about the
+    budget at most.
+    """
+    if len(chunks) <= 1:
+        return chunks[:top_n]
+    budget = settings.RERANK_TIME_BUDGET if budget is None else budget
+    model = get_reranker()
+
+    started = time.monotonic()
+    scores = []
+    batch_size = settings.RERANK_BATCH_SIZE
+    for batches, start in enumerate(range(0, len(chunks), batch_size)):
+        elapsed = time.monotonic() - started
+        if elapsed + (elapsed / batches if batches else 0) > budget:
+            log.warning(
+                f"Rerank of {len(chunks)} chunks over its {budget}s budget, "
+                "keeping the retrieval order"
+            )
+            return chunks[:top_n]
+        batch = chunks[start:start + batch_size]
+        scores.extend(model.predict(
+            [(query, chunk.page_content) for chunk in batch],
+            batch_size=batch_size
+        ))
+
+    ranked = sorted(
+        range(len(chunks)), key=lambda index: scores[index], reverse=True
+    )
+    return [chunks[index] for index in ranked[:top_n]]
@@ -0,0 +1,62 @@
+"""
+Serializers for the Chat API views
+"""
+from rest_framework import serializers
+from .models import (
+    ChatSession,
+    ChatMessage
+)
+
+
+class ChatSessionSerializer(serializers.ModelSerializer):
+    """Serializer for chat sessions"""
+    class Meta:
+        model = ChatSession
+        fields = ['id', 'title', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
+        extra_kwargs = {'title': {'required': False}}
+
+
+class ChatSessionRenameSerializer(serializers.ModelSerializer):
+    """Serializer for renaming a chat session"""
+    class Meta:
+        model = ChatSession
+        fields = ['id', 'title']
+        read_only_fields = ['id']
+
+
+class ChatScopeSerializer(serializers.Serializer):
+    """Documents of the project a question is answered from"""
+    document_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False
+    )
+    uploaded_after = serializers.DateTimeField(required=False)
+    uploaded_before = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        after = attrs.get('uploaded_after')
+        before = attrs.get('uploaded_before')
+        if after and before and after > before:
+            raise serializers.ValidationError(
+                "uploaded_after must be before uploaded_before."
+            )
+        return attrs
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the messages of a chat session.
+    A posted message may carry a `scope` limiting retrieval, it is not stored.
+    """
+    scope = ChatScopeSerializer(required=False, write_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'role', 'content', 'created_at', 'scope']
+        read_only_fields = ['id', 'role', 'created_at']
+
+    def create(self, validated_data):
+        validated_data.pop('scope', None)
+        return super().create(validated_data)
@@ -0,0 +1,21 @@
+"""
+Keep the answer cache in sync with the project documents
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from project.models import Document
+from .answer_cache import invalidate_answers
+
+
+@receiver(post_save, sender=Document)
+def invalidate_answers_on_document_saved(sender, instance, created, **kwargs):
+    """New or newly indexed documents can change the answers"""
+    if created or instance.processing_status == Document.ProcessingStatus.COMPLETED:
+        invalidate_answers(instance.project_id)
+
+
+@receiver(post_delete, sender=Document)
+def invalidate_answers_on_document_deleted(sender, instance, **kwargs):
+    """Answers may quote the removed document"""
+    invalidate_answers(instance.project_id)
@@ -0,0 +1,109 @@
+"""
+Background work of the chat sessions
+"""
+import logging
+
+from celery import shared_task
+from celery.signals import (
+    worker_process_init,
+    worker_process_shutdown
+)
+from django.conf import settings
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from . import llm as gateway
+from .context import count_tokens
+from .models import ChatSession
+from .rag import get_llm
+
+log = logging.getLogger(__name__)
+
+
+@worker_process_init.connect
+def warm_worker_llms(**kwargs):
+    """
+    Load the chat models on the Ollama server as the worker starts. In the
+    background: celery kills pool processes whose start takes longer than
+    worker_proc_alive_timeout, and a cold model load takes longer.
+    """
+    gateway.warm_models_in_background()
+
+
+@worker_process_shutdown.connect
+def close_worker_llm_clients(**kwargs):
+    gateway.close_clients()
+
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "Summarize the conversation between a user and an assistant about "
+     "the documents of a project. Extend the existing summary with the new "
+     "messages. Keep the facts, names, numbers and open questions, drop "
+     "greetings and repetition. Answer with the summary only."),
+    ("human",
+     "Existing summary:\n{summary}\n\nNew messages:\n{conversation}"),
+])
+
+
+def history_tokens(history):
+    """Tokens of the user and assistant turns of a role/content history"""
+    return sum(
+        count_tokens(message["content"])
+        for message in history
+        if message["role"] != "system"
+    )
+
+
+def schedule_summary(session_id, history):
+    """Summarize the session in the background once its turns grew too long"""
+    if history_tokens(history) > settings.CHAT_SUMMARY_THRESHOLD_TOKENS:
+        summarize_chat_task.delay(session_id)
+
+
+def summarize_chat(chat):
+    """
+    Fold the older messages of `chat` into its rolling summary, keeping the
+    last CHAT_SUMMARY_KEEP_MESSAGES as they are. Does nothing while the
+    messages after the summary are under the threshold.
+    Returns whether the summary changed.
+    """
+    messages = list(chat.unsummarized_messages())
+    tokens = sum(count_tokens(message.content) for message in messages)
+    keep = settings.CHAT_SUMMARY_KEEP_MESSAGES
+    folded = messages[:-keep] if keep else messages
+    if tokens <= settings.CHAT_SUMMARY_THRESHOLD_TOKENS or not folded:
+        return False
+
+    chain = SUMMARY_PROMPT | get_llm() | StrOutputParser()
+    summary = chain.invoke({
+        "summary": chat.summary or "(none)",
+        "conversation": "\n".join(
+            f"{message.role}: {message.content}" for message in folded
+        ),
+    })
+
+    # Another task may have summarized the chat in the meantime
+    updated = ChatSession.objects.filter(
+        pk=chat.pk,
+        summary_last_message_id=chat.summary_last_message_id
+    ).update(summary=summary.strip(), summary_last_message=folded[-1])
+    if updated:
+        log.info(f"Folded {len(folded)} messages into the summary of chat {chat.id}")
+    return bool(updated)
+
+
+@shared_task(bind=True, acks_late=True)
+def summarize_chat_task(self, session_id: int):
+    """Celery task updating the rolling summary of a chat session"""
+    chat = ChatSession.objects.filter(pk=session_id).first()
+    if chat is None:
+        return False
+    return summarize_chat(chat)
+
+
+@shared_task
+def maintain_llm_pool_task():
+    """Periodic task loading again the warm models Ollama evicted"""
+    if settings.OLLAMA_WARM_MODELS:
+        gateway.maintain_warm_pool()
@@ -0,0 +1,91 @@
+"""
+Minimal stand-in for the Ollama HTTP API, served from a thread so the
+tests exercise the real clients without a model server
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path, None))
+        if self.path == "/api/ps":
+            self.send_json({"models": [
+                {"name": name, "model": name} for name in sorted(self.server.loaded)
+            ]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append(("POST", self.path, payload))
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+
+        model = payload["model"]
+        load_duration = 0 if model in self.server.loaded else 2_000_000_000
+        self.server.loaded.add(model)
+        done = {
+            "model": model,
+            "created_at": "2024-01-01T00:00:00Z",
+            "response": "",
+            "done": True,
+            "done_reason": "load" if not payload.get("prompt") else "stop",
+            "load_duration": load_duration,
+        }
+        if not payload.get("prompt") or not payload.get("stream", True):
+            done["response"] = "" if not payload.get("prompt") else self.server.reply
+            self.send_json(done)
+            return
+
+        # Streamed generation, one JSON object per line
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for token in self.server.reply.split(" "):
+            part = dict(done, response=token + " ", done=False)
+            self.wfile.write(json.dumps(part).encode() + b"\n")
+        self.wfile.write(json.dumps(done).encode() + b"\n")
+
+
+class OllamaStub:
+    """Context manager running the stub on a free local port"""
+
+    def __init__(self, reply="Hello from the stub"):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), OllamaStubHandler)
+        self.server.requests = []
+        self.server.loaded = set()
+        self.server.reply = reply
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def loaded(self):
+        return self.server.loaded
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,204 @@
+"""
+Tests for the semantic answer cache
+"""
+from unittest.mock import patch
+import shutil
+import tempfile
+import numpy as np
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from project.models import Project, Document
+from chat.models import AnswerCacheEntry
+from chat.answer_cache import (
+    lookup_answer,
+    store_answer,
+    get_cache_stats,
+    reset_cache_stats,
+    stats,
+)
+
+User = get_user_model()
+
+# Fake embeddings, questions mentioning cats point one way, others another
+VECTORS = {
+    "cats": [1.0, 0.0, 0.0],
+    "cat": [0.99, 0.14, 0.0],
+    "dogs": [0.0, 1.0, 0.0],
+}
+
+
+def fake_embedding(question):
+    return VECTORS[question.split()[-1].strip("?").lower()]
+
+
+@override_settings(ANSWER_CACHE_SIMILARITY=0.95, ANSWER_CACHE_MAX_ENTRIES=2)
+@patch("chat.answer_cache.get_embedding_model")
+class AnswerCacheTests(TestCase):
+    """Test answers are reused for similar questions of the same project"""
+
+    def setUp(self):
+        reset_cache_stats()
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            password="pass12345"
+        )
+        self.project = Project.objects.create(
+            name="Test",
+            description="description",
+            user=self.user,
+            chroma_collection="proj_1_1"
+        )
+
+    def answer(self, question, answer):
+        """Look the question up and store `answer` on a miss"""
+        cached, vector = lookup_answer(self.project, question)
+        if cached is None:
+            store_answer(self.project, question, answer, vector)
+        return cached
+
+    def test_similar_question_hits(self, mock_model):
+        """A question above the similarity threshold reuses the answer"""
+        mock_model.return_value.embed_query.side_effect = fake_embedding
+        self.answer("What about cats?", "Cats purr")
+
+        cached = self.answer("Tell me about a cat?", "Other answer")
+
+        self.assertEqual(cached, "Cats purr")
+        self.assertEqual(AnswerCacheEntry.objects.get().hits, 1)
+        stats = get_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_different_question_misses(self, mock_model):
+        """Unrelated questions are answered again"""
+        mock_model.return_value.embed_query.side_effect = fake_embedding
+        self.answer("What about cats?", "Cats purr")
+
+        cached = self.answer("What about dogs?", "Dogs bark")
+
+        self.assertIsNone(cached)
+        self.assertEqual(AnswerCacheEntry.objects.count(), 2)
+
+    def test_cache_is_per_project(self, mock_model):
+        """Answers of another project are never reused"""
+        mock_model.return_value.embed_query.side_effect = fake_embedding
+        other = Project.objects.create(name="Other", user=self.user)
+        self.answer("What about cats?", "Cats purr")
+
+        cached, _ = lookup_answer(other, "What about cats?")
+
+        self.assertIsNone(cached)
+
+    def test_least_recently_used_entries_evicted(self, mock_model):
+        """Only ANSWER_CACHE_MAX_ENTRIES answers are kept per project"""
+        for question in ["a", "bb", "ccc"]:
+            store_answer(self.project, question, question, np.zeros(3))
+
+        self.assertEqual(
+            sorted(AnswerCacheEntry.objects.values_list("question", flat=True)),
+            ["bb", "ccc"]
+        )
+
+
+class AnswerCacheInvalidationTests(TestCase):
+    """Test cached answers are dropped when the project documents change"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            password="pass12345"
+        )
+        self.project = Project.objects.create(
+            name="Test",
+            description="description",
+            user=self.user
+        )
+        self.entry = AnswerCacheEntry.objects.create(
+            project=self.project,
+            question="What about cats?",
+            model_name="test/model",
+            vector=b"\0" * 12,
+            answer="Cats purr"
+        )
+        self.other_entry = AnswerCacheEntry.objects.create(
+            project=Project.objects.create(name="Other", user=self.user),
+            question="What about cats?",
+            model_name="test/model",
+            vector=b"\0" * 12,
+            answer="Cats purr"
+        )
+
+    def create_document(self):
+        return Document.objects.create(
+            name="doc.txt",
+            project=self.project,
+            file="documents/doc.txt",
+            file_size=7,
+            content_type="text/plain",
+            uploaded_by=self.user
+        )
+
+    def test_added_document_invalidates(self):
+        self.create_document()
+
+        self.assertFalse(AnswerCacheEntry.objects.filter(pk=self.entry.pk).exists())
+        self.assertTrue(AnswerCacheEntry.objects.filter(pk=self.other_entry.pk).exists())
+
+    def test_indexed_document_invalidates(self):
+        doc = self.create_document()
+        entry = AnswerCacheEntry.objects.create(
+            project=self.project,
+            question="Stale",
+            model_name="test/model",
+            vector=b"\0" * 12,
+            answer="Stale"
+        )
+
+        doc.processing_status = Document.ProcessingStatus.COMPLETED
+        doc.save(update_fields=["processing_status"])
+
+        self.assertFalse(AnswerCacheEntry.objects.filter(pk=entry.pk).exists())
+
+    def test_removed_document_invalidates(self):
+        doc = self.create_document()
+        entry = AnswerCacheEntry.objects.create(
+            project=self.project,
+            question="Stale",
+            model_name="test/model",
+            vector=b"\0" * 12,
+            answer="Stale"
+        )
+
+        doc.delete()
+
+        self.assertFalse(AnswerCacheEntry.objects.filter(pk=entry.pk).exists())
+
+    def test_answer_cache_stats_endpoint(self):
+        """The project's counted lookups are exposed through the chat API"""
+        reset_cache_stats()
+        stats.record(scope=self.project.id, hits=3, misses=1)
+        stats.record(scope=self.other_entry.project_id, misses=5)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        res = client.get(
+            reverse("chat:chat-answer-cache", args=[self.project.id])
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            "entries": 1,
+            "hits": 3,
+            "misses": 1,
+            "hit_rate": 0.75,
+        })
@@ -2,14 +2,17 @@
 Tests for the Chat session API endpoints
 """
 from unittest.mock import patch, ANY
-from django.test import TestCase
+from django.test import TestCase, AsyncClient
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
 from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
 from rest_framework import status
 
 from project.models import Project
+from chat.models import ChatSession, ChatMessage
+from chat.serializers import ChatSessionSerializer, ChatMessageSerializer
 
 User = get_user_model()
 
@@ -32,6 +35,12 @@ def get_chat_messages_url(project_id, chat_id):
         args=[project_id, chat_id]
     )
 
+def get_chat_stream_url(project_id, chat_id):
+    return reverse(
+        "chat:chat-stream",
+        args=[project_id, chat_id]
+    )
+
 def get_chat_session_rename_url(project_id,chat_id):
      return reverse(
         "chat:chat-rename",
@@ -142,7 +151,7 @@ class PrivateChatApiTests(TestCase):
         res = self.client.get(url)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
-        chatSession = chatSession.objects.get(pk=res.data['id'])
+        chatSession = ChatSession.objects.get(pk=res.data['id'])
         serializer = ChatSessionSerializer(chatSession)
 
         self.assertEqual(res.data, serializer.data)
@@ -152,15 +161,15 @@ class PrivateChatApiTests(TestCase):
             title="Test chat session",
             project=self.project
         )
-        ChatMessage.objects.bulk_create([
+        system_message, user_message = ChatMessage.objects.bulk_create([
             ChatMessage(
                 session=chat,
-                role=ChatMessage.SESSION_ROLES.SYSTEM,
+                role=ChatMessage.ChatRoles.SYSTEM,
                 content="You are a useful assitant that helps answering questions."
             ),
             ChatMessage(
                 session=chat,
-                role=ChatMessage.SESSION_ROLES.USER,
+                role=ChatMessage.ChatRoles.USER,
                 content="Which is the largest building in the world?"
             )
         ])
@@ -168,7 +177,7 @@ class PrivateChatApiTests(TestCase):
         url = get_chat_messages_url(self.project.id, chat.id)
         res = self.client.get(url)
 
-        messages = ChatMessages.objects.filter(session=chat).order_by('created_at')
+        messages = ChatMessage.objects.filter(session=chat).order_by('created_at')
         serializer = ChatMessageSerializer(messages, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -177,7 +186,7 @@ class PrivateChatApiTests(TestCase):
         self.assertEqual(len(res.data), 2)
         self.assertEqual(res.data[0]['id'], system_message.id)
         self.assertEqual(res.data[1]['id'], user_message.id)
-        self.assertEqual(res.data[0]['role'], ChatMessage.SESSION_ROLES.SYSTEM)
+        self.assertEqual(res.data[0]['role'], ChatMessage.ChatRoles.SYSTEM)
 
     @patch("chat.rag.run_rag_and_llm")
     def test_user_and_assistant_messages_are_persisted_and_returned(self, mock_run_rag):
@@ -187,7 +196,7 @@ class PrivateChatApiTests(TestCase):
             project=self.project
         )
         payload = {
-            "content":"Hello AI",
+            "content":"Hello, AI!",
         }
         url = get_chat_messages_url(self.project.id, chat.id)
         res = self.client.post(url, payload)
@@ -209,8 +218,51 @@ class PrivateChatApiTests(TestCase):
             [
                 {"role": "system","content": "You are a helpful assistant."},
                 {"role": "user","content": "Hello, AI!"}
-            ]
+            ],
+            scope=None
+        )
+
+    @patch("chat.rag.run_rag_and_llm")
+    def test_message_scope_passed_to_retrieval(self, mock_run_rag):
+        """A posted scope limits retrieval and is not stored"""
+        mock_run_rag.return_value = "AI's reply"
+        chat = ChatSession.objects.create(
+            title="Test chat session",
+            project=self.project
+        )
+        payload = {
+            "content": "Hello, AI!",
+            "scope": {
+                "document_ids": [1, 2],
+                "uploaded_after": "2024-01-01T00:00:00Z",
+            }
+        }
+        url = get_chat_messages_url(self.project.id, chat.id)
+        res = self.client.post(url, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("scope", res.data[0])
+        scope = mock_run_rag.call_args.kwargs["scope"]
+        self.assertEqual(scope["document_ids"], [1, 2])
+        self.assertEqual(scope["uploaded_after"].year, 2024)
+
+    def test_invalid_scope_rejected(self):
+        chat = ChatSession.objects.create(
+            title="Test chat session",
+            project=self.project
         )
+        payload = {
+            "content": "Hello, AI!",
+            "scope": {
+                "uploaded_after": "2024-02-01T00:00:00Z",
+                "uploaded_before": "2024-01-01T00:00:00Z",
+            }
+        }
+        url = get_chat_messages_url(self.project.id, chat.id)
+        res = self.client.post(url, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(chat.messages.exists())
 
     def test_delete_chat_session(self):
         """
@@ -235,12 +287,12 @@ class PrivateChatApiTests(TestCase):
         ChatMessage.objects.bulk_create([
             ChatMessage(
                 session=chat,
-                role=ChatMessage.SESSION_ROLES.SYSTEM,
+                role=ChatMessage.ChatRoles.SYSTEM,
                 content="You are a useful assitant that helps answering questions."
             ),
             ChatMessage(
                 session=chat,
-                role=ChatMessage.SESSION_ROLES.USER,
+                role=ChatMessage.ChatRoles.USER,
                 content="Which is the largest building in the world?"
             )
         ])
@@ -267,4 +319,109 @@ class PrivateChatApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(chat.title, payload['title'])
         
-    
\ No newline at end of file
+    
+
+async def stream_answer(content, url, token=None):
+    """Post to the async stream view and return the response and its body"""
+    client = AsyncClient()
+    headers = {"Authorization": f"Token {token.key}"} if token else {}
+    res = await client.post(
+        url,
+        {"content": content},
+        content_type="application/json",
+        headers=headers
+    )
+    if not res.streaming:
+        return res, res.content.decode()
+    body = [chunk async for chunk in res.streaming_content]
+    return res, b"".join(body).decode()
+
+
+async def fake_tokens(*tokens):
+    for token in tokens:
+        yield token
+
+
+class ChatStreamApiTests(TestCase):
+    """Tests for the async SSE chat view"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            password="pass12345"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.project = Project.objects.create(
+            name="Test",
+            description="description",
+            user=self.user
+        )
+        self.chat = ChatSession.objects.create(
+            title="Test chat session",
+            project=self.project
+        )
+        self.url = get_chat_stream_url(self.project.id, self.chat.id)
+
+    @patch("chat.rag.astream_rag_and_llm")
+    async def test_stream_answer_as_server_sent_events(self, mock_stream_rag):
+        """Tokens are streamed as SSE and the full answer is stored"""
+        mock_stream_rag.return_value = fake_tokens("AI's ", "reply")
+
+        res, body = await stream_answer("Hello, AI!", self.url, self.token)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        self.assertIn('data: {"token": "AI\'s "}\n\n', body)
+        self.assertIn('data: {"token": "reply"}\n\n', body)
+        self.assertIn('event: done\n', body)
+        messages = [
+            (m.role, m.content)
+            async for m in ChatMessage.objects.filter(session=self.chat)
+        ]
+        self.assertEqual(
+            messages,
+            [("user", "Hello, AI!"), ("assistant", "AI's reply")]
+        )
+        mock_stream_rag.assert_called_once_with(
+            self.project.chroma_collection,
+            [
+                {"role": "system","content": "You are a helpful assistant."},
+                {"role": "user","content": "Hello, AI!"}
+            ],
+            scope=None
+        )
+
+    @patch("chat.rag.astream_rag_and_llm")
+    async def test_stream_error_sends_error_event(self, mock_stream_rag):
+        """A failing model ends the stream with an error event"""
+        mock_stream_rag.side_effect = Exception("Ollama unavailable")
+
+        res, body = await stream_answer("Hello, AI!", self.url, self.token)
+
+        self.assertIn('event: error\n', body)
+        self.assertFalse(
+            await self.chat.messages.filter(
+                role=ChatMessage.ChatRoles.ASSISTANT
+            ).aexists()
+        )
+
+    async def test_stream_needs_authentication(self):
+        """Requests without a valid token are rejected"""
+        res, _ = await stream_answer("Hello, AI!", self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_stream_other_users_chat_not_found(self):
+        """Chats of other users' projects can't be streamed"""
+        other = await User.objects.acreate(email="other@example.com")
+        other_token = await Token.objects.acreate(user=other)
+
+        res, _ = await stream_answer("Hello, AI!", self.url, other_token)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_stream_requires_content(self):
+        """An empty message is rejected before calling the model"""
+        res, _ = await stream_answer("", self.url, self.token)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,13 +1,27 @@
 """
 Tests for the RAG workflow
 """
+import threading
 from unittest.mock import patch, MagicMock, ANY
 from django.test import TestCase
-from chat.rag import run_rag_and_llm
+from langchain_core.language_models import FakeListLLM
+from datetime import datetime, timezone
+from django.contrib.auth import get_user_model
+from project.models import Project, Document
+from chat.rag import (
+    scope_filter,
+    run_rag_and_llm,
+    stream_rag_and_llm,
+    astream_rag_and_llm,
+    bounded_retriever,
+    get_sources
+)
 
 
+@patch("chat.rag.get_retriever")
+@patch("chat.rag.get_llm")
 @patch("chat.rag.create_retrieval_chain")
-@patch("chat.rag.create_history_aware_retriever")
+@patch("chat.rag.create_stuff_documents_chain")
 class RagUnitTests(TestCase):
     """
     Class to test RAG functionality when querying chat
@@ -18,28 +32,26 @@ class RagUnitTests(TestCase):
             {"role": "system","content": "You are a helpful assistant."},
         ]
         self.collection_name = "proj_1234_1680000000"
-        self.query =  {"role": "user","content": "What is AI?"}
+        self.query = "What is AI?"
 
 
-    def test_rag_builds_and_invokes_chain(self, mock_hist_retr, mock_create_chain):
+    def test_rag_builds_and_invokes_chain(
+        self, mock_qa_chain, mock_create_chain, mock_get_llm, mock_get_retriever
+    ):
         # Stub out the history-aware retriever
         """
-        Test that the RAG workflow builds a history-aware retriever and a conversational retrieval chain,
+        Test that the RAG workflow builds a conversational retrieval chain,
         and then uses the chain to answer the user's question.
 
         The test verifies:
 
-        - that the history-aware retriever was constructed with the last user question
-        - that the retrieval chain was built from that retriever and a docs-combiner
+        - that the retrieval chain was built from the project retriever and a docs-combiner
         - that the chain was invoked with the correct parameters
         - that the answer returned was exactly what the chain returned
         """
-        dummy_retriever = MagicMock(name="HistoryAwareRetriever")
-        mock_hist_retr.return_value = dummy_retriever
-
         # Stub out the final QA chain and its invoke
         dummy_chain = MagicMock(name="RetrievalChain")
-        dummy_chain.invoke.return_value = {"text":"AI is..."}
+        dummy_chain.invoke.return_value = {"answer":"AI is...", "context": []}
         mock_create_chain.return_value = dummy_chain
 
         # Now import and call the helper under test
@@ -48,49 +60,234 @@ class RagUnitTests(TestCase):
         # It should return exactly what dummy_chain.invoke returned
         self.assertEqual(answer, "AI is...")
 
-        # Verify we constructed the history_aware_retriever with the last user question
-        # We dont know which LLM we passed so ANY is fine
-        mock_hist_retr.assert_called_once_with(
-            ANY, # LLM instance
-            ANY, # Retriever
-            ANY  # Prompt contextualization
-        )
-        # Verify we built the retrieval chain from that retriever and a docs-combiner
+        mock_get_retriever.assert_called_once_with(self.collection_name, scope=None)
+        # Verify we built the retrieval chain from the retriever and a docs-combiner
         mock_create_chain.assert_called_once_with(
-            dummy_retriever, # the patched retriever
-            ANY # the chain we passed in
+            ANY, # the question -> retriever pipe
+            mock_qa_chain.return_value
         )
 
         # Finally assert that invoke() was called with exactly what our helper func does:
-        dummy_chain.invoke.assert_called_once_with(
+        dummy_chain.invoke.assert_called_once_with({
             "input": self.query,
             "chat_history": self.history,
-        )
+        })
+
+    def test_last_message_is_the_question(
+        self, mock_qa_chain, mock_create_chain, mock_get_llm, mock_get_retriever
+    ):
+        """Without an explicit query the last history message is asked"""
+        mock_create_chain.return_value.invoke.return_value = {"answer": "AI is..."}
+        history = self.history + [{"role": "user", "content": self.query}]
+
+        run_rag_and_llm(self.collection_name, history)
+
+        mock_create_chain.return_value.invoke.assert_called_once_with({
+            "input": self.query,
+            "chat_history": self.history,
+        })
+
+    def test_stream_yields_answer_tokens(
+        self, mock_qa_chain, mock_create_chain, mock_get_llm, mock_get_retriever
+    ):
+        """Streaming yields only the answer tokens, as they are generated"""
+        mock_create_chain.return_value.stream.return_value = iter([
+            {"input": self.query},
+            {"context": []},
+            {"answer": "AI "},
+            {"answer": ""},
+            {"answer": "is..."},
+        ])
+
+        tokens = list(stream_rag_and_llm(self.collection_name, self.history, self.query))
+
+        self.assertEqual(tokens, ["AI ", "is..."])
+
+    async def test_astream_yields_answer_tokens(
+        self, mock_qa_chain, mock_create_chain, mock_get_llm, mock_get_retriever
+    ):
+        """The async stream yields the answer tokens of the async chain"""
+        async def chunks():
+            for chunk in [{"context": []}, {"answer": "AI "}, {"answer": "is..."}]:
+                yield chunk
+        mock_create_chain.return_value.astream.return_value = chunks()
+
+        tokens = [
+            token async for token in
+            astream_rag_and_llm(self.collection_name, self.history, self.query)
+        ]
+
+        self.assertEqual(tokens, ["AI ", "is..."])
+        mock_get_retriever.assert_called_once_with(self.collection_name, scope=None)
+
+    async def test_bounded_retriever_runs_in_pool(
+        self, mock_qa_chain, mock_create_chain, mock_get_llm, mock_get_retriever
+    ):
+        """Awaiting the wrapped retriever searches in the retrieval threads"""
+        threads = []
+        retriever = MagicMock()
+        retriever.invoke.side_effect = lambda query: threads.append(
+            threading.current_thread().name
+        ) or [query]
+
+        docs = await bounded_retriever(retriever).ainvoke("What is AI?")
+
+        self.assertEqual(docs, ["What is AI?"])
+        self.assertTrue(threads[0].startswith("chat-retrieval"))
+
+    def test_follow_up_question_is_condensed(
+        self, mock_qa_chain, mock_create_chain, mock_get_llm, mock_get_retriever
+    ):
+        """Questions after the first one are rewritten from the history"""
+        mock_get_llm.return_value = FakeListLLM(responses=["What is AI used for?"])
+        mock_create_chain.return_value.invoke.return_value = {"answer": "Many things"}
+        history = self.history + [
+            {"role": "user", "content": self.query},
+            {"role": "assistant", "content": "AI is..."},
+        ]
 
-    def test_error_handling(self):
+        run_rag_and_llm(self.collection_name, history, "What is it used for?")
+
+        mock_create_chain.return_value.invoke.assert_called_once_with({
+            "input": "What is AI used for?",
+            "chat_history": history,
+        })
+
+    @patch("chat.rag.lookup_answer")
+    def test_cached_answer_skips_the_chain(
+        self, mock_lookup, mock_qa_chain, mock_create_chain, mock_get_llm,
+        mock_get_retriever
+    ):
+        """A cached answer is returned without retrieval or generation"""
+        mock_lookup.return_value = ("AI is...", None, None)
+
+        answer = run_rag_and_llm(self.collection_name, self.history, self.query)
+        tokens = list(stream_rag_and_llm(self.collection_name, self.history, self.query))
+
+        self.assertEqual(answer, "AI is...")
+        self.assertEqual(tokens, ["AI is..."])
+        mock_lookup.assert_called_with(self.collection_name, self.query, None)
+        mock_create_chain.assert_not_called()
+        mock_get_retriever.assert_not_called()
+
+    @patch("chat.rag.store_answer")
+    @patch("chat.rag.lookup_answer")
+    def test_streamed_answer_is_cached(
+        self, mock_lookup, mock_store, mock_qa_chain, mock_create_chain,
+        mock_get_llm, mock_get_retriever
+    ):
+        """On a miss the full streamed answer is stored"""
+        project, vector = MagicMock(), MagicMock()
+        mock_lookup.return_value = (None, project, vector)
+        mock_create_chain.return_value.stream.return_value = iter([
+            {"answer": "AI "}, {"answer": "is..."}
+        ])
+
+        list(stream_rag_and_llm(self.collection_name, self.history, self.query))
+
+        mock_store.assert_called_once_with(project, self.query, "AI is...", vector)
+
+    def test_error_handling(
+        self, mock_qa_chain, mock_create_chain, mock_get_llm, mock_get_retriever
+    ):
         """Test RAG failure scenarios"""
-        with patch("chat.rag.create_history_aware_retriever") as mock_retriever:
-            mock_retriever.side_effect = Exception("Vector store unavailable")
-            
-            with self.assertRaises(Exception) as context:
-                run_rag_and_llm(
-                    collection_name=self.collection_name,
-                    chat_history=self.history,
-                    query=self.query
-                )
-            
-            self.assertIn("Vector store unavailable", str(context.exception))
+        mock_create_chain.return_value.invoke.side_effect = Exception(
+            "Vector store unavailable"
+        )
+
+        with self.assertRaises(Exception) as context:
+            run_rag_and_llm(
+                collection_name=self.collection_name,
+                chat_history=self.history,
+                query=self.query
+            )
+
+        self.assertIn("Vector store unavailable", str(context.exception))
     
-    def test_source_document_handling(self):
+    def test_source_document_handling(
+        self, mock_qa_chain, mock_create_chain, mock_get_llm, mock_get_retriever
+    ):
         """Test proper extraction of source metadata"""
-        with patch("chat.rag.create_retrieval_chain") as mock_chain:
-            mock_chain.return_value.invoke.return_value = {
-                "answer": "Test",
-                "source_documents": [
-                    MagicMock(metadata={"source": "doc1.pdf"}),
-                    MagicMock(metadata={"source": "doc2.pdf"})
-                ]
-            }
-            
-            result = run_rag_and_llm(...)
-            self.assertEqual(result["sources"], ["doc1.pdf", "doc2.pdf"])
\ No newline at end of file
+        result = {
+            "answer": "Test",
+            "context": [
+                MagicMock(metadata={"source": "doc1.pdf"}),
+                MagicMock(metadata={"source": "doc2.pdf"})
+            ]
+        }
+
+        self.assertEqual(get_sources(result), ["doc1.pdf", "doc2.pdf"])
+
+
+class ScopeFilterTests(TestCase):
+    """Test chat scopes are turned into vector store filters"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email="test@example.com",
+            password="pass12345"
+        )
+        self.project = Project.objects.create(name="Test", user=user)
+        other = Project.objects.create(name="Other", user=user)
+        self.docs = [
+            Document.objects.create(
+                name=f"doc{n}.txt",
+                project=project,
+                file=f"documents/doc{n}.txt",
+                file_size=7,
+                content_type="text/plain",
+                content_hash=content_hash,
+                uploaded_by=user
+            )
+            for n, (project, content_hash) in enumerate([
+                (self.project, "a" * 64),
+                (self.project, "a" * 64),
+                (self.project, "b" * 64),
+                (other, "c" * 64),
+            ])
+        ]
+
+    def test_documents_filtered_by_id(self):
+        """Documents of other projects are ignored"""
+        where = scope_filter(self.project, {
+            "document_ids": [self.docs[1].id, self.docs[3].id]
+        })
+
+        self.assertEqual(where, {"document_id": {"$in": [self.docs[1].id]}})
+
+    def test_unknown_documents_match_nothing(self):
+        where = scope_filter(self.project, {"document_ids": [self.docs[3].id]})
+
+        self.assertEqual(where, {"document_id": {"$in": [0]}})
+
+    def test_date_range_and_documents_combined(self):
+        after = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        before = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+        where = scope_filter(self.project, {
+            "document_ids": [self.docs[2].id],
+            "uploaded_after": after,
+            "uploaded_before": before,
+        })
+
+        self.assertEqual(where, {"$and": [
+            {"document_id": {"$in": [self.docs[2].id]}},
+            {"uploaded_at": {"$gte": int(after.timestamp())}},
+            {"uploaded_at": {"$lte": int(before.timestamp())}},
+        ]})
+
+    def test_empty_scope(self):
+        self.assertIsNone(scope_filter(self.project, {}))
+
+    def test_shared_chunks_of_documents_in_scope(self):
+        """Chunks stored under a document out of scope match through their hash"""
+        store = MagicMock()
+        store.scope_filter.return_value = {"chunk_hash": {"$in": ["f00"]}}
+
+        where = scope_filter(self.project, {"document_ids": [self.docs[1].id]}, store)
+
+        store.scope_filter.assert_called_once_with([self.docs[1].id])
+        self.assertEqual(where, {"$or": [
+            {"document_id": {"$in": [self.docs[1].id]}},
+            {"chunk_hash": {"$in": ["f00"]}},
+        ]})
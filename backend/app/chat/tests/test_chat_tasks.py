@@ -0,0 +1,107 @@
+"""
+Tests for the rolling summaries of chat sessions
+"""
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from langchain_core.language_models import FakeListLLM
+from rest_framework.test import APIClient
+from django.urls import reverse
+
+from project.models import Project
+from chat.models import ChatSession, ChatMessage
+from chat.tasks import summarize_chat, schedule_summary
+
+
+@override_settings(
+    CHAT_TOKENIZER="",
+    CHAT_SUMMARY_THRESHOLD_TOKENS=10,
+    CHAT_SUMMARY_KEEP_MESSAGES=2
+)
+@patch("chat.context.estimate_tokens", len)
+class RollingSummaryTests(TestCase):
+    """Test older messages are folded into the session summary"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com",
+            password="pass12345"
+        )
+        self.project = Project.objects.create(name="Test", user=self.user)
+        self.chat = ChatSession.objects.create(title="Chat", project=self.project)
+
+    def add_messages(self, *contents):
+        roles = [ChatMessage.ChatRoles.USER, ChatMessage.ChatRoles.ASSISTANT]
+        return [
+            ChatMessage.objects.create(
+                session=self.chat, role=roles[n % 2], content=content
+            )
+            for n, content in enumerate(contents)
+        ]
+
+    @patch("chat.tasks.get_llm")
+    def test_older_messages_folded(self, mock_get_llm):
+        mock_get_llm.return_value = FakeListLLM(responses=["User asked about pumps."])
+        messages = self.add_messages("pumps?", "they pump", "valves?", "they close")
+
+        self.assertTrue(summarize_chat(self.chat))
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.summary, "User asked about pumps.")
+        self.assertEqual(self.chat.summary_last_message, messages[1])
+        self.assertEqual(
+            list(self.chat.unsummarized_messages()), messages[2:]
+        )
+
+    @patch("chat.tasks.get_llm")
+    def test_short_chat_not_summarized(self, mock_get_llm):
+        self.add_messages("hi", "hello")
+
+        self.assertFalse(summarize_chat(self.chat))
+        mock_get_llm.assert_not_called()
+
+    @patch("chat.tasks.get_llm")
+    def test_concurrent_summary_not_overwritten(self, mock_get_llm):
+        """A summary written by another task in the meantime wins"""
+        mock_get_llm.return_value = FakeListLLM(responses=["Stale summary"])
+        messages = self.add_messages("pumps?", "they pump", "valves?", "they close")
+        ChatSession.objects.filter(pk=self.chat.pk).update(
+            summary="Newer", summary_last_message=messages[0]
+        )
+
+        self.assertFalse(summarize_chat(self.chat))
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.summary, "Newer")
+
+    @patch("chat.tasks.summarize_chat_task.delay")
+    def test_schedule_only_over_threshold(self, mock_delay):
+        system = {"role": "system", "content": "x" * 100}
+        schedule_summary(self.chat.id, [system, {"role": "user", "content": "short"}])
+        mock_delay.assert_not_called()
+
+        schedule_summary(self.chat.id, [system, {"role": "user", "content": "y" * 11}])
+        mock_delay.assert_called_once_with(self.chat.id)
+
+    @patch("chat.tasks.summarize_chat_task.delay")
+    @patch("chat.rag.run_rag_and_llm")
+    def test_summary_replaces_old_messages_in_history(self, mock_run_rag, mock_delay):
+        """Only the summary and the newer messages are sent to the model"""
+        mock_run_rag.return_value = "answer"
+        messages = self.add_messages("pumps?", "they pump")
+        ChatSession.objects.filter(pk=self.chat.pk).update(
+            summary="User asked about pumps.", summary_last_message=messages[1]
+        )
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        client.post(
+            reverse("chat:chat-messages", args=[self.project.id, self.chat.id]),
+            {"content": "valves?"}
+        )
+
+        self.assertEqual(mock_run_rag.call_args.args[1], [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "system", "content": "Summary of the earlier conversation:\nUser asked about pumps."},
+            {"role": "user", "content": "valves?"},
+        ])
@@ -0,0 +1,106 @@
+"""
+Tests for the token budgeted prompt assembly
+"""
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from langchain_core.documents import Document as Chunk
+
+from chat.context import pack_context, trim_history
+
+
+def chunk(text, page=0, content_hash="a" * 64):
+    return Chunk(
+        page_content=text,
+        metadata={"page": page, "content_hash": content_hash}
+    )
+
+
+# One token per character keeps the budgets easy to follow
+@override_settings(CHAT_TOKENIZER="", CHUNK_OVERLAP=30)
+@patch("chat.context.estimate_tokens", len)
+class PackContextTests(TestCase):
+    """Test retrieved chunks are deduped, merged and budgeted"""
+
+    def setUp(self):
+        overlap = "shared overlap text between chunks"
+        self.first = chunk("Start of the page. " + overlap)
+        self.second = chunk(overlap + " and the rest of the page.")
+
+    def test_neighbours_merged_without_overlap(self):
+        """Chunks of the same page sharing their overlap become one passage"""
+        passages = pack_context([self.second, self.first], budget=1000)
+
+        self.assertEqual(len(passages), 1)
+        self.assertEqual(
+            passages[0].page_content,
+            "Start of the page. shared overlap text between chunks"
+            " and the rest of the page."
+        )
+
+    def test_other_page_not_merged(self):
+        other = chunk(self.second.page_content, page=1)
+
+        passages = pack_context([self.first, other], budget=1000)
+
+        self.assertEqual(len(passages), 2)
+
+    def test_repeated_chunks_dropped(self):
+        passages = pack_context(
+            [self.first, chunk(self.first.page_content, content_hash="b" * 64)],
+            budget=1000
+        )
+
+        self.assertEqual(passages, [self.first])
+
+    def test_budget_filled_by_relevance(self):
+        """Chunks over the budget are skipped, smaller ones still fit"""
+        big = chunk("x" * 80, page=5)
+        small = chunk("y" * 10, page=6)
+        best = chunk("z" * 50, page=7)
+
+        passages = pack_context([best, big, small], budget=70)
+
+        self.assertEqual(passages, [best, small])
+
+
+    def test_merged_into_cheapest_neighbour(self):
+        """A merge too big for the budget gives way to a smaller one"""
+        start = "first shared words 123"
+        end = "second shared words that are longer"
+        before = chunk("Alpha intro. " + start)
+        after = chunk(end + " omega end.")
+        middle = chunk(start + " middle " + end)
+
+        # Appending to `before` costs 43 tokens, prepending to `after` 30
+        passages = pack_context([before, after, middle], budget=35 + 46 + 30)
+
+        self.assertEqual(
+            [passage.page_content for passage in passages],
+            [before.page_content, middle.page_content + " omega end."]
+        )
+
+@override_settings(CHAT_TOKENIZER="")
+@patch("chat.context.estimate_tokens", len)
+class TrimHistoryTests(TestCase):
+    """Test the history keeps the system prompt and the latest turns"""
+
+    def test_oldest_turns_dropped(self):
+        history = [
+            {"role": "system", "content": "sys"},
+            {"role": "user", "content": "old question"},
+            {"role": "assistant", "content": "old answer"},
+            {"role": "user", "content": "new q"},
+            {"role": "assistant", "content": "new a"},
+        ]
+
+        trimmed = trim_history(history, budget=15)
+
+        self.assertEqual(trimmed, [history[0]] + history[3:])
+
+    def test_short_history_kept(self):
+        history = [
+            {"role": "system", "content": "sys"},
+            {"role": "user", "content": "q"},
+        ]
+
+        self.assertEqual(trim_history(history, budget=100), history)
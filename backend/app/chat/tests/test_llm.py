@@ -0,0 +1,107 @@
+"""
+Tests for the Ollama gateway, run against a local stub server
+"""
+import threading
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+
+from chat import llm as gateway
+from chat.tests.ollama_stub import OllamaStub
+
+
+class OllamaGatewayTests(TestCase):
+    """Test pooled clients, keep-alive, warm-up and model events"""
+
+    def setUp(self):
+        self.stub = OllamaStub(reply="Pumps move water")
+        self.stub.__enter__()
+        self.addCleanup(self.stub.__exit__)
+        settings = override_settings(
+            OLLAMA_BASE_URL=self.stub.url,
+            OLLAMA_DEFAULT_KEEP_ALIVE="30m",
+            OLLAMA_MODEL_KEEP_ALIVE={"big:7b": "5m"},
+            OLLAMA_WARM_MODELS=["small:1b", "big:7b"],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(gateway.close_clients)
+
+        self.events = []
+        def on_loaded(sender, model, load_duration, **kwargs):
+            self.events.append(("loaded", model, load_duration))
+        def on_evicted(sender, model, **kwargs):
+            self.events.append(("evicted", model))
+        gateway.model_loaded.connect(on_loaded, weak=False)
+        gateway.model_evicted.connect(on_evicted, weak=False)
+        self.addCleanup(gateway.model_loaded.disconnect, on_loaded)
+        self.addCleanup(gateway.model_evicted.disconnect, on_evicted)
+
+    def test_llm_shared_per_model(self):
+        self.assertIs(gateway.get_llm("small:1b"), gateway.get_llm("small:1b"))
+        self.assertIsNot(gateway.get_llm("small:1b"), gateway.get_llm("big:7b"))
+
+    def test_generation_sends_keep_alive(self):
+        """Requests carry the keep_alive configured for their model"""
+        answer = gateway.get_llm("big:7b").invoke("What do pumps do?")
+
+        self.assertEqual(answer.strip(), "Pumps move water")
+        method, path, payload = self.stub.requests[-1]
+        self.assertEqual((method, path), ("POST", "/api/generate"))
+        self.assertEqual(payload["model"], "big:7b")
+        self.assertEqual(payload["keep_alive"], "5m")
+
+    def test_warm_models_loads_each_model(self):
+        gateway.warm_models()
+
+        warmed = [
+            (payload["model"], payload["keep_alive"], "prompt" in payload)
+            for _, _, payload in self.stub.requests
+        ]
+        self.assertEqual(warmed, [("small:1b", "30m", False), ("big:7b", "5m", False)])
+        self.assertEqual(self.events, [
+            ("loaded", "small:1b", 2.0),
+            ("loaded", "big:7b", 2.0),
+        ])
+
+    def test_eviction_detected_and_model_rewarmed(self):
+        gateway.warm_models()
+        self.events.clear()
+        # The server unloads a model after its keep_alive
+        self.stub.loaded.discard("big:7b")
+
+        gateway.maintain_warm_pool()
+
+        self.assertEqual(self.events, [
+            ("evicted", "big:7b"),
+            ("loaded", "big:7b", 2.0),
+        ])
+        self.assertEqual(self.stub.loaded, {"small:1b", "big:7b"})
+
+    def test_unreachable_server_does_not_raise(self):
+        with override_settings(OLLAMA_BASE_URL="http://127.0.0.1:9"), \
+                self.assertLogs("chat.llm", "WARNING"):
+            gateway.warm_models(["small:1b"])
+
+        self.assertEqual(self.events, [])
+
+
+class WorkerWarmupTests(TestCase):
+    """Test worker processes start without waiting for the models"""
+
+    @override_settings(OLLAMA_WARM_MODELS=["small:1b"])
+    def test_worker_start_warms_in_background(self):
+        from chat.tasks import warm_worker_llms
+        started, release, finished = (threading.Event() for _ in range(3))
+
+        def slow_warm(models=None):
+            started.set()
+            release.wait(5)
+            finished.set()
+
+        with patch("chat.llm.warm_models", side_effect=slow_warm):
+            warm_worker_llms()
+            # Still loading once the process start goes on
+            self.assertFalse(finished.is_set())
+            self.assertTrue(started.wait(5))
+            release.set()
+            self.assertTrue(finished.wait(5))
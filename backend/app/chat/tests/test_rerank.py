@@ -0,0 +1,110 @@
+"""
+Tests for the cross-encoder reranking stage
+"""
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from langchain_core.documents import Document as Chunk
+
+from chat.rag import get_retriever
+from chat.rerank import rerank, warm_reranker
+
+
+@override_settings(RERANK_MODEL_NAME="test/cross-encoder", RERANK_BATCH_SIZE=2)
+@patch("chat.rerank.get_reranker")
+class RerankTests(TestCase):
+    """Test chunks are reordered by cross-encoder score"""
+
+    def setUp(self):
+        self.chunks = [
+            Chunk(page_content=text)
+            for text in ["pumps", "valves", "AB_77 valve", "pipes"]
+        ]
+
+    def scores(self, mock_get_reranker, scores):
+        scores = iter(scores)
+        mock_get_reranker.return_value.predict.side_effect = (
+            lambda pairs, batch_size: [next(scores) for _ in pairs]
+        )
+
+    def test_best_chunks_kept(self, mock_get_reranker):
+        self.scores(mock_get_reranker, [0.1, 0.5, 0.9, 0.2])
+
+        results = rerank("what is AB_77?", self.chunks, top_n=2, budget=10)
+
+        self.assertEqual(
+            [chunk.page_content for chunk in results], ["AB_77 valve", "valves"]
+        )
+
+    def test_scored_in_batches(self, mock_get_reranker):
+        self.scores(mock_get_reranker, [0.1, 0.5, 0.9, 0.2])
+
+        rerank("question", self.chunks, top_n=2, budget=10)
+
+        calls = mock_get_reranker.return_value.predict.call_args_list
+        self.assertEqual(
+            [call.args[0] for call in calls],
+            [
+                [("question", "pumps"), ("question", "valves")],
+                [("question", "AB_77 valve"), ("question", "pipes")],
+            ]
+        )
+
+    @patch("chat.rerank.time.monotonic")
+    def test_over_budget_keeps_retrieval_order(self, mock_monotonic, mock_get_reranker):
+        """Once the budget is spent the vector order is used"""
+        self.scores(mock_get_reranker, [0.1, 0.5, 0.9, 0.2])
+        # Start, first batch in budget, second batch over it
+        mock_monotonic.side_effect = [0.0, 0.1, 0.8]
+
+        results = rerank("question", self.chunks, top_n=2, budget=0.5)
+
+        self.assertEqual(results, self.chunks[:2])
+        mock_get_reranker.return_value.predict.assert_called_once()
+
+
+    @patch("chat.rerank.time.monotonic")
+    def test_batch_that_would_end_over_budget_skipped(
+        self, mock_monotonic, mock_get_reranker
+    ):
+        """A batch is not started when it would end past the budget"""
+        self.scores(mock_get_reranker, [0.1, 0.5, 0.9, 0.2])
+        # The first batch took 0.3s, a second one would end at 0.6s
+        mock_monotonic.side_effect = [0.0, 0.0, 0.3]
+
+        results = rerank("question", self.chunks, top_n=2, budget=0.5)
+
+        self.assertEqual(results, self.chunks[:2])
+        mock_get_reranker.return_value.predict.assert_called_once()
+
+    def test_warm_reranker(self, mock_get_reranker):
+        """The model is loaded at start, a failure doesn't stop the process"""
+        mock_get_reranker.side_effect = OSError("no model")
+
+        warm_reranker()
+
+        mock_get_reranker.assert_called_once_with()
+
+@override_settings(
+    RERANK_MODEL_NAME="test/cross-encoder",
+    RERANK_CANDIDATES=10,
+    RAG_TOP_K=2
+)
+class RerankingRetrieverTests(TestCase):
+    """Test the chat retriever reranks a wide candidate set"""
+
+    @patch("chat.rerank.rerank")
+    @patch("chat.rag.CachedRetriever")
+    @patch("chat.rag.get_project_store")
+    @patch("chat.rag.get_collection_project")
+    def test_retriever_reranks_candidates(
+        self, mock_project, mock_store, mock_retriever_cls, mock_rerank
+    ):
+        candidates = [Chunk(page_content=str(n)) for n in range(10)]
+        mock_retriever_cls.return_value.invoke.return_value = candidates
+        mock_rerank.return_value = candidates[:2]
+
+        docs = get_retriever("proj_1_1").invoke("question")
+
+        self.assertEqual(docs, candidates[:2])
+        self.assertEqual(mock_retriever_cls.call_args.kwargs["k"], 10)
+        mock_rerank.assert_called_once_with("question", candidates, 2)
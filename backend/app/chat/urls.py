@@ -0,0 +1,25 @@
+from django.urls import (
+    path,
+    include,
+)
+from rest_framework.routers import SimpleRouter
+from chat import views
+
+router = SimpleRouter()
+router.register(
+    r'projects/(?P<project_pk>[^/.]+)/chats',
+    views.ChatSessionViewSet,
+    basename='chat'
+)
+
+app_name = 'chat'
+
+urlpatterns = [
+    # Async view, served from the event loop under ASGI
+    path(
+        'projects/<int:project_pk>/chats/<int:pk>/stream/',
+        views.stream_chat,
+        name='chat-stream'
+    ),
+    path('', include(router.urls)),
+]
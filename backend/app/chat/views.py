@@ -1,3 +1,266 @@
-from django.shortcuts import render
+"""
+API Views for the chat sessions of a project
+"""
+import json
+import logging
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (
+    JsonResponse,
+    StreamingHttpResponse
+)
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from rest_framework import (
+    viewsets,
+    status
+)
+from rest_framework.decorators import action
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from project.models import Project
+from .models import (
+    ChatSession,
+    ChatMessage
+)
+from .serializers import (
+    ChatSessionSerializer,
+    ChatSessionRenameSerializer,
+    ChatMessageSerializer
+)
+from chat import answer_cache, rag
+from chat.tasks import schedule_summary
+
+log = logging.getLogger(__name__)
+
+
+def sse_event(data, event=None):
+    """Format `data` as a Server-Sent Event"""
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+
+def build_history(chat, messages):
+    """
+    Role/content dicts sent to the model: the system prompt, the rolling
+    summary of the older messages and the messages after it
+    """
+    history = [{"role": "system", "content": settings.CHAT_SYSTEM_PROMPT}]
+    if chat.summary:
+        history.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{chat.summary}"
+        })
+    history.extend(
+        {"role": message.role, "content": message.content}
+        for message in messages
+    )
+    return history
+
+
+class ChatSessionViewSet(viewsets.ModelViewSet):
+    """View for managing the chat sessions of a project"""
+    serializer_class = ChatSessionSerializer
+    queryset = ChatSession.objects.all()
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """Retrieve chats of the current user's project, newest first"""
+        return self.queryset.filter(
+            project__id=self.kwargs['project_pk'],
+            project__user=self.request.user
+        ).order_by('-created_at', '-id')
+
+    def get_serializer_class(self):
+        """Return the serializer class for the request"""
+        if self.action == 'rename':
+            return ChatSessionRenameSerializer
+        if self.action == 'messages':
+            return ChatMessageSerializer
+        return self.serializer_class
+
+    def get_project(self):
+        """Get and validate the associated project"""
+        return get_object_or_404(
+            Project,
+            id=self.kwargs['project_pk'],
+            user=self.request.user
+        )
+
+    def perform_create(self, serializer):
+        """Create a new chat session in the project"""
+        serializer.save(project=self.get_project())
+
+    def get_history(self, chat):
+        """History of the chat as sent to the model"""
+        return build_history(chat, chat.unsummarized_messages())
+
+    def save_user_message(self, chat, request):
+        """Validate and store the user's message, returns it and its scope"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        scope = serializer.validated_data.get('scope')
+        message = serializer.save(session=chat, role=ChatMessage.ChatRoles.USER)
+        return message, scope
+
+    @action(detail=True, methods=['get', 'post'], url_path='messages')
+    def messages(self, request, project_pk=None, pk=None):
+        """
+        GET the messages of the chat.
+        POST a user message, answer it and return both messages.
+        """
+        chat = self.get_object()
+        if request.method == 'GET':
+            serializer = self.get_serializer(chat.messages.all(), many=True)
+            return Response(serializer.data)
+
+        user_message, scope = self.save_user_message(chat, request)
+        history = self.get_history(chat)
+        answer = rag.run_rag_and_llm(
+            chat.project.chroma_collection,
+            history,
+            scope=scope
+        )
+        assistant_message = ChatMessage.objects.create(
+            session=chat,
+            role=ChatMessage.ChatRoles.ASSISTANT,
+            content=answer
+        )
+        schedule_summary(
+            chat.id, history + [{"role": "assistant", "content": answer}]
+        )
+        serializer = self.get_serializer(
+            [user_message, assistant_message], many=True
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='answer-cache')
+    def answer_cache(self, request, project_pk=None):
+        """Usage of the project's semantic answer cache"""
+        project = self.get_project()
+        return Response({
+            "entries": project.answer_cache_entries.count(),
+            **answer_cache.stats.totals(scope=project.id),
+        })
+
+    @action(detail=True, methods=['patch'], url_path='rename')
+    def rename(self, request, project_pk=None, pk=None):
+        """Change the title of the chat"""
+        chat = self.get_object()
+        serializer = self.get_serializer(chat, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+
+async def get_token_user(request):
+    """Active user of the request's `Authorization: Token <key>` header"""
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b'token':
+        return None
+    token = await (
+        Token.objects.select_related('user')
+        .filter(key=auth[1].decode(errors='ignore'))
+        .afirst()
+    )
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def parse_body(request):
+    """Data of a JSON or form encoded request body"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+@csrf_exempt
+@require_POST
+async def stream_chat(request, project_pk, pk):
+    """
+    POST a user message and stream the answer as Server-Sent Events.
+    Each token is sent as a `data: {"token": ...}` event, the stored
+    assistant message is sent last in a `done` event.
+    Runs on the event loop under ASGI, a slow generation only holds a
+    coroutine instead of a whole worker.
+    """
+    user = await get_token_user(request)
+    if user is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    chat = await (
+        ChatSession.objects.select_related('project')
+        .filter(pk=pk, project__id=project_pk, project__user=user)
+        .afirst()
+    )
+    if chat is None:
+        return JsonResponse(
+            {"detail": "No ChatSession matches the given query."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    data = parse_body(request)
+    serializer = ChatMessageSerializer(data=data)
+    if data is None or not serializer.is_valid():
+        errors = serializer.errors if data is not None else {"detail": "Invalid JSON."}
+        return JsonResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+    await ChatMessage.objects.acreate(
+        session=chat,
+        role=ChatMessage.ChatRoles.USER,
+        content=serializer.validated_data['content']
+    )
+    scope = serializer.validated_data.get('scope')
+
+    collection_name = chat.project.chroma_collection
+    history = build_history(
+        chat, [message async for message in chat.unsummarized_messages()]
+    )
+
+    async def events():
+        tokens = []
+        try:
+            async for token in rag.astream_rag_and_llm(
+                collection_name, history, scope=scope
+            ):
+                tokens.append(token)
+                yield sse_event({"token": token})
+        except Exception:
+            log.exception(f"Error answering chat {chat.id}")
+            yield sse_event({"detail": "Error generating answer."}, event="error")
+            return
+
+        answer = "".join(tokens)
+        message = await ChatMessage.objects.acreate(
+            session=chat,
+            role=ChatMessage.ChatRoles.ASSISTANT,
+            content=answer
+        )
+        yield sse_event(ChatMessageSerializer(message).data, event="done")
+        await sync_to_async(schedule_summary)(
+            chat.id, history + [{"role": "assistant", "content": answer}]
+        )
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
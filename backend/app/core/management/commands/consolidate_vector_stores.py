@@ -0,0 +1,40 @@
+"""
+Django command to move project vectors written by older layouts
+"""
+from django.core.management.base import BaseCommand
+
+from project.models import Project
+from project.utils.vector_store import registry
+
+
+class Command(BaseCommand):
+    """
+    Django Command moving every project's vectors to
+    CHROMA_ROOT/projects/<id>. Run it once with the workers stopped.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only print the directories that would be moved'
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        moved = conflicts = 0
+        for project_id in Project.objects.values_list('pk', flat=True).order_by('pk'):
+            try:
+                source = registry.consolidate(project_id, dry_run=options['dry_run'])
+            except ValueError as e:
+                conflicts += 1
+                self.stderr.write(f"Skipped: {e}")
+                continue
+            if source is not None:
+                moved += 1
+                self.stdout.write(f"{source} -> {registry.path(project_id)}")
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved} vector directories, {conflicts} conflicts"
+        ))
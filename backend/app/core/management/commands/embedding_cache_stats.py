@@ -0,0 +1,43 @@
+"""
+Django command to report the usage of the embedding cache
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Length
+
+from project.models import EmbeddingCacheEntry
+from project.utils.embedding_cache import evict_embedding_cache, stats
+
+
+class Command(BaseCommand):
+    """Django Command to print the embedding cache counters"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--evict',
+            action='store_true',
+            help='Evict least recently used entries above EMBEDDING_CACHE_MAX_ENTRIES'
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        if options['evict']:
+            deleted = evict_embedding_cache(settings.EMBEDDING_CACHE_MAX_ENTRIES)
+            self.stdout.write(f'Evicted {deleted} entries')
+
+        totals = EmbeddingCacheEntry.objects.aggregate(
+            entries=Count('pk'),
+            reused=Count('pk', filter=Q(hits__gt=0)),
+            size=Sum(Length('vector')),
+        )
+        # Lookups counted by every process, evicted entries included
+        counters = stats.totals()
+        self.stdout.write(
+            f"Entries: {totals['entries']} / {settings.EMBEDDING_CACHE_MAX_ENTRIES}"
+        )
+        self.stdout.write(f"Vector bytes: {totals['size'] or 0}")
+        self.stdout.write(f"Reused entries: {totals['reused']}")
+        self.stdout.write(f"Hits: {counters['hits']}")
+        self.stdout.write(f"Misses: {counters['misses']}")
+        self.stdout.write(f"Hit rate: {counters['hit_rate']:.2%}")
@@ -0,0 +1,117 @@
+"""
+Django command to rebuild the vectors of projects
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from project.models import Project
+from project.reindex import reindex_project
+
+
+class Command(BaseCommand):
+    """
+    Django Command re-chunking and re-embedding projects into new
+    collections with the current settings. Every project switches to its
+    new collection once it is built, an interrupted run resumes when the
+    command is run again.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project_ids',
+            nargs='*',
+            type=int,
+            help='Projects to rebuild'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild every project with indexed documents'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Projects rebuilt at once, each in its own process'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Discard the progress of interrupted rebuilds'
+        )
+        parser.add_argument(
+            '--keep-old',
+            action='store_true',
+            help='Keep the replaced collections instead of dropping them'
+        )
+
+    def get_project_ids(self, options):
+        if options['all']:
+            return list(
+                Project.objects.exclude(chroma_collection='')
+                .order_by('pk').values_list('pk', flat=True)
+            )
+        if not options['project_ids']:
+            raise CommandError('Give project ids or --all')
+        found = set(
+            Project.objects.filter(pk__in=options['project_ids'])
+            .values_list('pk', flat=True)
+        )
+        missing = sorted(set(options['project_ids']) - found)
+        if missing:
+            raise CommandError(f"Unknown projects: {missing}")
+        return options['project_ids']
+
+    def report(self, summary):
+        resumed = f", {summary['resumed']} resumed" if summary['resumed'] else ''
+        self.stdout.write(
+            f"Project {summary['project']}: {summary['documents']} documents "
+            f"in {summary['collection']}{resumed}"
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        project_ids = self.get_project_ids(options)
+        kwargs = {'restart': options['restart'], 'keep_old': options['keep_old']}
+        workers = min(max(options['workers'], 1), len(project_ids) or 1)
+
+        failed = []
+        if workers == 1:
+            for project_id in project_ids:
+                try:
+                    self.report(reindex_project(project_id, **kwargs))
+                except Exception as e:
+                    failed.append(project_id)
+                    self.stderr.write(f"Project {project_id} failed: {e}")
+        else:
+            # Fresh processes, nothing of this one's connections or
+            # models is shared with them
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup
+            ) as pool:
+                futures = {
+                    pool.submit(reindex_project, project_id, **kwargs): project_id
+                    for project_id in project_ids
+                }
+                for future in as_completed(futures):
+                    try:
+                        self.report(future.result())
+                    except Exception as e:
+                        failed.append(futures[future])
+                        self.stderr.write(f"Project {futures[future]} failed: {e}")
+
+        if failed:
+            raise CommandError(
+                f"Reindex failed for projects {sorted(failed)}, "
+                "run the command again to resume them"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Reindexed {len(project_ids)} projects"
+        ))
@@ -0,0 +1,143 @@
+"""
+Tests for the management commands
+"""
+from io import StringIO
+from unittest.mock import patch
+from pathlib import Path
+import shutil
+import tempfile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+
+from project.models import EmbeddingCacheEntry, Project
+from project.utils.embedding_cache import stats
+from project.utils.vector_store import registry
+
+
+class ConsolidateVectorStoresTests(TestCase):
+    """Test vectors of older layouts are moved to the project directory"""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(
+            CHROMA_ROOT=self.root / "stores",
+            CHROMA_LEGACY_ROOTS=[self.root / "legacy"]
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='pass12345'
+        ) # type: ignore
+        self.project = Project.objects.create(name="Project", user=user)
+
+    def _legacy_dir(self, path):
+        path.mkdir(parents=True)
+        (path / "chroma.sqlite3").write_text("vectors")
+        return path
+
+    def test_moves_legacy_directories(self):
+        legacy = self._legacy_dir(
+            self.root / "legacy" / "projects" / str(self.project.id)
+        )
+
+        call_command('consolidate_vector_stores', stdout=StringIO())
+
+        self.assertFalse(legacy.exists())
+        target = registry.path(self.project.id)
+        self.assertEqual((target / "chroma.sqlite3").read_text(), "vectors")
+
+    def test_dry_run_moves_nothing(self):
+        legacy = self._legacy_dir(
+            self.root / "stores" / f"project_{self.project.id}"
+        )
+        out = StringIO()
+
+        call_command('consolidate_vector_stores', '--dry-run', stdout=out)
+
+        self.assertTrue(legacy.exists())
+        self.assertIn("Would move 1", out.getvalue())
+
+    def test_existing_vectors_not_overwritten(self):
+        legacy = self._legacy_dir(
+            self.root / "stores" / f"project_{self.project.id}"
+        )
+        self._legacy_dir(registry.path(self.project.id))
+        err = StringIO()
+
+        call_command('consolidate_vector_stores', stdout=StringIO(), stderr=err)
+
+        self.assertTrue(legacy.exists())
+        self.assertIn(f"Project {self.project.id}", err.getvalue())
+
+
+class ReindexCommandTests(TestCase):
+    """Test the projects the reindex command rebuilds"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='pass12345'
+        ) # type: ignore
+        self.indexed = Project.objects.create(
+            name="Indexed", user=user, chroma_collection="proj_1"
+        )
+        Project.objects.create(name="Empty", user=user)
+
+    @patch('core.management.commands.reindex.reindex_project')
+    def test_all_indexed_projects(self, mock_reindex):
+        mock_reindex.return_value = {
+            'project': self.indexed.id,
+            'collection': 'proj_1_r1',
+            'documents': 2,
+            'resumed': 0,
+        }
+        out = StringIO()
+
+        call_command('reindex', '--all', stdout=out)
+
+        mock_reindex.assert_called_once_with(
+            self.indexed.id, restart=False, keep_old=False
+        )
+        self.assertIn("2 documents in proj_1_r1", out.getvalue())
+
+    def test_projects_required(self):
+        with self.assertRaises(CommandError):
+            call_command('reindex')
+
+    def test_unknown_project(self):
+        with self.assertRaises(CommandError):
+            call_command('reindex', '999')
+
+    @patch('core.management.commands.reindex.reindex_project')
+    def test_failed_project_reported(self, mock_reindex):
+        mock_reindex.side_effect = RuntimeError("Project busy")
+
+        with self.assertRaises(CommandError):
+            call_command(
+                'reindex', str(self.indexed.id),
+                stdout=StringIO(), stderr=StringIO()
+            )
+
+
+class EmbeddingCacheStatsTests(TestCase):
+    """Test the reported lookups are the counted ones"""
+
+    def test_reports_counted_lookups(self):
+        stats.reset()
+        EmbeddingCacheEntry.objects.create(
+            model_name='test/model', text_hash='a' * 64, vector=b'\0' * 8, hits=5
+        )
+        stats.record(hits=3, misses=2)
+        out = StringIO()
+
+        call_command('embedding_cache_stats', stdout=out)
+
+        self.assertIn("Entries: 1", out.getvalue())
+        self.assertIn("Hits: 3\n", out.getvalue())
+        self.assertIn("Misses: 2\n", out.getvalue())
+        self.assertIn("Hit rate: 60.00%", out.getvalue())
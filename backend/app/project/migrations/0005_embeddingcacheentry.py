@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("project", "0004_document_content_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmbeddingCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model_name",
+                    models.CharField(
+                        help_text="Embedding model that produced the vector",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "text_hash",
+                    models.CharField(
+                        help_text="SHA-256 of the normalized text", max_length=64
+                    ),
+                ),
+                ("vector", models.BinaryField(help_text="float32 embedding vector")),
+                (
+                    "hits",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Number of times the vector was reused"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "last_used_at",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        help_text="Last time the vector was read or written, used for LRU eviction",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("model_name", "text_hash"),
+                        name="unique_embedding_cache_key",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("project", "0006_documentupload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="collection_version",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Bumped whenever the collection content changes"
+            ),
+        ),
+    ]
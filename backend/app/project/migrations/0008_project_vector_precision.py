@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("project", "0007_project_collection_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="vector_precision",
+            field=models.CharField(
+                choices=[
+                    ("float32", "float32"),
+                    ("float16", "float16"),
+                    ("int8", "int8"),
+                ],
+                default="float32",
+                help_text="Storage of the searched vectors in the local backend, applies to collections created afterwards",
+                max_length=10,
+            ),
+        ),
+    ]
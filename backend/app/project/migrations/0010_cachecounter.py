@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("project", "0009_reindexjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "cache",
+                    models.CharField(
+                        help_text="Cache the lookups were made in", max_length=50
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Part of the cache counted apart, e.g. a project id",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        help_text="Outcome of the lookups, e.g. hits or misses",
+                        max_length=50,
+                    ),
+                ),
+                ("value", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("cache", "scope", "key"), name="unique_cache_counter"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_collection_configs(apps, schema_editor):
+    """
+    Existing collections were built with the settings of their last
+    completed rebuild, or with the current ones when never rebuilt
+    """
+    Project = apps.get_model("project", "Project")
+    ReindexJob = apps.get_model("project", "ReindexJob")
+    for project in Project.objects.exclude(chroma_collection=""):
+        job = (
+            ReindexJob.objects
+            .filter(
+                project=project,
+                status="completed",
+                collection_name=project.chroma_collection
+            )
+            .order_by("-finished_at")
+            .first()
+        )
+        config = dict(job.config) if job is not None else {
+            "embedding_model": settings.EMBEDDING_MODEL_NAME,
+            "chunk_size": settings.CHUNK_SIZE,
+            "chunk_overlap": settings.CHUNK_OVERLAP,
+            "backend": settings.VECTOR_BACKEND,
+        }
+        config.setdefault("precision", project.vector_precision)
+        project.collection_config = config
+        project.save(update_fields=["collection_config"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("project", "0010_cachecounter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="collection_config",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Embedding model, chunking, backend and precision the collection was built with",
+            ),
+        ),
+        migrations.RunPython(record_collection_configs, migrations.RunPython.noop),
+    ]
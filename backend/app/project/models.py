@@ -11,6 +11,12 @@ def document_upload_path(instance, filename):
 
 class Project(models.Model):
     """Project model for organizing documents and vector stores"""
+
+    class VectorPrecision(models.TextChoices):
+        FLOAT32 = 'float32', 'float32'
+        FLOAT16 = 'float16', 'float16'
+        INT8 = 'int8', 'int8'
+
     name = models.CharField(
         max_length=255,
         help_text="Name of the project",
@@ -31,6 +37,23 @@ class Project(models.Model):
         blank=True,
         help_text="Name of the associated Chroma collection"
     )
+    collection_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Bumped whenever the collection content changes"
+    )
+    vector_precision = models.CharField(
+        max_length=10,
+        choices=VectorPrecision.choices,
+        default=VectorPrecision.FLOAT32,
+        help_text="Storage of the searched vectors in the local backend, "
+                  "applies to collections created afterwards"
+    )
+    collection_config = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Embedding model, chunking, backend and precision the "
+                  "collection was built with"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -74,6 +97,12 @@ class Document(models.Model):
         max_length=100,
         help_text="MIME type of the file"
     )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="SHA-256 of the file content"
+    )
     processing_status = models.CharField(
         max_length=200,
         choices=ProcessingStatus.choices,
@@ -92,4 +121,178 @@ class Document(models.Model):
         help_text="User who uploaded the document"
     )
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
\ No newline at end of file
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class DocumentUpload(models.Model):
+    """Resumable upload of a document sent in several parts"""
+
+    class UploadStatus(models.TextChoices):
+        IN_PROGRESS = 'in_progress', 'In progress'
+        COMPLETED = 'completed', 'Completed'
+
+    project = models.ForeignKey(
+        'Project',
+        on_delete=models.CASCADE,
+        related_name="uploads",
+        help_text="Project the document is uploaded to"
+    )
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="document_uploads",
+        help_text="User uploading the document"
+    )
+    name = models.CharField(
+        max_length=255,
+        help_text="Original File Name"
+    )
+    file_path = models.CharField(
+        max_length=500,
+        help_text="Storage path the parts are written to"
+    )
+    size = models.PositiveBigIntegerField(
+        help_text="Total file size in bytes"
+    )
+    received_bytes = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Bytes written so far, offset of the next part"
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Expected SHA-256 of the whole file, checked on completion"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=UploadStatus.choices,
+        default=UploadStatus.IN_PROGRESS,
+        help_text="Current upload status"
+    )
+    document = models.OneToOneField(
+        'Document',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="upload",
+        help_text="Document created once the upload completed"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class EmbeddingCacheEntry(models.Model):
+    """Embedding vector of a chunk of text, cached across ingestions"""
+    model_name = models.CharField(
+        max_length=255,
+        help_text="Embedding model that produced the vector"
+    )
+    text_hash = models.CharField(
+        max_length=64,
+        help_text="SHA-256 of the normalized text"
+    )
+    vector = models.BinaryField(
+        help_text="float32 embedding vector"
+    )
+    hits = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of times the vector was reused"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        help_text="Last time the vector was read or written, used for LRU eviction"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['model_name', 'text_hash'],
+                name='unique_embedding_cache_key'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.model_name}:{self.text_hash}"
+
+
+class CacheCounter(models.Model):
+    """Lookups of a cache counted by every process, see utils.cache_stats"""
+    cache = models.CharField(
+        max_length=50,
+        help_text="Cache the lookups were made in"
+    )
+    scope = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        help_text="Part of the cache counted apart, e.g. a project id"
+    )
+    key = models.CharField(
+        max_length=50,
+        help_text="Outcome of the lookups, e.g. hits or misses"
+    )
+    value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cache', 'scope', 'key'],
+                name='unique_cache_counter'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.cache}:{self.scope}:{self.key}={self.value}"
+
+
+class ReindexJob(models.Model):
+    """
+    Rebuild of a project's vectors into a new collection, see
+    `manage.py reindex`. Records the indexed documents as a checkpoint so
+    an interrupted rebuild resumes where it stopped.
+    """
+
+    class Status(models.TextChoices):
+        RUNNING = 'running', 'Running'
+        COMPLETED = 'completed', 'Completed'
+        ABANDONED = 'abandoned', 'Abandoned'
+
+    project = models.ForeignKey(
+        'Project',
+        on_delete=models.CASCADE,
+        related_name="reindex_jobs",
+        help_text="Project being rebuilt"
+    )
+    collection_name = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Collection the chunks are written to"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.RUNNING
+    )
+    config = models.JSONField(
+        default=dict,
+        help_text="Embedding and chunking settings the rebuild uses"
+    )
+    documents = models.JSONField(
+        default=dict,
+        help_text="Content hash and chunk count of each indexed document"
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Reindex of {self.project} into {self.collection_name}"
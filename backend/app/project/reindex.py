@@ -0,0 +1,157 @@
+"""
+Rebuild the vectors of a project into a new collection, after the
+embedding model, the chunking or the vector backend changed.
+The project keeps answering from its current collection during the build,
+the switch happens at once under the project's write lock.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Project,
+    Document,
+    ReindexJob
+)
+from .tasks import (
+    get_splitter,
+    write_document_chunks
+)
+from .utils.locks import (
+    project_write_lock,
+    release_lock
+)
+from .utils.retrieval_cache import bump_collection_version
+from .utils.vector_store import (
+    collection_config,
+    open_store,
+    registry
+)
+
+log = logging.getLogger(__name__)
+
+
+def get_job(project, restart=False):
+    """
+    Running rebuild of `project` to resume, or a new one. A rebuild made
+    with other settings, or any when `restart`, is abandoned and its
+    collection dropped.
+    """
+    config = collection_config(project)
+    job = project.reindex_jobs.filter(status=ReindexJob.Status.RUNNING).first()
+    if job is not None and (restart or job.config != config):
+        log.info(f"Abandoning reindex of project {project.id} into {job.collection_name}")
+        registry.drop_collection(project.id, job.collection_name)
+        job.status = ReindexJob.Status.ABANDONED
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at', 'updated_at'])
+        job = None
+
+    if job is None:
+        job = ReindexJob.objects.create(project=project, config=config)
+        job.collection_name = registry.collection_name(project.id, revision=job.pk)
+        job.save(update_fields=['collection_name'])
+    return job
+
+
+def build(job, store, splitter):
+    """
+    Index the completed documents of the project the job has not indexed
+    yet. The job is saved after each document, it is the checkpoint.
+    """
+    documents = (
+        job.project.documents
+        .filter(processing_status=Document.ProcessingStatus.COMPLETED)
+        .exclude(pk__in=[int(doc_id) for doc_id in job.documents])
+        .order_by('pk')
+    )
+    for doc in documents.iterator():
+        # Duplicate uploads and shared text only add references
+        chunks = write_document_chunks(doc, store, splitter)
+        job.documents[str(doc.pk)] = {'hash': doc.content_hash, 'chunks': chunks}
+        job.save(update_fields=['documents', 'updated_at'])
+        log.info(f"Reindexed doc {doc.pk} into {job.collection_name}")
+
+
+def remove_deleted(job, store):
+    """Remove the chunks of the documents deleted during the build"""
+    current = set(
+        job.project.documents
+        .filter(processing_status=Document.ProcessingStatus.COMPLETED)
+        .values_list('pk', flat=True)
+    )
+    for doc_id in [doc_id for doc_id in job.documents if int(doc_id) not in current]:
+        del job.documents[doc_id]
+        store.delete_document(int(doc_id))
+
+
+def switch(job, store, splitter):
+    """
+    Make the job's collection the project's one. Holds the project's write
+    lock so no ingestion or deletion runs against the old collection in
+    between, catches up with the documents changed during the build first.
+    Returns the replaced collection.
+    """
+    project_id = job.project_id
+    lock = project_write_lock(project_id)
+    if not lock.acquire(blocking=True, blocking_timeout=settings.REINDEX_LOCK_WAIT):
+        raise RuntimeError(f"Project {project_id} is busy, try again later")
+    try:
+        build(job, store, splitter)
+        remove_deleted(job, store)
+        with transaction.atomic():
+            project = Project.objects.select_for_update().get(pk=project_id)
+            old_collection = project.chroma_collection
+            project.chroma_collection = job.collection_name
+            project.collection_config = job.config
+            project.save(update_fields=['chroma_collection', 'collection_config'])
+            for doc_id, info in job.documents.items():
+                Document.objects.filter(pk=int(doc_id)).update(
+                    chunks_count=info['chunks']
+                )
+            bump_collection_version(project_id)
+            job.status = ReindexJob.Status.COMPLETED
+            job.finished_at = timezone.now()
+            job.save()
+    finally:
+        release_lock(lock)
+    return old_collection
+
+
+def reindex_project(project_id, restart=False, keep_old=False):
+    """
+    Rebuild the vectors of a project into a new collection and switch to
+    it, resuming the rebuild left running by an earlier call. The replaced
+    collection is dropped unless `keep_old`.
+    Returns a summary of the rebuild.
+    """
+    project = Project.objects.get(pk=project_id)
+    if project.chroma_collection:
+        # The shared file must follow the collection being replaced
+        registry.adopt_shared_lexical_index(project)
+    job = get_job(project, restart=restart)
+    resumed = len(job.documents)
+    store = open_store(project.id, job.collection_name, job.config)
+    splitter = get_splitter()
+    try:
+        build(job, store, splitter)
+        old_collection = switch(job, store, splitter)
+    except Exception as e:
+        # The job stays running, the next call resumes it
+        job.error = str(e)
+        job.save(update_fields=['error', 'updated_at'])
+        raise
+    finally:
+        store.close()
+
+    if old_collection and old_collection != job.collection_name and not keep_old:
+        registry.drop_collection(project.id, old_collection)
+    return {
+        'project': project.id,
+        'collection': job.collection_name,
+        'replaced': old_collection,
+        'documents': len(job.documents),
+        'resumed': resumed,
+    }
@@ -1,12 +1,22 @@
 """
 Serializers for the Project API View
 """
+import zipfile
+from pathlib import PurePosixPath
+
 from rest_framework import serializers
 from .models import (
     Project,
-    Document
+    Document,
+    DocumentUpload,
+    document_upload_path
 )
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.urls import reverse
+from .utils.hashing import file_sha256
+from .utils.uploads import create_upload_file
 
 class DocumentUploadSerializer(serializers.ModelSerializer):
     class Meta:
@@ -35,12 +45,136 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
             name=uploaded_file.name,
             file = uploaded_file,
             file_size = uploaded_file.size,
-            content_type = getattr(uploaded_file, 'content_type', 'application/octet-stream')
+            content_type = getattr(uploaded_file, 'content_type', 'application/octet-stream'),
+            content_hash = file_sha256(uploaded_file)
         )
         doc.save()
         return doc
 
 
+class DocumentBulkUploadSerializer(serializers.Serializer):
+    """
+    Serializer for uploading many PDFs in one request.
+    Accepts several `files`, each either a PDF or a zip archive of PDFs.
+    """
+    files = serializers.ListField(
+        child=serializers.FileField(),
+        allow_empty=False,
+        write_only=True
+    )
+
+    def _expand(self, uploaded_file):
+        """List the PDFs of an upload, opening zip archives"""
+        name = uploaded_file.name.lower()
+        if name.endswith('.pdf'):
+            if uploaded_file.content_type != 'application/pdf':
+                raise serializers.ValidationError(
+                    f"{uploaded_file.name}: only PDF files are allowed."
+                )
+            return [(uploaded_file, uploaded_file.content_type)]
+
+        if not name.endswith('.zip') or not zipfile.is_zipfile(uploaded_file):
+            raise serializers.ValidationError(
+                f"{uploaded_file.name}: only PDF files or zip archives are allowed."
+            )
+        archive = zipfile.ZipFile(uploaded_file)
+        members = []
+        for info in archive.infolist():
+            member_name = PurePosixPath(info.filename)
+            if (
+                info.is_dir()
+                or member_name.suffix.lower() != '.pdf'
+                or member_name.parts[0] == '__MACOSX'
+            ):
+                continue
+            member = File(archive.open(info), name=member_name.name)
+            member.size = info.file_size
+            members.append((member, 'application/pdf'))
+        return members
+
+    def validate_files(self, uploaded_files):
+        pdfs = []
+        for uploaded_file in uploaded_files:
+            pdfs.extend(self._expand(uploaded_file))
+
+        if not pdfs:
+            raise serializers.ValidationError("No PDF files found.")
+        if len(pdfs) > settings.DOCUMENT_BULK_MAX_FILES:
+            raise serializers.ValidationError(
+                f"At most {settings.DOCUMENT_BULK_MAX_FILES} files per upload."
+            )
+        if sum(pdf.size for pdf, _ in pdfs) > settings.DOCUMENT_BULK_MAX_BYTES:
+            raise serializers.ValidationError("Upload is too large.")
+        return pdfs
+
+    def create(self, validated_data):
+        request = self.context['request']
+        project = self.context['project']
+        if request is None or project is None:
+            raise serializers.ValidationError("Missing request or project context.")
+
+        docs = []
+        for pdf, content_type in validated_data['files']:
+            doc = Document(
+                project=project,
+                uploaded_by=request.user,
+                name=pdf.name,
+                file_size=pdf.size,
+                content_type=content_type,
+                content_hash=file_sha256(pdf)
+            )
+            # Write the file to storage, the rows are inserted all at once
+            doc.file.save(pdf.name, pdf, save=False)
+            docs.append(doc)
+        return Document.objects.bulk_create(docs)
+
+
+class DocumentUploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for starting and tracking a resumable upload"""
+    class Meta:
+        model = DocumentUpload
+        fields = ['id', 'name', 'size', 'sha256', 'received_bytes', 'status', 'document']
+        read_only_fields = ['id', 'received_bytes', 'status', 'document']
+
+    def validate_name(self, name):
+        # Only the file name is kept, never a client supplied path
+        name = default_storage.get_valid_name(
+            PurePosixPath(name.replace('\\', '/')).name
+        )
+        if name.rsplit('.', 1)[-1].lower() != 'pdf':
+            raise serializers.ValidationError("Only PDF files are allowed.")
+        return name
+
+    def validate_size(self, size):
+        if size <= 0 or size > settings.DOCUMENT_UPLOAD_MAX_BYTES:
+            raise serializers.ValidationError("Invalid file size.")
+        return size
+
+    def validate_sha256(self, sha256):
+        sha256 = sha256.lower()
+        if sha256 and (
+            len(sha256) != 64
+            or any(c not in '0123456789abcdef' for c in sha256)
+        ):
+            raise serializers.ValidationError("Invalid SHA-256 digest.")
+        return sha256
+
+    def create(self, validated_data):
+        request = self.context['request']
+        project = self.context['project']
+        if request is None or project is None:
+            raise serializers.ValidationError("Missing request or project context.")
+
+        upload = DocumentUpload(
+            project=project,
+            uploaded_by=request.user,
+            **validated_data
+        )
+        upload.file_path = create_upload_file(upload, document_upload_path)
+        upload.save()
+        return upload
+
+
 class DocumentListSerializer(serializers.ModelSerializer):
     """Serializer for listing documents"""
     class Meta:
@@ -84,6 +218,7 @@ class ProjectDetailSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'description',
+            'vector_precision',
             'created_at',
             'updated_at'
         ]
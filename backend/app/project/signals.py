@@ -0,0 +1,48 @@
+"""
+Keep the collection version and the vector stores in sync with the
+project documents
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Project,
+    Document
+)
+from .utils.retrieval_cache import bump_collection_version
+
+
+@receiver(post_delete, sender=Document)
+def bump_version_on_document_deleted(sender, instance, **kwargs):
+    """
+    Cached searches may return the removed document. Once committed, the
+    version of a project deleted along with its documents is left alone.
+    """
+    project_id = instance.project_id
+    transaction.on_commit(lambda: bump_collection_version(project_id))
+
+
+@receiver(post_delete, sender=Document)
+def delete_document_vectors(sender, instance, **kwargs):
+    """Remove the chunks of the deleted document in the background"""
+    from .tasks import delete_document_vectors_task
+
+    # The instance loses its pk once deleted
+    args = (instance.project_id, instance.pk)
+
+    def schedule():
+        # A deleted project's directory goes as a whole, see below
+        if Project.objects.filter(pk=args[0]).exists():
+            delete_document_vectors_task.delay(*args)
+
+    transaction.on_commit(schedule)
+
+
+@receiver(post_delete, sender=Project)
+def delete_project_vectors(sender, instance, **kwargs):
+    """Remove the vector directory of the deleted project in the background"""
+    from .tasks import delete_project_vectors_task
+
+    project_id = instance.pk
+    transaction.on_commit(lambda: delete_project_vectors_task.delay(project_id))
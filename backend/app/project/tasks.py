@@ -1,83 +1,359 @@
+import shutil
+
 from celery import shared_task
+from celery.signals import (
+    worker_process_init,
+    worker_process_shutdown
+)
 from django.conf import settings
-from django.utils import timezone
+from redis.exceptions import LockNotOwnedError
 from .models import(
+    Project,
     Document
 )
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+from chat.answer_cache import invalidate_answers
+from .utils.embeddings import (
+    warm_embedding_models,
+    batch_by_tokens
+)
+from .utils.loaders import iter_chunks
+from .utils.hashing import file_sha256
+from .utils.uploads import delete_stale_uploads
+from .utils.embedding_cache import (
+    evict_embedding_cache,
+    get_cache_stats
+)
+from .utils.vector_store import (
+    registry,
+    get_project_store,
+    close_project_stores,
+    delete_project_vectors,
+    compact_project_vectors,
+    get_project_vector_path,
+    orphan_vector_dirs
+)
+from .utils.retrieval_cache import bump_collection_version
+from .utils.locks import (
+    project_write_lock,
+    release_lock
+)
 
 import logging
 
 log = logging.getLogger(__name__)
-from pathlib import Path
 
 
-@shared_task(bind=True)
-def process_document_task(self, doc_id: int):
+@worker_process_init.connect
+def warm_worker_embedding_models(**kwargs):
+    """Load the embedding models as soon as a worker process starts"""
+    warm_embedding_models()
+
+
+@worker_process_shutdown.connect
+def close_worker_vector_stores(**kwargs):
+    """Close the vector stores opened by this worker process"""
+    close_project_stores()
+
+
+def get_splitter():
+    """Splitter of the documents into chunks, as configured"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP
+    )
+
+
+def write_document_chunks(doc, store, splitter):
+    """
+    Load, split, embed and write the chunks of `doc` to `store`, streaming
+    one page at a time. A file already indexed in the collection is not
+    read again, `doc` references its chunks. Returns the number of chunks.
+    """
+    chunks_count = store.reuse_document(doc.id, doc.content_hash)
+    if chunks_count is not None:
+        return chunks_count
+
+    # Prepare loader based on extension
+    path = doc.file.path
+    loader = (
+        PyPDFLoader(path) 
+        if path.lower().endswith('.pdf')
+        else TextLoader(path)
+    )
+    pages = loader.lazy_load()
+
+    # Chunk, pages are only read as the chunks get consumed below
+    chunks = iter_chunks(pages, splitter)
+
+    # Each micro-batch is written as soon as it is encoded so the
+    # pipeline goes load page -> split -> embed -> upsert
+    # Metadata retrieval can be scoped by, see chat.rag.scope_filter
+    metadata = {
+        'document_id': doc.id,
+        'content_hash': doc.content_hash,
+        'uploaded_at': int(doc.created_at.timestamp()),
+    }
+    chunks_count = 0
+    for batch in batch_by_tokens(chunks):
+        for chunk in batch:
+            chunk.metadata.update(metadata)
+            chunk.metadata.setdefault('page', 0)
+        store.add_chunks(doc.id, batch, start=chunks_count)
+        chunks_count += len(batch)
+    store.optimize()
+    store.complete_document(doc.id, doc.content_hash, chunks_count)
+    return chunks_count
+
+
+def ingest_document(doc):
     """
-    Celery task to:
+    Index a document into its project's vector store:
     1) Mark doc PROCCESING
-    2) Load & chunk
+    2) Load & chunk, streaming one page at a time
     3) embed & upsert into project's Chroma store
+    Files and text already indexed in the project (re-uploads, shared
+    boilerplate) are neither embedded nor stored again.
+    The caller must hold the project's write lock.
     """
-    log.info(f"Starting processing for doc {doc_id}")
-    try:
-        doc = Document.objects.get(pk=doc_id)
-        # 1) Mark as processing
-        doc.processing_status = Document.ProcessingStatus.PROCESSING
-        doc.save(update_fields=['processing_status'])
-
-        # Prepare loader based on extension
-        path = doc.file.path
-        loader = (
-            PyPDFLoader(path) 
-            if path.lower().endswith('.pdf')
-            else TextLoader(path)
-        )
-        pages = loader.load()
-
-        # 2) Chunk
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_documents(pages)
-
-        # 3) Embedding & Chroma upsert
-        # Ensure chroma db exists
-        coll_name = doc.project.chroma_collection
-        if not coll_name:
-            coll_name = f"proj_{doc.project.id}_{timezone.now().timestamp():.0f}"
-            doc.project.chroma_collection = coll_name
-            doc.project.save(update_fields=["chroma_collection"])
-        
-        vectordir = Path(settings.CHROMA_ROOT) / "projects" / str(doc.project.id)
-        vectordir.mkdir(parents=True, exist_ok=True)
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        store = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=str(vectordir),
-            collection_name=coll_name
+    doc_id = doc.id
+    # 1) Mark as processing
+    doc.processing_status = Document.ProcessingStatus.PROCESSING
+    doc.save(update_fields=['processing_status'])
+
+    if not doc.content_hash:
+        doc.content_hash = file_sha256(doc.file)
+        doc.save(update_fields=['content_hash'])
+
+    # 2) Ensure the project has a collection
+    coll_name = registry.assign_collection(doc.project)
+
+    # 3) Load, chunk, embed & upsert into the project's open store
+    store = get_project_store(doc.project)
+    chunks_count = write_document_chunks(doc, store, get_splitter())
+
+    # 4) Finalize 
+    doc.chunks_count = chunks_count
+    doc.processing_status = Document.ProcessingStatus.COMPLETED
+    doc.save(update_fields=["chunks_count", "processing_status"])
+    # Cached searches of the project no longer see every chunk
+    bump_collection_version(doc.project_id)
+
+    if settings.EMBEDDING_CACHE_MAX_ENTRIES:
+        evict_embedding_cache(settings.EMBEDDING_CACHE_MAX_ENTRIES)
+
+    return {
+        'document_id': doc_id,
+        'chunks_processed': chunks_count,
+        'collection': coll_name,
+        'embedding_cache': get_cache_stats()
+    }
+
+
+class ProjectBusy(Exception):
+    """The project's write lock stayed taken through every retry"""
+
+
+def retry_when_busy(task, project_id):
+    """
+    Requeue `task`, another worker holds the write lock of the project.
+    The delay doubles with every retry up to INGESTION_RETRY_MAX_DELAY,
+    ProjectBusy is raised once INGESTION_MAX_RETRIES retries are spent.
+    """
+    retries = task.request.retries
+    if retries >= settings.INGESTION_MAX_RETRIES:
+        raise ProjectBusy(
+            f"Project {project_id} still busy after {retries} retries"
         )
+    raise task.retry(
+        countdown=min(
+            settings.INGESTION_RETRY_DELAY * 2 ** retries,
+            settings.INGESTION_RETRY_MAX_DELAY
+        ),
+        max_retries=settings.INGESTION_MAX_RETRIES
+    )
 
-        # 4) Finalize 
-        doc.chunks_count = len(chunks)
-        doc.processing_status = Document.ProcessingStatus.COMPLETED
-        doc.save(update_fields=["chunks_count", "processing_status"])
 
-        return {
-            'document_id': doc_id,
-            'chunks_processed': len(chunks),
-            'collection': coll_name
-        }
+@shared_task(bind=True, acks_late=True)
+def process_document_task(self, doc_id: int):
+    """
+    Celery task to index a single document.
+    Runs on the ingestion queue. Only one worker writes to a project's
+    vector store at a time, when the project is busy the task goes back to
+    the end of the queue so documents of other projects are not held up
+    behind a bulk upload.
+    """
+    log.info(f"Starting processing for doc {doc_id}")
+    doc = Document.objects.select_related('project').get(pk=doc_id)
+
+    lock = project_write_lock(doc.project_id)
+    if not lock.acquire(blocking=False):
+        log.info(f"Project {doc.project_id} busy, requeueing doc {doc_id}")
+        try:
+            retry_when_busy(self, doc.project_id)
+        except ProjectBusy:
+            mark_failed(doc)
+            raise
 
-    except Exception as e:
+    try:
+        return ingest_document(doc)
+    except Exception:
         # mark failure
-        log.exception(f"Error processing doc {doc_id}")
-        doc.processing_status = Document.ProcessingStatus.FAILED
-        doc.save(update_fields=["processing_status"])
+        mark_failed(doc)
         # re-raise so celery knows it failed
-        raise 
\ No newline at end of file
+        raise
+    finally:
+        release_lock(lock)
+
+
+@shared_task(bind=True, acks_late=True)
+def process_documents_task(self, doc_ids: list):
+    """
+    Celery task to index a group of documents of the same project.
+    The whole group shares one project lock, embedding model and store
+    handle. A failing document is marked FAILED without stopping the rest.
+    """
+    docs = list(
+        Document.objects.select_related('project')
+        .filter(pk__in=doc_ids)
+        .order_by('pk')
+    )
+    if not docs:
+        return []
+    project_id = docs[0].project_id
+    log.info(f"Starting processing for {len(docs)} docs of project {project_id}")
+
+    lock = project_write_lock(project_id)
+    if not lock.acquire(blocking=False):
+        log.info(f"Project {project_id} busy, requeueing docs {doc_ids}")
+        try:
+            retry_when_busy(self, project_id)
+        except ProjectBusy:
+            for doc in docs:
+                mark_failed(doc)
+            raise
+
+    results = []
+    try:
+        for n, doc in enumerate(docs):
+            try:
+                results.append(ingest_document(doc))
+            except Exception as e:
+                mark_failed(doc)
+                results.append({'document_id': doc.id, 'error': str(e)})
+            # Keep the lock alive for the rest of the group
+            try:
+                lock.reacquire()
+            except LockNotOwnedError:
+                # The lock expired and may be held by another worker now,
+                # the rest of the group waits for its own turn
+                remaining = [other.id for other in docs[n + 1:]]
+                if remaining:
+                    log.warning(
+                        f"Lock of project {project_id} expired, "
+                        f"requeueing docs {remaining}"
+                    )
+                    process_documents_task.delay(remaining)
+                break
+    finally:
+        release_lock(lock)
+    return results
+
+
+@shared_task(bind=True, acks_late=True)
+def delete_document_vectors_task(self, project_id: int, doc_id: int):
+    """
+    Celery task removing the chunks of a deleted document from the
+    project's collection and lexical index. Chunks other documents still
+    use, e.g. other copies of the same file, are kept.
+    """
+    project = Project.objects.filter(pk=project_id).first()
+    if project is None or not project.chroma_collection:
+        # Nothing indexed, or the project task removes the whole directory
+        return 0
+
+    lock = project_write_lock(project_id)
+    if not lock.acquire(blocking=False):
+        retry_when_busy(self, project_id)
+    try:
+        ids = get_project_store(project).delete_document(doc_id)
+        bump_collection_version(project_id)
+        # Answers cached since the document row went may quote its chunks
+        invalidate_answers(project_id)
+        log.info(f"Deleted {len(ids)} chunks of doc {doc_id}")
+        return len(ids)
+    finally:
+        release_lock(lock)
+
+
+@shared_task(bind=True, acks_late=True)
+def delete_project_vectors_task(self, project_id: int):
+    """Celery task removing the vector directory of a deleted project"""
+    lock = project_write_lock(project_id)
+    if not lock.acquire(blocking=False):
+        retry_when_busy(self, project_id)
+    try:
+        delete_project_vectors(project_id)
+    finally:
+        release_lock(lock)
+
+
+@shared_task
+def compact_vector_stores_task():
+    """
+    Periodic task reclaiming the disk space of deleted vectors.
+    Vacuums the stores of every project not being written to and removes
+    the directories left behind by deleted projects.
+    """
+    project_ids = list(Project.objects.values_list('pk', flat=True))
+    compacted = []
+    for project_id in project_ids:
+        if not get_project_vector_path(project_id).exists():
+            continue
+        lock = project_write_lock(project_id)
+        if not lock.acquire(blocking=False):
+            # Busy, it will be compacted on the next run
+            continue
+        try:
+            compact_project_vectors(project_id)
+            compacted.append(project_id)
+        except Exception:
+            log.exception(f"Error compacting vectors of project {project_id}")
+        finally:
+            release_lock(lock)
+
+    removed = []
+    for path in orphan_vector_dirs(project_ids):
+        if not path.name.isdigit():
+            log.warning(f"Unexpected directory {path} among the project vectors")
+            continue
+        project_id = int(path.name)
+        lock = project_write_lock(project_id)
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            # The project may have been created since it was listed
+            if Project.objects.filter(pk=project_id).exists():
+                continue
+            log.info(f"Removing orphan vector directory {path}")
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path.name)
+        finally:
+            release_lock(lock)
+    return {'compacted': compacted, 'removed': removed}
+
+
+@shared_task
+def cleanup_uploads_task():
+    """Periodic task removing the resumable uploads abandoned by clients"""
+    return delete_stale_uploads(settings.DOCUMENT_UPLOAD_EXPIRY)
+
+
+def mark_failed(doc):
+    """Log the current exception and mark the document FAILED"""
+    log.exception(f"Error processing doc {doc.id}")
+    doc.processing_status = Document.ProcessingStatus.FAILED
+    doc.save(update_fields=["processing_status"])
+    # Chunks written before the failure are searchable
+    bump_collection_version(doc.project_id)
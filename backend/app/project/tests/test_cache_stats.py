@@ -0,0 +1,58 @@
+"""
+Tests for the cache hit/miss counters
+"""
+from django.test import TestCase, override_settings
+
+from project.models import CacheCounter
+from project.utils.cache_stats import CacheStats
+
+
+class CacheStatsTests(TestCase):
+    """Test counts are kept per process and shared through the table"""
+
+    def setUp(self):
+        self.stats = CacheStats("test", hits=("local_hits", "redis_hits"))
+
+    @override_settings(CACHE_STATS_FLUSH_INTERVAL=60)
+    def test_counts_saved_on_flush(self):
+        self.stats.record(local_hits=2, misses=1)
+
+        self.assertFalse(CacheCounter.objects.exists())
+        self.assertEqual(self.stats.get(), {
+            "local_hits": 2, "redis_hits": 0, "misses": 1, "hit_rate": 2 / 3
+        })
+
+        self.stats.flush()
+        self.stats.flush()
+
+        self.assertEqual(
+            CacheCounter.objects.get(cache="test", key="local_hits").value, 2
+        )
+
+    @override_settings(CACHE_STATS_FLUSH_INTERVAL=0)
+    def test_totals_add_up_processes(self):
+        other = CacheStats("test", hits=("local_hits", "redis_hits"))
+        self.stats.record(local_hits=1)
+        other.record(redis_hits=1, misses=2)
+
+        totals = self.stats.totals()
+
+        self.assertEqual(totals, {
+            "local_hits": 1, "redis_hits": 1, "misses": 2, "hit_rate": 0.5
+        })
+        self.assertEqual(self.stats.get()["misses"], 0)
+
+    def test_totals_by_scope(self):
+        self.stats.record(scope=1, local_hits=1)
+        self.stats.record(scope=2, misses=3)
+
+        self.assertEqual(self.stats.totals(scope=1)["hit_rate"], 1.0)
+        self.assertEqual(self.stats.totals()["misses"], 3)
+
+    def test_reset(self):
+        self.stats.record(misses=1)
+        self.stats.flush()
+
+        self.stats.reset()
+
+        self.assertEqual(self.stats.totals()["misses"], 0)
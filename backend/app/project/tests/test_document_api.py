@@ -1,12 +1,14 @@
 """
 Tests for the Document model API
 """
-from unittest.mock import patch, MagicMock
-from django.test import TestCase
+from unittest.mock import patch, MagicMock, ANY
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
 
 from project.models import Project
 
@@ -16,14 +18,26 @@ from rest_framework import status
 from ..models import (
     Project,
     Document,
+    DocumentUpload,
 ) 
 from django.core.files.uploadedfile import SimpleUploadedFile
+from celery.exceptions import Retry
+from redis.exceptions import LockNotOwnedError
 
 from ..serializers import DocumentListSerializer
 import tempfile
+import hashlib
+import io
+import zipfile
 from pathlib import Path
 import shutil
-from project.tasks import process_document_task
+from project.tasks import (
+    ProjectBusy,
+    cleanup_uploads_task,
+    process_document_task,
+    process_documents_task
+)
+from project.utils.vector_store import close_project_stores
 
 
 User = get_user_model()
@@ -39,6 +53,21 @@ def project_document_download_url(project_id, doc_id):
         args=[project_id, doc_id]
     )
 
+def get_bulk_upload_url(project_id):
+    """Generate URL for uploading many documents at once"""
+    return reverse('project:project-documents-bulk-upload', args=[project_id])
+
+def get_uploads_url(project_id):
+    """Generate URL for starting a resumable upload"""
+    return reverse('project:project-documents-start-upload', args=[project_id])
+
+def get_upload_url(project_id, upload_id, action='upload-detail'):
+    """Generate URL for an action on a resumable upload"""
+    return reverse(
+        f'project:project-documents-{action}',
+        args=[project_id, upload_id]
+    )
+
 def get_document_detail_url(project_id, doc_id):
     """Generate URL for document details"""
     return reverse('project:project-documents-detail', 
@@ -78,7 +107,17 @@ class DocumentModelTest(TestCase):
             description="Test project description",
             user=self.user
         )
-    
+        # No redis during tests, the project write lock is always free
+        lock_patcher = patch('project.tasks.project_write_lock')
+        self.mock_write_lock = lock_patcher.start()
+        self.mock_write_lock.return_value.acquire.return_value = True
+        self.addCleanup(lock_patcher.stop)
+
+    def tearDown(self):
+        """Close and remove the vector stores opened by the test"""
+        close_project_stores()
+        shutil.rmtree(Path(settings.CHROMA_ROOT) / "projects", ignore_errors=True)
+
     @classmethod
     def tearDownClass(cls):
         """Clean up temporary media folder and restore original settings."""
@@ -114,6 +153,10 @@ class DocumentModelTest(TestCase):
         self.assertEqual(doc.processing_status, Document.ProcessingStatus.PENDING)
         self.assertEqual(doc.uploaded_by, self.user)
         self.assertEqual(doc.project, self.project)
+        self.assertEqual(
+            doc.content_hash,
+            hashlib.sha256(pdf_content).hexdigest()
+        )
     
     def test_invalid_file_upload(self):
         """Test non-PDF files are rejected"""
@@ -302,14 +345,18 @@ class DocumentModelTest(TestCase):
         self.assertEqual(Document.objects.count(), 0)
         mock_delay.assert_not_called()
     
+    @patch('project.utils.vector_store.get_embedding_model')
     @patch('project.tasks.PyPDFLoader')
     @patch('project.tasks.RecursiveCharacterTextSplitter')
-    @patch('project.tasks.Chroma')
+    @patch('project.utils.vector_backends.chromadb')
+    @patch('project.utils.vector_backends.Chroma')
     def test_process_document_task_success(
         self,
         mock_chroma,
+        mock_chromadb,
         mock_splitter_cls,
         mock_pdfloader_cls,
+        mock_get_embedding_model,
     ):
         """
         Running process_document_task on a valid document should:
@@ -317,6 +364,7 @@ class DocumentModelTest(TestCase):
             - mark status COMPLETED
             - set correct chunks_count
             - create the chroma folder in CHROMA_ROOT
+            - append the chunks with stable ids to the project store
         """
         # 1) Create a dummy Document
         #    Use a small pdf file so PyPDFLoader/TextLoader behave the same
@@ -334,29 +382,21 @@ class DocumentModelTest(TestCase):
         )
         self.assertEqual(doc.processing_status, Document.ProcessingStatus.PENDING)
 
-        # 2) Stub loader.load() → single-page list
-        fake_page = MagicMock()
+        # 2) Stub loader.lazy_load() → single-page stream
+        fake_page = MagicMock(page_content='A B C', metadata={'page': 0})
         mock_pdfloader = mock_pdfloader_cls.return_value
-        mock_pdfloader.load.return_value = [fake_page]
+        mock_pdfloader.lazy_load.return_value = iter([fake_page])
 
-        # 3) Stub splitter.split_documents() -> 3 fake chunks
-        fake_chunks = [
-            MagicMock(page_content='A'),
-            MagicMock(page_content='B'),
-            MagicMock(page_content='C')
-        ]
+        # 3) Stub splitter.split_text() -> 3 fake chunks
+        fake_chunks = ['A', 'B', 'C']
         mock_splitter = mock_splitter_cls.return_value
-        mock_splitter.split_documents.return_value = fake_chunks
-
-        # 4) Stub Chroma.from_documents() -> fake store
-        fake_store = MagicMock()
-        mock_chroma.from_documents.return_value = fake_store
+        mock_splitter.split_text.return_value = fake_chunks
 
-        # 5) Call the task in a comitted transaction
+        # 4) Call the task in a comitted transaction
         with transaction.atomic():
             process_document_task(doc.id)
         
-        # 6) Refresh from DB and project
+        # 5) Refresh from DB and project
         doc.refresh_from_db()
         self.project.refresh_from_db()
 
@@ -368,20 +408,123 @@ class DocumentModelTest(TestCase):
         
         # Project chroma_collection must be now set
         self.assertTrue(self.project.chroma_collection)
+        # Cached searches of the previous content are invalidated
+        self.assertEqual(self.project.collection_version, 1)
 
         # The Chroma folder on disk must exist
         vectordir = Path(settings.CHROMA_ROOT) / f"projects/{self.project.id}"
         self.assertTrue(vectordir.exists(), f"{vectordir} missing")
 
-        # Check from_documents was called with our fake_chunks
-        mock_chroma.from_documents.assert_called_once()
-    
-    @patch('project.tasks.RecursiveCharacterTextSplitter.split_documents')
+        # The store is opened on the project collection with the shared model
+        mock_chroma.assert_called_once_with(
+            client=mock_chromadb.PersistentClient.return_value,
+            collection_name=self.project.chroma_collection,
+            embedding_function=ANY
+        )
+        embedding = mock_chroma.call_args.kwargs['embedding_function']
+        self.assertIs(embedding.embeddings, mock_get_embedding_model.return_value)
+        # Only this document's chunks are appended, with stable ids
+        mock_chroma.return_value.add_documents.assert_called_once()
+        call = mock_chroma.return_value.add_documents.call_args
+        self.assertEqual(
+            [chunk.page_content for chunk in call.args[0]],
+            fake_chunks
+        )
+        self.assertEqual(
+            call.kwargs['ids'],
+            [f"doc_{doc.id}_chunk_{n}" for n in range(3)]
+        )
+        # Chunks carry the metadata retrieval can be scoped by
+        metadata = call.args[0][0].metadata
+        self.assertEqual(metadata['document_id'], doc.id)
+        self.assertEqual(metadata['content_hash'], doc.content_hash)
+        self.assertEqual(metadata['uploaded_at'], int(doc.created_at.timestamp()))
+        self.assertEqual(metadata['page'], 0)
+
+    @patch('project.utils.vector_store.get_embedding_model')
+    @patch('project.tasks.PyPDFLoader')
+    @patch('project.tasks.RecursiveCharacterTextSplitter')
+    @patch('project.utils.vector_backends.chromadb')
+    @patch('project.utils.vector_backends.Chroma')
+    def test_process_document_task_reuses_store(
+        self,
+        mock_chroma,
+        mock_chromadb,
+        mock_splitter_cls,
+        mock_pdfloader_cls,
+        mock_get_embedding_model,
+    ):
+        """Documents of the same project share one open store"""
+        mock_pdfloader_cls.return_value.lazy_load.side_effect = lambda: iter([
+            MagicMock(page_content='A', metadata={'page': 0})
+        ])
+        mock_splitter_cls.return_value.split_text.side_effect = [['A'], ['B']]
+        docs = [
+            Document.objects.create(
+                project=self.project,
+                uploaded_by=self.user,
+                name=f'foo{n}.pdf',
+                file=SimpleUploadedFile(f'foo{n}.pdf', f'content {n}'.encode()),
+                file_size=7,
+                content_type='application/pdf',
+            )
+            for n in range(2)
+        ]
+
+        for doc in docs:
+            process_document_task(doc.id)
+
+        mock_chromadb.PersistentClient.assert_called_once()
+        mock_chroma.assert_called_once()
+        self.assertEqual(mock_chroma.return_value.add_documents.call_count, 2)
+
+    @patch('project.utils.vector_store.get_embedding_model')
+    @patch('project.tasks.PyPDFLoader')
+    @patch('project.tasks.RecursiveCharacterTextSplitter')
+    @patch('project.utils.vector_backends.chromadb')
+    @patch('project.utils.vector_backends.Chroma')
+    def test_reupload_is_not_loaded_again(
+        self,
+        mock_chroma,
+        mock_chromadb,
+        mock_splitter_cls,
+        mock_pdfloader_cls,
+        mock_get_embedding_model,
+    ):
+        """A file already indexed in the project only adds references"""
+        mock_pdfloader_cls.return_value.lazy_load.side_effect = lambda: iter([
+            MagicMock(page_content='A B', metadata={'page': 0})
+        ])
+        mock_splitter_cls.return_value.split_text.return_value = ['A', 'B']
+        docs = [
+            Document.objects.create(
+                project=self.project,
+                uploaded_by=self.user,
+                name=f'foo{n}.pdf',
+                file=SimpleUploadedFile(f'foo{n}.pdf', b'same content'),
+                file_size=12,
+                content_type='application/pdf',
+            )
+            for n in range(2)
+        ]
+
+        for doc in docs:
+            process_document_task(doc.id)
+
+        mock_pdfloader_cls.assert_called_once()
+        mock_chroma.return_value.add_documents.assert_called_once()
+        docs[1].refresh_from_db()
+        self.assertEqual(docs[1].chunks_count, 2)
+        self.assertEqual(docs[1].processing_status, Document.ProcessingStatus.COMPLETED)
+
+    @patch('project.tasks.get_project_store')
+    @patch('project.tasks.RecursiveCharacterTextSplitter.split_text')
     @patch('project.tasks.PyPDFLoader')
     def test_process_document_task_failure(
             self,
             mock_pdfloader_cls,
-            mock_split_documents,
+            mock_split_text,
+            mock_get_project_store,
     ):
         """
         If chunking blows up, the task should mark the doc as FAILED
@@ -399,10 +542,13 @@ class DocumentModelTest(TestCase):
             content_type='application/pdf',
         )
         self.assertEqual(doc.processing_status, Document.ProcessingStatus.PENDING)
-        # Stub loader.load() → valid page, but splitter errors
+        # Stub loader.lazy_load() → valid page, but splitter errors
         mock_pdfloader = mock_pdfloader_cls.return_value
-        mock_pdfloader.load.return_value = ['page1']
-        mock_split_documents.side_effect = RuntimeError("split boom")
+        mock_pdfloader.lazy_load.return_value = iter([
+            MagicMock(page_content='page1', metadata={})
+        ])
+        mock_split_text.side_effect = RuntimeError("split boom")
+        mock_get_project_store.return_value.reuse_document.return_value = None
         
         # now run the task under a transaction so that our DB writes get committed
         with self.assertRaises(RuntimeError):
@@ -413,4 +559,595 @@ class DocumentModelTest(TestCase):
         self.assertEqual(
             doc.processing_status,
             Document.ProcessingStatus.FAILED
-        )
\ No newline at end of file
+        )
+    @patch('project.tasks.get_project_store')
+    @patch('project.tasks.write_document_chunks')
+    def test_process_duplicate_document_gets_own_chunks(
+        self,
+        mock_write_chunks,
+        mock_get_project_store,
+    ):
+        """A re-upload of an indexed file is indexed as its own document"""
+        content = b"same content"
+        Document.objects.create(
+            project=self.project,
+            uploaded_by=self.user,
+            name='original.pdf',
+            file=SimpleUploadedFile('original.pdf', content),
+            file_size=len(content),
+            content_type='application/pdf',
+            content_hash=hashlib.sha256(content).hexdigest(),
+            processing_status=Document.ProcessingStatus.COMPLETED,
+            chunks_count=4,
+        )
+        copy = Document.objects.create(
+            project=self.project,
+            uploaded_by=self.user,
+            name='copy.pdf',
+            file=SimpleUploadedFile('copy.pdf', content),
+            file_size=len(content),
+            content_type='application/pdf',
+        )
+        mock_write_chunks.return_value = 4
+
+        result = process_document_task(copy.id)
+
+        copy.refresh_from_db()
+        self.assertEqual(result['chunks_processed'], 4)
+        self.assertEqual(copy.content_hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(copy.chunks_count, 4)
+        self.assertEqual(copy.processing_status, Document.ProcessingStatus.COMPLETED)
+        written = mock_write_chunks.call_args.args[0]
+        self.assertEqual(written.pk, copy.pk)
+        self.assertIs(mock_write_chunks.call_args.args[1], mock_get_project_store.return_value)
+
+    @patch('project.tasks.ingest_document')
+    def test_process_document_task_holds_project_lock(self, mock_ingest):
+        """Ingestion runs under the project's write lock"""
+        doc = Document.objects.create(
+            project=self.project,
+            uploaded_by=self.user,
+            name='foo.pdf',
+            file='projects/project1/documents/foo.pdf',
+            file_size=3,
+            content_type='application/pdf',
+        )
+
+        process_document_task(doc.id)
+
+        self.mock_write_lock.assert_called_once_with(self.project.id)
+        lock = self.mock_write_lock.return_value
+        lock.acquire.assert_called_once_with(blocking=False)
+        mock_ingest.assert_called_once_with(doc)
+        lock.release.assert_called_once()
+
+    @patch('project.tasks.ingest_document')
+    def test_process_document_task_retries_when_project_busy(self, mock_ingest):
+        """A document of a busy project is requeued instead of waiting"""
+        self.mock_write_lock.return_value.acquire.return_value = False
+        doc = Document.objects.create(
+            project=self.project,
+            uploaded_by=self.user,
+            name='foo.pdf',
+            file='projects/project1/documents/foo.pdf',
+            file_size=3,
+            content_type='application/pdf',
+        )
+
+        with self.assertRaises(Retry):
+            process_document_task(doc.id)
+
+        mock_ingest.assert_not_called()
+        self.mock_write_lock.return_value.release.assert_not_called()
+        doc.refresh_from_db()
+        self.assertEqual(doc.processing_status, Document.ProcessingStatus.PENDING)
+
+    @override_settings(INGESTION_RETRY_DELAY=5, INGESTION_RETRY_MAX_DELAY=60,
+                       INGESTION_MAX_RETRIES=10)
+    @patch('project.tasks.ingest_document')
+    def test_busy_project_retries_back_off(self, mock_ingest):
+        """The retry delay doubles, and the document fails once retries run out"""
+        self.mock_write_lock.return_value.acquire.return_value = False
+        doc = Document.objects.create(
+            project=self.project,
+            uploaded_by=self.user,
+            name='foo.pdf',
+            file='projects/project1/documents/foo.pdf',
+            file_size=3,
+            content_type='application/pdf',
+        )
+
+        with patch.object(process_document_task, 'retry', side_effect=Retry) as mock_retry:
+            for retries in (0, 3, 9):
+                process_document_task.apply(args=(doc.id,), retries=retries)
+        self.assertEqual(
+            [call.kwargs['countdown'] for call in mock_retry.call_args_list],
+            [5, 40, 60]
+        )
+
+        result = process_document_task.apply(args=(doc.id,), retries=10)
+
+        self.assertIsInstance(result.result, ProjectBusy)
+        mock_ingest.assert_not_called()
+        doc.refresh_from_db()
+        self.assertEqual(doc.processing_status, Document.ProcessingStatus.FAILED)
+
+    @patch('project.views.transaction.on_commit', lambda cb: cb())
+    @patch('project.views.process_documents_task.delay')
+    def test_bulk_upload_documents(self, mock_delay):
+        """Many PDFs are stored in one request and indexed by one job"""
+        files = [
+            SimpleUploadedFile(
+                f'doc{n}.pdf',
+                f'%PDF-1.4 doc {n}'.encode(),
+                content_type='application/pdf'
+            )
+            for n in range(3)
+        ]
+        url = get_bulk_upload_url(self.project.id)
+        res = self.client.post(url, {'files': files}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        docs = Document.objects.filter(project=self.project).order_by('id')
+        self.assertEqual([doc.name for doc in docs], ['doc0.pdf', 'doc1.pdf', 'doc2.pdf'])
+        for n, doc in enumerate(docs):
+            self.assertEqual(doc.uploaded_by, self.user)
+            self.assertEqual(doc.file.read(), f'%PDF-1.4 doc {n}'.encode())
+            self.assertTrue(doc.content_hash)
+        mock_delay.assert_called_once_with([doc.id for doc in docs])
+
+    @patch('project.views.transaction.on_commit', lambda cb: cb())
+    @patch('project.views.process_documents_task.delay')
+    def test_bulk_upload_zip_archive(self, mock_delay):
+        """PDFs inside a zip archive are extracted, other members ignored"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('manuals/a.pdf', b'%PDF-1.4 a')
+            archive.writestr('b.pdf', b'%PDF-1.4 b')
+            archive.writestr('notes.txt', b'not a pdf')
+            archive.writestr('__MACOSX/._a.pdf', b'junk')
+        upload = SimpleUploadedFile(
+            'docs.zip', buffer.getvalue(), content_type='application/zip'
+        )
+
+        url = get_bulk_upload_url(self.project.id)
+        res = self.client.post(url, {'files': [upload]}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        docs = Document.objects.filter(project=self.project).order_by('id')
+        self.assertEqual([doc.name for doc in docs], ['a.pdf', 'b.pdf'])
+        self.assertEqual(docs[0].file_size, len(b'%PDF-1.4 a'))
+        self.assertEqual(docs[0].file.read(), b'%PDF-1.4 a')
+        mock_delay.assert_called_once()
+
+    @patch('project.views.process_documents_task.delay')
+    def test_bulk_upload_rejects_invalid_files(self, mock_delay):
+        """One invalid file rejects the whole upload"""
+        files = [
+            SimpleUploadedFile('ok.pdf', b'%PDF', content_type='application/pdf'),
+            SimpleUploadedFile('bad.jpg', b'GIF89a', content_type='image/jpeg'),
+        ]
+        url = get_bulk_upload_url(self.project.id)
+        res = self.client.post(url, {'files': files}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+        mock_delay.assert_not_called()
+
+    @patch('project.tasks.ingest_document')
+    def test_process_documents_task_continues_after_failure(self, mock_ingest):
+        """A failing document in a group does not stop the others"""
+        docs = [
+            Document.objects.create(
+                project=self.project,
+                uploaded_by=self.user,
+                name=f'foo{n}.pdf',
+                file=f'projects/project1/documents/foo{n}.pdf',
+                file_size=3,
+                content_type='application/pdf',
+            )
+            for n in range(3)
+        ]
+        mock_ingest.side_effect = [
+            {'document_id': docs[0].id},
+            RuntimeError("boom"),
+            {'document_id': docs[2].id},
+        ]
+
+        results = process_documents_task([doc.id for doc in docs])
+
+        self.assertEqual(mock_ingest.call_count, 3)
+        self.assertEqual(results[1], {'document_id': docs[1].id, 'error': 'boom'})
+        docs[1].refresh_from_db()
+        self.assertEqual(docs[1].processing_status, Document.ProcessingStatus.FAILED)
+        # A single lock covers the whole group
+        self.mock_write_lock.assert_called_once_with(self.project.id)
+        self.mock_write_lock.return_value.release.assert_called_once()
+
+
+    @patch('project.tasks.process_documents_task.delay')
+    @patch('project.tasks.ingest_document')
+    def test_process_documents_task_requeues_after_lock_expired(
+        self, mock_ingest, mock_delay
+    ):
+        """Documents left when the lock expired are indexed by a new task"""
+        docs = [
+            Document.objects.create(
+                project=self.project,
+                uploaded_by=self.user,
+                name=f'foo{n}.pdf',
+                file=f'projects/project1/documents/foo{n}.pdf',
+                file_size=3,
+                content_type='application/pdf',
+            )
+            for n in range(3)
+        ]
+        mock_ingest.side_effect = lambda doc: {'document_id': doc.id}
+        self.mock_write_lock.return_value.reacquire.side_effect = LockNotOwnedError
+
+        results = process_documents_task([doc.id for doc in docs])
+
+        self.assertEqual(results, [{'document_id': docs[0].id}])
+        mock_delay.assert_called_once_with([docs[1].id, docs[2].id])
+        docs[1].refresh_from_db()
+        self.assertEqual(docs[1].processing_status, Document.ProcessingStatus.PENDING)
+
+
+class ResumableUploadTests(TestCase):
+    """Test uploading a document in several parts"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._temp_media = tempfile.mkdtemp(prefix="test_media_")
+        cls._media_settings = override_settings(MEDIA_ROOT=cls._temp_media)
+        cls._media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._media_settings.disable()
+        shutil.rmtree(cls._temp_media, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='pass12345'
+        ) # type: ignore
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(
+            name="Test Project",
+            description="Test project description",
+            user=self.user
+        )
+        self.content = b'%PDF-1.4 ' + b'x' * 100
+
+    def start_upload(self, **params):
+        payload = {
+            'name': 'big.pdf',
+            'size': len(self.content),
+            'sha256': hashlib.sha256(self.content).hexdigest(),
+        }
+        payload.update(params)
+        res = self.client.post(get_uploads_url(self.project.id), payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def send_part(self, upload_id, offset, data, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum is not None:
+            headers['HTTP_UPLOAD_CHECKSUM'] = checksum
+        return self.client.put(
+            get_upload_url(self.project.id, upload_id, 'upload-part'),
+            data,
+            content_type='application/octet-stream',
+            **headers
+        )
+
+    def complete(self, upload_id):
+        return self.client.post(
+            get_upload_url(self.project.id, upload_id, 'complete-upload')
+        )
+
+    @patch('project.views.transaction.on_commit', lambda cb: cb())
+    @patch('project.views.process_document_task.delay')
+    def test_upload_in_parts(self, mock_delay):
+        """Parts are appended in place and completion creates the document"""
+        upload_id = self.start_upload()
+        upload = DocumentUpload.objects.get(pk=upload_id)
+        self.assertTrue(
+            upload.file_path.startswith(f'documents/project_{self.project.id}/')
+        )
+
+        first, second = self.content[:40], self.content[40:]
+        res = self.send_part(upload_id, 0, first, hashlib.sha256(first).hexdigest())
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['received_bytes'], 40)
+        res = self.send_part(upload_id, 40, second)
+        self.assertEqual(res.data['received_bytes'], len(self.content))
+
+        res = self.complete(upload_id)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        doc = Document.objects.get(pk=res.data['document'])
+        self.assertEqual(doc.file.name, upload.file_path)
+        self.assertEqual(doc.file.read(), self.content)
+        self.assertEqual(doc.file_size, len(self.content))
+        self.assertEqual(doc.content_hash, hashlib.sha256(self.content).hexdigest())
+        mock_delay.assert_called_once_with(doc.id)
+
+    def test_resume_after_wrong_offset(self):
+        """A part at the wrong offset is refused with the offset to resume from"""
+        upload_id = self.start_upload()
+        self.send_part(upload_id, 0, self.content[:40])
+
+        res = self.send_part(upload_id, 10, self.content[10:50])
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['received_bytes'], 40)
+
+        res = self.client.get(get_upload_url(self.project.id, upload_id))
+        self.assertEqual(res.data['received_bytes'], 40)
+
+    def test_part_checksum_mismatch_is_discarded(self):
+        """A corrupted part is rejected and not counted"""
+        upload_id = self.start_upload()
+
+        res = self.send_part(upload_id, 0, self.content[:40], checksum='0' * 64)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        upload = DocumentUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.received_bytes, 0)
+        self.assertEqual(Path(settings.MEDIA_ROOT, upload.file_path).stat().st_size, 0)
+
+    @patch('project.views.process_document_task.delay')
+    def test_complete_requires_all_parts(self, mock_delay):
+        """An incomplete upload can not be completed"""
+        upload_id = self.start_upload()
+        self.send_part(upload_id, 0, self.content[:40])
+
+        res = self.complete(upload_id)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+        mock_delay.assert_not_called()
+
+    @patch('project.views.process_document_task.delay')
+    def test_complete_checks_whole_file_hash(self, mock_delay):
+        """The file must match the SHA-256 declared when starting"""
+        upload_id = self.start_upload(sha256='a' * 64)
+        self.send_part(upload_id, 0, self.content)
+
+        res = self.complete(upload_id)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+
+    def test_part_past_declared_size_rejected(self):
+        """Parts can not grow the file past its declared size"""
+        upload_id = self.start_upload(size=10, sha256='')
+
+        res = self.send_part(upload_id, 0, self.content[:20])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_non_pdf_upload_rejected(self):
+        """Only PDF names are accepted when starting an upload"""
+        res = self.client.post(
+            get_uploads_url(self.project.id),
+            {'name': 'movie.mp4', 'size': 10}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_abort_upload(self):
+        """Aborting removes the partial file"""
+        upload_id = self.start_upload()
+        self.send_part(upload_id, 0, self.content[:40])
+        file_path = DocumentUpload.objects.get(pk=upload_id).file_path
+
+        res = self.client.delete(get_upload_url(self.project.id, upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(DocumentUpload.objects.exists())
+        self.assertFalse(Path(settings.MEDIA_ROOT, file_path).exists())
+
+    def test_upload_name_stripped_of_path(self):
+        """A client supplied path is not kept in the name"""
+        upload_id = self.start_upload(name='../../etc/cron.d\\my report.pdf')
+
+        upload = DocumentUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.name, 'my_report.pdf')
+        self.assertTrue(
+            upload.file_path.startswith(f'documents/project_{self.project.id}/')
+        )
+        self.assertNotIn('..', upload.file_path)
+
+    @override_settings(DOCUMENT_UPLOAD_EXPIRY=3600)
+    def test_stale_uploads_removed(self):
+        """Uploads without a part for longer than the expiry are removed"""
+        stale_id = self.start_upload()
+        self.send_part(stale_id, 0, self.content[:40])
+        active_id = self.start_upload()
+        stale = DocumentUpload.objects.get(pk=stale_id)
+        DocumentUpload.objects.filter(pk=stale_id).update(
+            updated_at=timezone.now() - timedelta(hours=2)
+        )
+
+        self.assertEqual(cleanup_uploads_task(), 1)
+
+        self.assertEqual(
+            list(DocumentUpload.objects.values_list('pk', flat=True)),
+            [active_id]
+        )
+        self.assertFalse(Path(settings.MEDIA_ROOT, stale.file_path).exists())
+
+    def test_other_users_upload_not_found(self):
+        """Uploads are private to the user who started them"""
+        upload_id = self.start_upload()
+        other = User.objects.create_user(
+            email='other@example.com',
+            password='pass12345'
+        ) # type: ignore
+        self.client.force_authenticate(other)
+
+        res = self.send_part(upload_id, 0, self.content)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DocumentDownloadTests(TestCase):
+    """Test conditional, range and sendfile downloads"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._temp_media = tempfile.mkdtemp(prefix="test_media_")
+        cls._media_settings = override_settings(MEDIA_ROOT=cls._temp_media)
+        cls._media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._media_settings.disable()
+        shutil.rmtree(cls._temp_media, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='pass12345'
+        ) # type: ignore
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(
+            name="Test Project",
+            description="Test project description",
+            user=self.user
+        )
+        self.content = b'%PDF-1.4 0123456789'
+        self.doc = Document.objects.create(
+            project=self.project,
+            uploaded_by=self.user,
+            name='manual.pdf',
+            file=SimpleUploadedFile('manual.pdf', self.content),
+            file_size=len(self.content),
+            content_type='application/pdf',
+            content_hash=hashlib.sha256(self.content).hexdigest(),
+        )
+        self.url = project_document_download_url(self.project.id, self.doc.id)
+
+    def test_full_download_has_validators(self):
+        """The whole file is sent with ETag, Last-Modified and Accept-Ranges"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['ETag'], f'"{self.doc.content_hash}"')
+        self.assertIn('Last-Modified', res)
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(res.streaming_content), self.content)
+
+    def test_range_request(self):
+        """A byte range is answered with 206 and only those bytes"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=9-13')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(res['Content-Range'], f'bytes 9-13/{len(self.content)}')
+        self.assertEqual(res['Content-Length'], '5')
+        self.assertEqual(b''.join(res.streaming_content), b'01234')
+
+    def test_open_and_suffix_ranges(self):
+        """Open ended and suffix ranges are supported"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=15-')
+        self.assertEqual(b''.join(res.streaming_content), b'6789')
+
+        res = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(res.streaming_content), b'789')
+
+    def test_unsatisfiable_range(self):
+        """A range past the end of the file is refused"""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=500-600')
+
+        self.assertEqual(res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(res['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_range_of_empty_file(self):
+        """No range of an empty file is satisfiable"""
+        empty = Document.objects.create(
+            project=self.project,
+            uploaded_by=self.user,
+            name='empty.pdf',
+            file=SimpleUploadedFile('empty.pdf', b''),
+            file_size=0,
+            content_type='application/pdf',
+        )
+        url = project_document_download_url(self.project.id, empty.id)
+
+        for header in ('bytes=0-', 'bytes=0-10', 'bytes=-5'):
+            res = self.client.get(url, HTTP_RANGE=header)
+
+            self.assertEqual(res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.assertEqual(res['Content-Range'], 'bytes */0')
+
+    def test_if_none_match(self):
+        """A cached copy with the same ETag is not sent again"""
+        etag = self.client.get(self.url)['ETag']
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_range_mismatch_sends_full_file(self):
+        """A stale If-Range validator gets the whole file"""
+        res = self.client.get(
+            self.url,
+            HTTP_RANGE='bytes=0-3',
+            HTTP_IF_RANGE='"stale"'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), self.content)
+
+    def test_if_range_match_sends_range(self):
+        """A current If-Range validator gets the range"""
+        res = self.client.get(
+            self.url,
+            HTTP_RANGE='bytes=0-3',
+            HTTP_IF_RANGE=f'"{self.doc.content_hash}"'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(res.streaming_content), b'%PDF')
+
+    @override_settings(
+        DOCUMENT_DOWNLOAD_SENDFILE='nginx',
+        DOCUMENT_DOWNLOAD_ACCEL_PREFIX='/protected/'
+    )
+    def test_accel_redirect(self):
+        """With nginx offloading, Django only authorizes the download"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'], f'/protected/{self.doc.file.name}')
+        self.assertEqual(res.content, b'')
+        self.assertIn('attachment;', res['Content-Disposition'])
+
+    @override_settings(DOCUMENT_DOWNLOAD_SENDFILE='apache')
+    def test_x_sendfile(self):
+        """With apache offloading the absolute path is sent"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res['X-Sendfile'], self.doc.file.path)
+        self.assertEqual(res.content, b'')
+
+    def test_other_user_cannot_download(self):
+        """Authorization still applies to ranged downloads"""
+        other = User.objects.create_user(
+            email='other@example.com',
+            password='pass12345'
+        ) # type: ignore
+        self.client.force_authenticate(other)
+
+        res = self.client.get(self.url, HTTP_RANGE='bytes=0-3')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
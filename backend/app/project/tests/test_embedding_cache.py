@@ -0,0 +1,83 @@
+"""
+Tests for the persistent embedding cache
+"""
+from unittest.mock import MagicMock
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+
+from project.models import EmbeddingCacheEntry
+from project.utils.hashing import text_sha256
+from project.utils.embedding_cache import (
+    CachedEmbeddings,
+    evict_embedding_cache,
+    get_cache_stats,
+    reset_cache_stats,
+)
+
+
+class CachedEmbeddingsTests(TestCase):
+    """Test vectors are read from and written to the cache table"""
+
+    def setUp(self):
+        reset_cache_stats()
+        self.model = MagicMock()
+        self.model.embed_documents.side_effect = lambda texts: [
+            [float(len(text)), 0.5] for text in texts
+        ]
+        self.embeddings = CachedEmbeddings(self.model, 'test/model')
+
+    def test_misses_are_encoded_and_stored(self):
+        """Unknown texts go to the model and are cached"""
+        vectors = self.embeddings.embed_documents(["abc", "de"])
+
+        self.assertEqual(vectors, [[3.0, 0.5], [2.0, 0.5]])
+        self.model.embed_documents.assert_called_once_with(["abc", "de"])
+        self.assertEqual(EmbeddingCacheEntry.objects.count(), 2)
+        self.assertEqual(get_cache_stats()["misses"], 2)
+
+    def test_hits_skip_the_model(self):
+        """Cached texts are not encoded again"""
+        self.embeddings.embed_documents(["abc"])
+        self.model.embed_documents.reset_mock()
+
+        vectors = self.embeddings.embed_documents(["abc", "xy"])
+
+        self.assertEqual(vectors, [[3.0, 0.5], [2.0, 0.5]])
+        self.model.embed_documents.assert_called_once_with(["xy"])
+        entry = EmbeddingCacheEntry.objects.get(text_hash=text_sha256("abc"))
+        self.assertEqual(entry.hits, 1)
+        stats = get_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertAlmostEqual(stats["hit_rate"], 1 / 3)
+
+    def test_cache_keyed_by_model(self):
+        """Vectors of another model are not reused"""
+        self.embeddings.embed_documents(["abc"])
+        other = CachedEmbeddings(self.model, 'other/model')
+
+        other.embed_documents(["abc"])
+
+        self.assertEqual(self.model.embed_documents.call_count, 2)
+
+    def test_repeated_text_encoded_once(self):
+        """Duplicates within a batch are encoded once"""
+        vectors = self.embeddings.embed_documents(["abc", "abc"])
+
+        self.assertEqual(vectors, [[3.0, 0.5], [3.0, 0.5]])
+        self.model.embed_documents.assert_called_once_with(["abc"])
+
+    def test_evict_least_recently_used(self):
+        """Eviction keeps the most recently used entries"""
+        self.embeddings.embed_documents(["a", "bb", "ccc"])
+        EmbeddingCacheEntry.objects.filter(text_hash=text_sha256("a")).update(
+            last_used_at=timezone.now() - timedelta(days=1)
+        )
+
+        deleted = evict_embedding_cache(max_entries=2)
+
+        self.assertEqual(deleted, 1)
+        self.assertFalse(
+            EmbeddingCacheEntry.objects.filter(text_hash=text_sha256("a")).exists()
+        )
+        self.assertEqual(evict_embedding_cache(max_entries=2), 0)
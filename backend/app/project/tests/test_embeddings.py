@@ -0,0 +1,91 @@
+"""
+Tests for the shared embedding model registry
+"""
+from unittest.mock import patch, MagicMock, ANY
+from django.test import TestCase, override_settings
+
+from project.utils.embeddings import (
+    get_embedding_model,
+    warm_embedding_models,
+    clear_embedding_models,
+    batch_by_tokens,
+)
+
+
+@patch('project.utils.embeddings.HuggingFaceEmbeddings')
+class EmbeddingRegistryTests(TestCase):
+    """Test models are loaded once per process and reused"""
+
+    def setUp(self):
+        clear_embedding_models()
+
+    def tearDown(self):
+        clear_embedding_models()
+
+    @override_settings(EMBEDDING_MODEL_NAME='test/model')
+    def test_model_loaded_once(self, mock_embeddings_cls):
+        """Repeated lookups return the same instance without reloading"""
+        first = get_embedding_model()
+        second = get_embedding_model('test/model')
+
+        self.assertIs(first, second)
+        mock_embeddings_cls.assert_called_once_with(
+            model_name='test/model',
+            encode_kwargs={'batch_size': ANY}
+        )
+
+    def test_models_cached_by_name(self, mock_embeddings_cls):
+        """Different model names get their own instance"""
+        mock_embeddings_cls.side_effect = lambda model_name, **kwargs: model_name
+
+        self.assertEqual(get_embedding_model('model/a'), 'model/a')
+        self.assertEqual(get_embedding_model('model/b'), 'model/b')
+        self.assertEqual(mock_embeddings_cls.call_count, 2)
+
+    @override_settings(EMBEDDING_WARM_MODELS=['model/a', 'model/b'])
+    def test_warm_loads_configured_models(self, mock_embeddings_cls):
+        """Warming loads every configured model up front"""
+        warm_embedding_models()
+        get_embedding_model('model/a')
+
+        self.assertEqual(mock_embeddings_cls.call_count, 2)
+
+
+class BatchByTokensTests(TestCase):
+    """Test chunks are grouped into bounded micro-batches"""
+
+    def _chunks(self, *sizes):
+        return [MagicMock(page_content='x' * size) for size in sizes]
+
+    def test_batches_bounded_by_tokens(self):
+        """A batch closes before going over the token budget"""
+        chunks = self._chunks(396, 396, 396)  # ~100 tokens each
+
+        batches = list(batch_by_tokens(chunks, max_tokens=250, max_size=10))
+
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+
+    def test_batches_bounded_by_size(self):
+        """A batch never holds more than max_size chunks"""
+        chunks = self._chunks(*[4] * 5)
+
+        batches = list(batch_by_tokens(chunks, max_tokens=1000, max_size=2))
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+
+    def test_oversized_chunk_gets_own_batch(self):
+        """A chunk bigger than the budget is still emitted"""
+        chunks = self._chunks(10, 4000, 10)
+
+        batches = list(batch_by_tokens(chunks, max_tokens=100, max_size=10))
+
+        self.assertEqual([len(batch) for batch in batches], [1, 1, 1])
+
+    def test_consumes_lazily(self):
+        """Chunks are pulled from the iterable one batch at a time"""
+        chunks = iter(self._chunks(4, 4, 4, 4))
+        batches = batch_by_tokens(chunks, max_tokens=1000, max_size=2)
+
+        next(batches)
+
+        self.assertEqual(len(list(chunks)), 1)
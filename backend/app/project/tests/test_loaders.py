@@ -0,0 +1,73 @@
+"""
+Tests for the streaming page loader helpers
+"""
+from django.test import TestCase
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document as LCDocument
+
+from project.utils.loaders import iter_chunks
+
+
+def make_pages(*texts):
+    return [
+        LCDocument(page_content=text, metadata={'page': n})
+        for n, text in enumerate(texts)
+    ]
+
+
+class IterChunksTests(TestCase):
+    """Test pages are chunked one at a time"""
+
+    def setUp(self):
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=20,
+            chunk_overlap=5
+        )
+
+    def test_short_pages_are_joined(self):
+        """Text left over at the end of a page continues on the next one"""
+        chunks = list(iter_chunks(make_pages("alpha", "beta"), self.splitter))
+
+        self.assertEqual(len(chunks), 1)
+        self.assertIn("alpha", chunks[0].page_content)
+        self.assertIn("beta", chunks[0].page_content)
+        self.assertEqual(chunks[0].metadata, {'page': 0})
+
+    def test_chunks_cover_all_words(self):
+        """Every word of every page ends up in some chunk"""
+        words = [f"word{n}" for n in range(40)]
+        pages = make_pages(" ".join(words[:20]), " ".join(words[20:]))
+
+        chunks = list(iter_chunks(pages, self.splitter))
+        chunked = " ".join(chunk.page_content for chunk in chunks).split()
+
+        for word in words:
+            self.assertIn(word, chunked)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk.page_content), 20)
+
+    def test_overlap_across_page_boundary(self):
+        """The chunk crossing pages overlaps the previous chunk"""
+        pages = make_pages("aaaa bbbb cccc dddd eeee", "ffff gggg")
+
+        chunks = [c.page_content for c in iter_chunks(pages, self.splitter)]
+        crossing = next(c for c in chunks if "ffff" in c)
+        previous = chunks[chunks.index(crossing) - 1]
+
+        self.assertTrue(set(previous.split()) & set(crossing.split()))
+
+    def test_consumes_pages_lazily(self):
+        """Pages are only read as chunks are requested"""
+        pages = iter(make_pages(*["x" * 50] * 5))
+
+        chunks = iter_chunks(pages, self.splitter)
+        next(chunks)
+
+        self.assertEqual(len(list(pages)), 4)
+
+    def test_empty_pages_skipped(self):
+        """Blank pages do not produce chunks"""
+        chunks = list(iter_chunks(make_pages("", "hello", ""), self.splitter))
+
+        self.assertEqual([c.page_content for c in chunks], ["hello"])
+        self.assertEqual(chunks[0].metadata, {'page': 1})
@@ -0,0 +1,219 @@
+"""
+Tests for rebuilding the vectors of a project
+"""
+from unittest.mock import patch
+import shutil
+import tempfile
+from pathlib import Path
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from project.models import (
+    Project,
+    Document,
+    ReindexJob
+)
+from project.reindex import reindex_project
+from project.tasks import write_document_chunks
+from project.utils.vector_store import (
+    ProjectVectorStore,
+    registry
+)
+from project.tests.test_vector_backends import FakeEmbeddings
+
+
+User = get_user_model()
+
+
+class ReindexTests(TestCase):
+    """Test projects are rebuilt into a new collection"""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(
+            CHROMA_ROOT=self.root / "chroma",
+            MEDIA_ROOT=self.root / "media",
+            VECTOR_BACKEND="local",
+            RAG_HYBRID_SEARCH=False
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        patchers = [
+            # No redis during tests, the project write lock is always free
+            patch('project.reindex.project_write_lock'),
+            patch(
+                'project.utils.vector_store.get_store_embeddings',
+                return_value=FakeEmbeddings()
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='pass12345'
+        ) # type: ignore
+        self.project = Project.objects.create(
+            name="Test Project",
+            user=self.user,
+            chroma_collection="proj_old"
+        )
+        self.old_store = ProjectVectorStore(
+            self.project.id, "proj_old", FakeEmbeddings()
+        )
+        self.docs = [
+            self._document(f"doc{n}.txt", f"Pump model {n} manual", f"hash{n}")
+            for n in range(3)
+        ]
+
+    def _document(self, name, text, content_hash):
+        return Document.objects.create(
+            name=name,
+            project=self.project,
+            file=SimpleUploadedFile(name, text.encode()),
+            file_size=len(text),
+            content_type="text/plain",
+            content_hash=content_hash,
+            processing_status=Document.ProcessingStatus.COMPLETED,
+            chunks_count=99,
+            uploaded_by=self.user
+        )
+
+    def _search(self, query):
+        self.project.refresh_from_db()
+        store = ProjectVectorStore(
+            self.project.id, self.project.chroma_collection, FakeEmbeddings()
+        )
+        return [doc.page_content for doc in store.search(query, k=1)]
+
+    def test_reindex_switches_collection(self):
+        summary = reindex_project(self.project.id)
+
+        job = ReindexJob.objects.get()
+        self.assertEqual(job.status, ReindexJob.Status.COMPLETED)
+        self.assertEqual(summary['collection'], job.collection_name)
+        self.assertEqual(summary['replaced'], "proj_old")
+        self.assertEqual(summary['documents'], 3)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.chroma_collection, job.collection_name)
+        self.assertEqual(self.project.collection_version, 1)
+        self.assertEqual(
+            list(Document.objects.values_list('chunks_count', flat=True).distinct()),
+            [1]
+        )
+        self.assertEqual(self._search("Pump model 1 manual"), ["Pump model 1 manual"])
+        # The replaced collection is dropped
+        self.assertFalse((self.old_store.path / "local" / "proj_old").exists())
+
+    def test_duplicate_upload_keeps_shared_chunks(self):
+        """A re-upload references the original's chunks, kept once it is deleted"""
+        copy = self._document("copy.txt", "Pump model 0 manual", "hash0")
+        from project import reindex
+
+        switch = reindex.switch
+
+        def delete_then_switch(job, store, splitter):
+            Document.objects.filter(pk=self.docs[0].pk).delete()
+            return switch(job, store, splitter)
+
+        with patch(
+            'project.reindex.write_document_chunks', wraps=write_document_chunks
+        ) as mock_write, patch('project.reindex.switch', side_effect=delete_then_switch):
+            reindex_project(self.project.id)
+
+        self.assertEqual(mock_write.call_count, 4)
+        self.assertEqual(len(ReindexJob.objects.get().documents), 3)
+        self.project.refresh_from_db()
+        store = ProjectVectorStore(
+            self.project.id, self.project.chroma_collection, FakeEmbeddings()
+        )
+        self.assertEqual(
+            [doc.page_content for doc in store.search(
+                "Pump model 0 manual", k=5, filter=store.scope_filter([copy.pk])
+            )],
+            ["Pump model 0 manual"]
+        )
+        self.assertEqual(Document.objects.get(pk=copy.pk).chunks_count, 1)
+
+    def test_collection_config_recorded(self):
+        """The project opens the rebuilt collection with the job's settings"""
+        reindex_project(self.project.id)
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.collection_config, ReindexJob.objects.get().config)
+        self.assertEqual(self.project.collection_config["backend"], "local")
+        with override_settings(VECTOR_BACKEND="chroma"):
+            registry.close(self.project.id)
+            store = registry.get(self.project)
+        self.addCleanup(registry.close, self.project.id)
+        self.assertEqual(type(store.backend).__name__, "LocalBackend")
+
+    def test_interrupted_reindex_resumes(self):
+        calls = []
+
+        def fail_on_second(doc, store, splitter):
+            calls.append(doc.pk)
+            if len(calls) == 2:
+                raise RuntimeError("worker killed")
+            return write_document_chunks(doc, store, splitter)
+
+        with patch('project.reindex.write_document_chunks', side_effect=fail_on_second):
+            with self.assertRaises(RuntimeError):
+                reindex_project(self.project.id)
+
+        job = ReindexJob.objects.get()
+        self.assertEqual(job.status, ReindexJob.Status.RUNNING)
+        self.assertEqual(list(job.documents), [str(self.docs[0].pk)])
+        self.assertEqual(job.error, "worker killed")
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.chroma_collection, "proj_old")
+
+        with patch(
+            'project.reindex.write_document_chunks', wraps=write_document_chunks
+        ) as mock_write:
+            summary = reindex_project(self.project.id)
+
+        self.assertEqual(summary['resumed'], 1)
+        self.assertEqual(summary['collection'], job.collection_name)
+        self.assertEqual(
+            [call.args[0].pk for call in mock_write.call_args_list],
+            [self.docs[1].pk, self.docs[2].pk]
+        )
+
+    def test_changed_settings_restart_the_build(self):
+        with patch('project.reindex.write_document_chunks', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                reindex_project(self.project.id)
+        abandoned = ReindexJob.objects.get()
+
+        with override_settings(CHUNK_SIZE=500):
+            reindex_project(self.project.id)
+
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.status, ReindexJob.Status.ABANDONED)
+        self.assertFalse(
+            (registry.path(self.project.id) / "local" / abandoned.collection_name).exists()
+        )
+        self.assertEqual(
+            self.project.reindex_jobs.filter(status=ReindexJob.Status.COMPLETED).count(), 1
+        )
+
+    def test_document_deleted_during_build(self):
+        """Chunks of documents deleted before the switch are removed"""
+        from project import reindex
+
+        switch = reindex.switch
+
+        def delete_then_switch(job, store, splitter):
+            Document.objects.filter(pk=self.docs[1].pk).delete()
+            return switch(job, store, splitter)
+
+        with patch('project.reindex.switch', side_effect=delete_then_switch):
+            summary = reindex_project(self.project.id)
+
+        self.assertEqual(summary['documents'], 2)
+        self.assertEqual(self._search("Pump model 1 manual"), ["Pump model 0 manual"])
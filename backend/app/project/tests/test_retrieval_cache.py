@@ -0,0 +1,160 @@
+"""
+Tests for the retrieval result cache
+"""
+from unittest.mock import patch, MagicMock
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from langchain_core.documents import Document as Chunk
+import redis
+
+from project.models import Project, Document
+from project.utils.retrieval_cache import (
+    CachedRetriever,
+    bump_collection_version,
+    cache_key,
+    clear_local_cache,
+    get_cache_stats,
+    reset_cache_stats,
+)
+
+
+@override_settings(RETRIEVAL_CACHE_MAX_ENTRIES=2, RETRIEVAL_CACHE_REDIS_URL="")
+class CachedRetrieverTests(TestCase):
+    """Test searches are answered from the cache"""
+
+    def setUp(self):
+        clear_local_cache()
+        reset_cache_stats()
+        self.store = MagicMock()
+        self.store.search.side_effect = lambda query, k, filter: [
+            Chunk(page_content=f"{query} {n}", metadata={"page": n})
+            for n in range(k)
+        ]
+
+    def retriever(self, **kwargs):
+        options = {
+            "vectorstore": self.store,
+            "collection_name": "proj_1_1",
+            "collection_version": 0,
+            "k": 2,
+        }
+        options.update(kwargs)
+        return CachedRetriever(**options)
+
+    def test_repeated_search_is_cached(self):
+        """The store is searched once for the same query"""
+        first = self.retriever().invoke("cats")
+        second = self.retriever().invoke("cats")
+
+        self.assertEqual(first, second)
+        self.assertEqual(
+            [chunk.page_content for chunk in second], ["cats 0", "cats 1"]
+        )
+        self.store.search.assert_called_once_with(
+            "cats", k=2, filter=None
+        )
+        stats = get_cache_stats()
+        self.assertEqual((stats["local_hits"], stats["misses"]), (1, 1))
+
+    def test_cached_chunks_are_copies(self):
+        """Changing returned chunks doesn't alter the cache"""
+        self.retriever().invoke("cats")[0].metadata["page"] = 99
+
+        chunks = self.retriever().invoke("cats")
+
+        self.assertEqual(chunks[0].metadata["page"], 0)
+
+    def test_key_parts_miss(self):
+        """Another version, k or filter is searched again"""
+        self.retriever().invoke("cats")
+        self.retriever(collection_version=1).invoke("cats")
+        self.retriever(k=3).invoke("cats")
+        self.retriever(filters={"page": 1}).invoke("cats")
+        self.retriever(collection_name="proj_2_1").invoke("cats")
+
+        self.assertEqual(self.store.search.call_count, 5)
+
+    def test_least_recently_used_evicted(self):
+        """Only RETRIEVAL_CACHE_MAX_ENTRIES results are kept"""
+        for query in ["a", "b", "a", "c", "a", "b"]:
+            self.retriever().invoke(query)
+
+        searched = [c.args[0] for c in self.store.search.call_args_list]
+        self.assertEqual(searched, ["a", "b", "c", "b"])
+
+    @override_settings(RETRIEVAL_CACHE_MAX_ENTRIES=0)
+    def test_disabled_cache(self):
+        self.retriever().invoke("cats")
+        self.retriever().invoke("cats")
+
+        self.assertEqual(self.store.search.call_count, 2)
+
+    @override_settings(RETRIEVAL_CACHE_REDIS_URL="redis://cache")
+    @patch("project.utils.retrieval_cache._redis")
+    def test_redis_tier_shared_between_processes(self, mock_redis):
+        """Results found by another process are read from redis"""
+        shared = {}
+        mock_redis.get.side_effect = shared.get
+        mock_redis.set.side_effect = lambda key, data, ex: shared.update({key: data})
+        self.retriever().invoke("cats")
+        clear_local_cache()
+
+        chunks = self.retriever().invoke("cats")
+
+        self.assertEqual(chunks[0].page_content, "cats 0")
+        self.store.search.assert_called_once()
+        self.assertEqual(get_cache_stats()["redis_hits"], 1)
+
+    @override_settings(RETRIEVAL_CACHE_REDIS_URL="redis://cache")
+    @patch("project.utils.retrieval_cache._redis")
+    def test_redis_down_falls_back_to_search(self, mock_redis):
+        mock_redis.get.side_effect = redis.ConnectionError()
+        mock_redis.set.side_effect = redis.ConnectionError()
+
+        chunks = self.retriever().invoke("cats")
+
+        self.assertEqual(len(chunks), 2)
+
+
+class CollectionVersionTests(TestCase):
+    """Test the collection version follows the project content"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com",
+            password="pass12345"
+        )
+        self.project = Project.objects.create(
+            name="Test",
+            user=self.user,
+            chroma_collection="proj_1_1"
+        )
+
+    def test_bump_changes_cache_key(self):
+        before = cache_key("proj_1_1", self.project.collection_version, "q", 4)
+
+        bump_collection_version(self.project.id)
+        self.project.refresh_from_db()
+
+        self.assertEqual(self.project.collection_version, 1)
+        self.assertNotEqual(
+            before,
+            cache_key("proj_1_1", self.project.collection_version, "q", 4)
+        )
+
+    @patch('project.tasks.delete_document_vectors_task.delay')
+    def test_deleting_document_bumps_version(self, mock_delay):
+        doc = Document.objects.create(
+            name="doc.txt",
+            project=self.project,
+            file="documents/doc.txt",
+            file_size=7,
+            content_type="text/plain",
+            uploaded_by=self.user
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.delete()
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.collection_version, 1)
@@ -0,0 +1,251 @@
+"""
+Tests for the local vector backend
+"""
+import shutil
+import tempfile
+import zlib
+from contextlib import closing
+from pathlib import Path
+import numpy as np
+from django.test import TestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+
+from project.utils.vector_backends import (
+    LocalBackend,
+    get_backend,
+    normalize
+)
+
+
+class FakeEmbeddings:
+    """Random but stable vector per text"""
+
+    dim = 16
+
+    def vector(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode()))
+        return rng.normal(size=self.dim).tolist()
+
+    def embed_documents(self, texts):
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.vector(text)
+
+
+def chunk(text, **metadata):
+    return LCDocument(page_content=text, metadata={"chunk_hash": text, **metadata})
+
+
+class LocalBackendTests(TestCase):
+    """Test the memory-mapped flat and IVF index"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def _backend(self, precision=None):
+        return LocalBackend(
+            Path(self.root), "proj_1", FakeEmbeddings(), precision=precision
+        )
+
+    def test_search_returns_nearest_first(self):
+        backend = self._backend()
+        texts = [f"chunk {n}" for n in range(20)]
+        backend.add([f"id_{n}" for n in range(20)], [chunk(text) for text in texts])
+
+        results = backend.similarity_search("chunk 7", k=3)
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0].page_content, "chunk 7")
+        self.assertEqual(results[0].id, "id_7")
+        self.assertEqual(results[0].metadata["chunk_hash"], "chunk 7")
+
+    def test_search_filtered_by_metadata(self):
+        backend = self._backend()
+        backend.add(
+            ["a", "b"],
+            [chunk("first", document_id=1), chunk("second", document_id=2)]
+        )
+
+        results = backend.similarity_search("first", k=2, filter={"document_id": 2})
+
+        self.assertEqual([doc.id for doc in results], ["b"])
+
+    def test_readding_id_replaces_chunk(self):
+        backend = self._backend()
+        backend.add(["a"], [chunk("old")])
+        backend.add(["a"], [chunk("new")])
+
+        results = backend.similarity_search("old", k=5)
+
+        self.assertEqual([doc.page_content for doc in results], ["new"])
+
+    def test_delete_and_compact(self):
+        backend = self._backend()
+        backend.add(
+            ["a", "b", "c"],
+            [chunk("one", document_id=1), chunk("two", document_id=2),
+             chunk("three", document_id=1)]
+        )
+        self.assertEqual(backend.similarity_search("two", k=1)[0].id, "b")
+
+        self.assertEqual(sorted(backend.delete({"document_id": 1})), ["a", "c"])
+        self.assertEqual([doc.id for doc in backend.similarity_search("one", k=5)], ["b"])
+
+        LocalBackend.compact(Path(self.root))
+
+        self.assertEqual(backend.vectors_file(1).stat().st_size, 16 * 4)
+        self.assertEqual([doc.id for doc in backend.similarity_search("two", k=5)], ["b"])
+        # The replaced files are kept until the next compaction
+        self.assertTrue(backend.vectors_file(0).exists())
+        LocalBackend.compact(Path(self.root))
+        self.assertFalse(backend.vectors_file(0).exists())
+        self.assertTrue(backend.vectors_file(1).exists())
+
+    def _write_after_meta_read(self, reader, write):
+        """Run `write` once right after `reader` read the meta of a search"""
+        read_meta = reader.read_meta
+
+        def read_then_write(conn):
+            meta = read_meta(conn)
+            if not getattr(reader, "written", False):
+                reader.written = True
+                write()
+            return meta
+        reader.read_meta = read_then_write
+
+    def test_search_during_concurrent_add(self):
+        """A search sees the rows of the meta it read, not later ones"""
+        reader = self._backend()
+        reader.add(["a"], [chunk("one")])
+        self._write_after_meta_read(
+            reader,
+            lambda: self._backend().add(["b", "c"], [chunk("two"), chunk("three")])
+        )
+
+        self.assertEqual([doc.id for doc in reader.similarity_search("two", k=5)], ["a"])
+        self.assertEqual(len(reader.similarity_search("two", k=5)), 3)
+
+    def test_search_during_compaction(self):
+        """A search that read the meta before a compaction still finds its files"""
+        reader = self._backend("int8")
+        reader.add(["a", "b"], [chunk("one"), chunk("two")])
+        reader.delete({"chunk_hash": "one"})
+        self._write_after_meta_read(
+            reader, lambda: LocalBackend.compact(Path(self.root))
+        )
+
+        self.assertEqual([doc.id for doc in reader.similarity_search("two", k=5)], ["b"])
+        self.assertEqual([doc.id for doc in reader.similarity_search("two", k=5)], ["b"])
+
+    def test_reader_sees_writes_of_other_handles(self):
+        reader = self._backend()
+        reader.add(["a"], [chunk("one")])
+        self.assertEqual(len(reader.similarity_search("one", k=5)), 1)
+
+        self._backend().add(["b"], [chunk("two")])
+
+        self.assertEqual(reader.similarity_search("two", k=1)[0].id, "b")
+
+    @override_settings(LOCAL_IVF_MIN_VECTORS=200, LOCAL_IVF_NPROBE=4)
+    def test_ivf_recall(self):
+        """IVF search finds most of the exact nearest neighbours"""
+        backend = self._backend()
+        texts = [f"text {n}" for n in range(1000)]
+        backend.add([f"id_{n}" for n in range(1000)], [chunk(text) for text in texts])
+        backend.optimize()
+        self.assertTrue(backend.ivf_file(0).exists())
+
+        embeddings = FakeEmbeddings()
+        vectors = normalize(embeddings.embed_documents(texts))
+        found = expected = 0
+        for n in range(20):
+            query = f"query {n}"
+            scores = vectors @ normalize(embeddings.embed_query(query))
+            exact = {f"id_{i}" for i in np.argsort(-scores)[:10]}
+            results = backend.similarity_search(query, k=10)
+            found += len(exact & {doc.id for doc in results})
+            expected += len(exact)
+
+        self.assertGreater(found / expected, 0.6)
+
+    def _recall(self, precision, batches=(2000,)):
+        """
+        Share of the exact top 10 found, and bytes per searched vector, of
+        2000 chunks added in `batches` of the given sizes
+        """
+        backend = self._backend(precision)
+        embeddings = FakeEmbeddings()
+        texts = [f"text {n}" for n in range(2000)]
+        start = 0
+        while start < len(texts):
+            for size in batches:
+                end = min(start + size, len(texts))
+                backend.add(
+                    [f"id_{n}" for n in range(start, end)],
+                    [chunk(text) for text in texts[start:end]]
+                )
+                start = end
+
+        vectors = normalize(embeddings.embed_documents(texts))
+        found = expected = 0
+        for n in range(20):
+            query = f"query {n}"
+            scores = vectors @ normalize(embeddings.embed_query(query))
+            exact = {f"id_{i}" for i in np.argsort(-scores)[:10]}
+            results = backend.similarity_search(query, k=10)
+            found += len(exact & {doc.id for doc in results})
+            expected += len(exact)
+
+        with closing(backend.connect()) as conn:
+            generation = backend.read_meta(conn)["generation"]
+        searched = (
+            backend.codes_file(generation, precision) if precision
+            else backend.vectors_file(generation)
+        )
+        return found / expected, searched.stat().st_size / 2000
+
+    def test_float16_recall(self):
+        recall, size = self._recall("float16")
+
+        self.assertEqual(size, FakeEmbeddings.dim * 2)
+        self.assertGreaterEqual(recall, 0.99)
+
+    def test_int8_recall(self):
+        recall, size = self._recall("int8")
+
+        self.assertEqual(size, FakeEmbeddings.dim)
+        self.assertGreaterEqual(recall, 0.95)
+
+    def test_int8_recall_small_batches(self):
+        """A scale fitted to a one chunk document is fitted again later"""
+        recall, size = self._recall("int8", batches=(1, 3, 20))
+
+        self.assertEqual(size, FakeEmbeddings.dim)
+        self.assertGreaterEqual(recall, 0.95)
+
+    def test_int8_compaction_requantizes(self):
+        backend = self._backend("int8")
+        backend.add(["a", "b"], [chunk("one"), chunk("two")])
+        backend.delete({"chunk_hash": "one"})
+
+        LocalBackend.compact(Path(self.root))
+
+        self.assertTrue(backend.scale_file(1).exists())
+        self.assertEqual(backend.codes_file(1, "int8").stat().st_size, FakeEmbeddings.dim)
+        self.assertEqual(backend.similarity_search("two", k=1)[0].id, "b")
+
+    def test_precision_fixed_at_creation(self):
+        self._backend("int8").add(["a"], [chunk("one")])
+
+        backend = self._backend("float16")
+        backend.add(["b"], [chunk("two")])
+
+        self.assertFalse(backend.codes_file(0, "float16").exists())
+        # Twice as many vectors as the scale was fitted to, fitted again
+        self.assertEqual(backend.codes_file(1, "int8").stat().st_size, 2 * FakeEmbeddings.dim)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_backend("faiss")
@@ -0,0 +1,196 @@
+"""
+Tests for removing the vectors of deleted documents and projects
+"""
+from unittest.mock import patch
+import shutil
+import tempfile
+from pathlib import Path
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from langchain_core.documents import Document as LCDocument
+
+from chat.models import AnswerCacheEntry
+from project.models import (
+    Project,
+    Document
+)
+from project.tasks import (
+    ProjectBusy,
+    delete_document_vectors_task,
+    delete_project_vectors_task,
+    compact_vector_stores_task
+)
+from project.utils.lexical_index import LexicalIndex
+from project.utils.vector_store import (
+    get_project_vector_path,
+    orphan_vector_dirs
+)
+
+
+User = get_user_model()
+
+
+class VectorCleanupTests(TestCase):
+    """Test deletions remove the vectors in the background"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(CHROMA_ROOT=Path(self.root))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # No redis during tests, the project write lock is always free
+        lock_patcher = patch('project.tasks.project_write_lock')
+        self.mock_write_lock = lock_patcher.start()
+        self.mock_write_lock.return_value.acquire.return_value = True
+        self.addCleanup(lock_patcher.stop)
+
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='pass12345'
+        ) # type: ignore
+        self.project = Project.objects.create(
+            name="Test Project",
+            user=self.user,
+            chroma_collection="proj_1_1"
+        )
+
+    def _document(self, content_hash="abc"):
+        return Document.objects.create(
+            name="doc.pdf",
+            project=self.project,
+            file="doc.pdf",
+            file_size=10,
+            content_type="application/pdf",
+            content_hash=content_hash,
+            uploaded_by=self.user
+        )
+
+    @patch('project.tasks.delete_document_vectors_task.delay')
+    def test_deleting_document_schedules_cleanup(self, mock_delay):
+        doc = self._document()
+        doc_id = doc.id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.delete()
+
+        mock_delay.assert_called_once_with(self.project.id, doc_id)
+
+    @patch('project.tasks.delete_project_vectors_task.delay')
+    def test_deleting_project_schedules_cleanup(self, mock_delay):
+        project_id = self.project.id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.delete()
+
+        mock_delay.assert_called_once_with(project_id)
+
+    @patch('project.tasks.delete_project_vectors_task.delay')
+    @patch('project.tasks.delete_document_vectors_task.delay')
+    def test_deleting_project_skips_document_cleanup(
+        self, mock_document_delay, mock_project_delay
+    ):
+        """The documents of a deleted project go with its directory"""
+        for content_hash in ("abc", "def"):
+            self._document(content_hash)
+        project_id = self.project.id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.delete()
+
+        mock_document_delay.assert_not_called()
+        mock_project_delay.assert_called_once_with(project_id)
+
+    @patch('project.tasks.get_project_store')
+    def test_document_chunks_deleted_by_id(self, mock_get_store):
+        """The document's references go, see ProjectVectorStore.delete_document"""
+        self._document(content_hash="abc")
+        mock_get_store.return_value.delete_document.return_value = ["a", "b"]
+
+        deleted = delete_document_vectors_task(self.project.id, 5)
+
+        self.assertEqual(deleted, 2)
+        mock_get_store.return_value.delete_document.assert_called_once_with(5)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.collection_version, 1)
+
+    @patch('project.tasks.get_project_store')
+    @patch('project.tasks.delete_document_vectors_task.delay')
+    def test_answers_cached_before_chunks_deleted_invalidated(
+        self, mock_delay, mock_get_store
+    ):
+        """An answer cached while the chunks were still searchable is dropped"""
+        doc = self._document()
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.delete()
+        # Answered from the chunks of the deleted document
+        AnswerCacheEntry.objects.create(
+            project=self.project,
+            question="What does doc.pdf say?",
+            model_name="model",
+            vector=b"",
+            answer="It quotes the deleted document"
+        )
+        mock_get_store.return_value.delete_document.side_effect = lambda doc_id: (
+            self.assertTrue(AnswerCacheEntry.objects.exists()) or ["a"]
+        )
+
+        delete_document_vectors_task(*mock_delay.call_args.args)
+
+        self.assertFalse(AnswerCacheEntry.objects.exists())
+
+    @override_settings(INGESTION_MAX_RETRIES=3)
+    def test_busy_project_retries_bounded(self):
+        self.mock_write_lock.return_value.acquire.return_value = False
+
+        result = delete_project_vectors_task.apply(args=(self.project.id,), retries=3)
+
+        self.assertIsInstance(result.result, ProjectBusy)
+
+    def test_project_directory_deleted(self):
+        path = get_project_vector_path(self.project.id)
+        path.mkdir(parents=True)
+        (path / "chroma.sqlite3").write_bytes(b"")
+
+        delete_project_vectors_task(self.project.id)
+
+        self.assertFalse(path.exists())
+
+    def test_compaction_removes_orphans(self):
+        """Directories of deleted projects go, live indexes are compacted"""
+        live = get_project_vector_path(self.project.id)
+        live.mkdir(parents=True)
+        index = LexicalIndex(live)
+        index.add_chunks(
+            ["a", "b"],
+            [LCDocument(page_content="pump"), LCDocument(page_content="valve")]
+        )
+        index.delete_chunks(["a"])
+        orphan = get_project_vector_path(self.project.id + 1)
+        orphan.mkdir(parents=True)
+        self.assertEqual(orphan_vector_dirs([self.project.id]), [orphan])
+
+        result = compact_vector_stores_task()
+
+        self.assertEqual(result['compacted'], [self.project.id])
+        self.assertEqual(result['removed'], [orphan.name])
+        self.assertFalse(orphan.exists())
+        self.assertEqual([row[0] for row in index.search("valve")], ["b"])
+        self.assertEqual(index.search("pump"), [])
+
+    def test_orphan_of_new_project_kept(self):
+        """A project created after the listing keeps its directory"""
+        orphan = get_project_vector_path(self.project.id + 1)
+        orphan.mkdir(parents=True)
+
+        def create_project(**kwargs):
+            # Created between the listing and the removal
+            Project.objects.create(pk=self.project.id + 1, name="New", user=self.user)
+            return True
+        self.mock_write_lock.return_value.acquire.side_effect = create_project
+
+        result = compact_vector_stores_task()
+
+        self.assertEqual(result['removed'], [])
+        self.assertTrue(orphan.exists())
@@ -0,0 +1,424 @@
+"""
+Tests for the per project vector store handles
+"""
+from unittest.mock import patch, MagicMock
+import gc
+import shutil
+import sqlite3
+import tempfile
+from contextlib import closing
+from pathlib import Path
+from django.test import TestCase, override_settings
+from langchain_core.documents import Document as LCDocument
+
+from project.utils.hashing import text_sha256
+from project.utils.lexical_index import (
+    LexicalIndex,
+    query_terms,
+    reciprocal_rank_fusion
+)
+from project.tests.test_vector_backends import FakeEmbeddings
+from project.utils.vector_backends import ChromaBackend
+from project.utils.vector_store import (
+    ProjectVectorStore,
+    VectorStoreRegistry
+)
+
+
+@patch('project.utils.vector_backends.chromadb')
+@patch('project.utils.vector_backends.Chroma')
+class ProjectVectorStoreTests(TestCase):
+    """Test chunks are written to the project collection"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def _store(self):
+        with override_settings(CHROMA_ROOT=self.root):
+            return ProjectVectorStore(1, 'proj_1', embedding=None)
+
+    def test_add_chunks_uses_stable_ids(self, mock_chroma, mock_chromadb):
+        """Ids are derived from document id and chunk position"""
+        mock_chroma.return_value.get.return_value = {"metadatas": []}
+        chunks = [LCDocument(page_content=text) for text in ("a", "b")]
+
+        ids = self._store().add_chunks(7, chunks, start=10)
+
+        self.assertEqual(ids, ["doc_7_chunk_10", "doc_7_chunk_11"])
+        mock_chroma.return_value.add_documents.assert_called_once_with(
+            chunks, ids=ids
+        )
+        self.assertEqual(chunks[0].metadata["chunk_hash"], text_sha256("a"))
+
+    def test_add_chunks_skips_stored_text(self, mock_chroma, mock_chromadb):
+        """Text stored for another document is neither embedded nor stored"""
+        store = self._store()
+        store.add_chunks(7, [LCDocument(page_content="footer", metadata={"document_id": 7})])
+        chunks = [
+            LCDocument(page_content="footer", metadata={"document_id": 8}),
+            LCDocument(page_content="body", metadata={"document_id": 8}),
+        ]
+
+        ids = store.add_chunks(8, chunks)
+
+        self.assertEqual(ids, ["doc_8_chunk_1"])
+        mock_chroma.return_value.add_documents.assert_called_with([chunks[1]], ids=ids)
+        self.assertEqual(
+            [chunk_id for chunk_id, _, _ in store.lexical.search("footer")],
+            ["doc_7_chunk_0"]
+        )
+        self.assertEqual(
+            store.scope_filter([8]),
+            {"chunk_hash": {"$in": [text_sha256("footer")]}}
+        )
+
+    def test_add_chunks_indexes_lexically(self, mock_chroma, mock_chromadb):
+        """New chunks are also written to the project's BM25 index"""
+        mock_chroma.return_value.get.return_value = {"metadatas": []}
+        store = self._store()
+        store.add_chunks(7, [
+            LCDocument(page_content="Error E-1234 means overheating", metadata={"page": 3}),
+            LCDocument(page_content="Unrelated text", metadata={"page": 4}),
+        ])
+
+        results = store.lexical.search("what is e-1234?")
+
+        self.assertEqual(
+            results,
+            [("doc_7_chunk_0", "Error E-1234 means overheating", {
+                "page": 3,
+                "chunk_hash": text_sha256("Error E-1234 means overheating")
+            })]
+        )
+
+    @override_settings(RAG_HYBRID_SEARCH=True, RAG_FETCH_K=5, RAG_RRF_K=60)
+    def test_hybrid_search_fuses_rankings(self, mock_chroma, mock_chromadb):
+        """Exact term matches missed by the vectors are returned"""
+        mock_chroma.return_value.get.return_value = {"metadatas": []}
+        store = self._store()
+        chunks = [
+            LCDocument(page_content="Part AB_77 is the valve"),
+            LCDocument(page_content="Valves control flow"),
+            LCDocument(page_content="Pumps move water"),
+        ]
+        store.add_chunks(1, chunks)
+        mock_chroma.return_value.similarity_search.return_value = [
+            chunks[1], chunks[2]
+        ]
+
+        results = store.search("what is AB_77", k=2)
+
+        self.assertEqual(
+            [chunk.page_content for chunk in results],
+            ["Valves control flow", "Part AB_77 is the valve"]
+        )
+        mock_chroma.return_value.similarity_search.assert_called_once_with(
+            "what is AB_77", k=5, filter=None
+        )
+
+    @override_settings(RAG_HYBRID_SEARCH=False, RAG_FETCH_K=10)
+    def test_vector_only_search(self, mock_chroma, mock_chromadb):
+        store = self._store()
+
+        store.search("query", k=3)
+
+        mock_chroma.return_value.similarity_search.assert_called_once_with(
+            "query", k=10, filter=None
+        )
+
+    @override_settings(RAG_HYBRID_SEARCH=False, RAG_FETCH_K=10)
+    def test_vector_only_search_returns_k_distinct_chunks(self, mock_chroma, mock_chromadb):
+        """Copies of a duplicated document don't take the place of other chunks"""
+        store = self._store()
+        chunks = [
+            LCDocument(page_content=text, metadata={"chunk_hash": text, "document_id": doc_id})
+            for text in ("a", "b", "c", "d") for doc_id in (1, 2)
+        ]
+        mock_chroma.return_value.similarity_search.return_value = chunks
+
+        results = store.search("query", k=3)
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual([chunk.page_content for chunk in results], ["a", "b", "c"])
+
+
+@override_settings(RAG_HYBRID_SEARCH=False)
+class ChunkReferenceTests(TestCase):
+    """Test text shared by documents is stored once and deleted with the last one"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.embeddings = MagicMock(wraps=FakeEmbeddings())
+        with override_settings(CHROMA_ROOT=self.root):
+            self.store = ProjectVectorStore(1, "proj_1", self.embeddings, backend="local")
+
+    def _add(self, doc_id, texts, content_hash=None):
+        chunks = [
+            LCDocument(page_content=text, metadata={"document_id": doc_id})
+            for text in texts
+        ]
+        self.store.add_chunks(doc_id, chunks)
+        self.store.complete_document(doc_id, content_hash, len(chunks))
+
+    def _texts(self, filter=None):
+        return sorted(
+            chunk.page_content
+            for chunk in self.store.search("manual", k=10, filter=filter)
+        )
+
+    def test_reupload_references_the_indexed_file(self):
+        self._add(1, ["pump manual", "legal footer"], content_hash="abc")
+        self.embeddings.reset_mock()
+
+        self.assertEqual(self.store.reuse_document(2, "abc"), 2)
+        self.assertIsNone(self.store.reuse_document(3, "other"))
+
+        self.embeddings.embed_documents.assert_not_called()
+        scoped = {"$or": [{"document_id": {"$in": [2]}}, self.store.scope_filter([2])]}
+        self.assertEqual(self._texts(scoped), ["legal footer", "pump manual"])
+        # The original goes, the copy keeps the chunks
+        self.store.delete_document(1)
+        self.assertEqual(self._texts(), ["legal footer", "pump manual"])
+        # Further copies reference the remaining one
+        self.assertEqual(self.store.reuse_document(3, "abc"), 2)
+        self.store.delete_document(2)
+        self.assertEqual(self._texts(), ["legal footer", "pump manual"])
+        self.store.delete_document(3)
+        self.assertEqual(self._texts(), [])
+
+    def test_shared_text_deleted_with_last_document(self):
+        self._add(1, ["legal footer", "pump manual"])
+        self._add(2, ["legal footer", "valve manual"])
+
+        self.assertEqual(
+            self.embeddings.embed_documents.call_args.args[0], ["valve manual"]
+        )
+        with closing(self.store.backend.connect()) as conn:
+            self.assertEqual(self.store.backend.read_meta(conn)["size"], 3)
+        self.assertEqual(self.store.delete_document(1), ["doc_1_chunk_1"])
+        self.assertEqual(self._texts(), ["legal footer", "valve manual"])
+        self.assertEqual(len(self.store.delete_document(2)), 2)
+        self.assertEqual(self._texts(), [])
+
+    def test_document_indexed_without_references(self):
+        """Chunks written before references were kept are deleted by document"""
+        chunks = [LCDocument(page_content="old manual", metadata={"document_id": 4})]
+        chunks[0].metadata["chunk_hash"] = text_sha256("old manual")
+        self.store.backend.add(["doc_4_chunk_0"], chunks)
+
+        self.assertEqual(self.store.delete_document(4), ["doc_4_chunk_0"])
+
+
+class OpenStore:
+    """Stand-in store the registry can track with weak references"""
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+        self.backend = MagicMock()
+        self.close = MagicMock()
+
+
+@patch('project.utils.vector_store.get_store_embeddings')
+@patch('project.utils.vector_store.ProjectVectorStore')
+class VectorStoreRegistryTests(TestCase):
+    """Test the registry of open project stores"""
+
+    def _project(self, pk, collection=None, config=None):
+        if collection is None:
+            collection = f"proj_{pk}"
+        return MagicMock(
+            id=pk, chroma_collection=collection, collection_config=config or {}
+        )
+
+    def test_store_reused(self, mock_store, mock_embeddings):
+        registry = VectorStoreRegistry()
+
+        store = registry.get(self._project(1))
+
+        self.assertIs(registry.get(self._project(1)), store)
+        mock_store.assert_called_once()
+
+    @override_settings(VECTOR_STORE_MAX_OPEN=2)
+    def test_least_recently_used_store_closed(self, mock_store, mock_embeddings):
+        mock_store.side_effect = lambda *args, **kwargs: OpenStore(args[0])
+        registry = VectorStoreRegistry()
+        first = registry.get(self._project(1))
+        second = registry.get(self._project(2))
+        registry.get(self._project(1))
+
+        registry.get(self._project(3))
+
+        self.assertEqual(registry.open_count(), 2)
+        self.assertIs(registry.get(self._project(1)), first)
+        # Still held here, closed once released
+        backend = second.backend
+        backend.close.assert_not_called()
+        del second
+        gc.collect()
+        backend.close.assert_called_once()
+        first.backend.close.assert_not_called()
+
+    def test_store_opened_without_lock(self, mock_store, mock_embeddings):
+        """A store is opened outside the lock, a concurrent open wins"""
+        registry = VectorStoreRegistry()
+        opened = []
+
+        def open_store(*args, **kwargs):
+            self.assertFalse(registry._lock.locked())
+            store = OpenStore(args[0])
+            opened.append(store)
+            if len(opened) == 1:
+                # Another thread opens the same store meanwhile
+                registry.get(self._project(1))
+            return store
+        mock_store.side_effect = open_store
+
+        store = registry.get(self._project(1))
+
+        self.assertIs(store, opened[1])
+        opened[0].close.assert_called_once()
+        self.assertEqual(registry.open_count(), 1)
+
+    def test_collection_assigned_once(self, mock_store, mock_embeddings):
+        registry = VectorStoreRegistry()
+        project = self._project(7, collection="")
+
+        self.assertEqual(registry.assign_collection(project), "proj_7")
+        project.save.assert_called_once_with(
+            update_fields=["chroma_collection", "collection_config"]
+        )
+        self.assertEqual(project.collection_config["backend"], "chroma")
+
+        project.chroma_collection = "proj_7_1700000000"
+        self.assertEqual(registry.assign_collection(project), "proj_7_1700000000")
+
+    @override_settings(EMBEDDING_MODEL_NAME="new/model", VECTOR_BACKEND="chroma")
+    def test_store_opened_with_its_collection_config(self, mock_store, mock_embeddings):
+        """Changed settings don't apply to the collection in use"""
+        project = self._project(1, config={
+            "embedding_model": "old/model", "backend": "local", "precision": "int8"
+        })
+
+        VectorStoreRegistry().get(project)
+
+        mock_embeddings.assert_called_once_with("old/model")
+        mock_store.assert_called_once_with(
+            1, "proj_1", mock_embeddings.return_value,
+            backend="local", precision="int8"
+        )
+
+    @override_settings(CHROMA_ROOT="/data/vectors")
+    def test_project_path(self, mock_store, mock_embeddings):
+        self.assertEqual(
+            VectorStoreRegistry().path(3), Path("/data/vectors/projects/3")
+        )
+
+
+@patch('project.utils.vector_backends.chromadb')
+class ChromaBackendTests(TestCase):
+    """Test the Chroma backend outside of an open store"""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        (self.root / "chroma.sqlite3").touch()
+
+    def test_drop_with_client_without_close(self, mock_chromadb):
+        """Chroma clients before 1.0 have no close method"""
+        mock_chromadb.PersistentClient.return_value = MagicMock(spec=["delete_collection"])
+
+        ChromaBackend.drop(self.root, "proj_1_r2")
+
+        mock_chromadb.PersistentClient.return_value.delete_collection.assert_called_once_with(
+            "proj_1_r2"
+        )
+
+
+class LexicalIndexTests(TestCase):
+    """Test the BM25 index and rank fusion"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_query_terms_keep_identifiers(self):
+        self.assertEqual(
+            query_terms('Why "E-1234" and e-1234 on AB_77?'),
+            ["why", "e-1234", "and", "on", "ab_77"]
+        )
+
+    def test_schema_set_up_once_per_file(self):
+        """Connections after the first don't run the schema statements"""
+        index = LexicalIndex(Path(self.root))
+        index.add_chunks(["a"], [LCDocument(page_content="pump manual")])
+        with closing(sqlite3.connect(index.path)) as conn:
+            conn.execute("DROP TABLE chunks")
+
+        with self.assertRaises(sqlite3.OperationalError):
+            index.search("pump")
+
+        # A removed file is set up again
+        index.drop()
+        index.add_chunks(["b"], [LCDocument(page_content="valve manual")])
+        self.assertEqual([row[0] for row in index.search("manual")], ["b"])
+
+    def test_search_ranks_by_bm25(self):
+        index = LexicalIndex(Path(self.root))
+        index.add_chunks(
+            ["a", "b"],
+            [
+                LCDocument(page_content="pump pump pump manual"),
+                LCDocument(page_content="pump once, then a long text about valves"),
+            ]
+        )
+
+        self.assertEqual([row[0] for row in index.search("pump")], ["a", "b"])
+
+    def test_readding_chunk_replaces_it(self):
+        index = LexicalIndex(Path(self.root))
+        index.add_chunks(["a"], [LCDocument(page_content="old words")])
+        index.add_chunks(["a"], [LCDocument(page_content="new words")])
+
+        self.assertEqual(index.search("old"), [])
+        self.assertEqual(len(index.search("words")), 1)
+
+    def test_search_filtered_by_metadata(self):
+        """Chroma style filters are applied to the lexical results"""
+        index = LexicalIndex(Path(self.root))
+        index.add_chunks(
+            ["a", "b", "c"],
+            [
+                LCDocument(page_content="pump", metadata={"content_hash": "x", "uploaded_at": 10}),
+                LCDocument(page_content="pump", metadata={"content_hash": "y", "uploaded_at": 20}),
+                LCDocument(page_content="pump", metadata={"content_hash": "z", "uploaded_at": 30}),
+            ]
+        )
+
+        results = index.search("pump", filter={"$and": [
+            {"content_hash": {"$in": ["x", "y"]}},
+            {"uploaded_at": {"$gte": 15}},
+        ]})
+
+        self.assertEqual([row[0] for row in results], ["b"])
+
+    def test_missing_index_finds_nothing(self):
+        self.assertEqual(LexicalIndex(Path(self.root)).search("pump"), [])
+
+    def test_reciprocal_rank_fusion(self):
+        a, b, c = (LCDocument(page_content=text) for text in "abc")
+
+        fused = reciprocal_rank_fusion([[a, b], [c, b]])
+
+        self.assertEqual(fused, [b, a, c])
+
+    def test_reciprocal_rank_fusion_counts_copies_once(self):
+        """Entries of the same text for other documents don't add up"""
+        a, b = (LCDocument(page_content=text) for text in "ab")
+        copy = LCDocument(page_content="a", metadata={"document_id": 2})
+
+        fused = reciprocal_rank_fusion([[a, copy], [b, a]])
+
+        self.assertEqual(fused, [a, b])
+        self.assertEqual(reciprocal_rank_fusion([[copy, b, a]]), [copy, b])
@@ -0,0 +1,99 @@
+"""
+Hit/miss counters shared by the caches (embeddings, search results,
+answers). Counts are kept per process and added to the CacheCounter table
+every CACHE_STATS_FLUSH_INTERVAL seconds, so commands and API views report
+the lookups of every process, not only their own.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import F, Sum
+
+from ..models import CacheCounter
+
+log = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """
+    Counters of the lookups of one cache. `hits` and `misses` name the
+    counted outcomes, the hit rate is the share of the `hits` ones.
+    Counters can be scoped, e.g. by project, and are summed over the
+    scopes unless one is given.
+    """
+
+    def __init__(self, cache, hits=("hits",), misses=("misses",)):
+        self.cache = cache
+        self.hits = tuple(hits)
+        self.keys = self.hits + tuple(misses)
+        self._local = Counter()
+        self._pending = Counter()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def summary(self, counts):
+        stats = {key: counts.get(key, 0) for key in self.keys}
+        total = sum(stats.values())
+        hits = sum(stats[key] for key in self.hits)
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    def record(self, scope="", **counts):
+        """Count lookups of this process, e.g. record(hits=2, misses=1)"""
+        with self._lock:
+            for key, count in counts.items():
+                if count:
+                    self._local[key] += count
+                    self._pending[(str(scope), key)] += count
+            due = (
+                time.monotonic() - self._flushed_at
+                >= settings.CACHE_STATS_FLUSH_INTERVAL
+            )
+        if due:
+            self.flush()
+
+    def get(self):
+        """Counts and hit rate of the lookups of this process"""
+        with self._lock:
+            return self.summary(self._local)
+
+    def reset(self):
+        """Forget the counts, of this process and the shared ones"""
+        with self._lock:
+            self._local.clear()
+            self._pending.clear()
+        CacheCounter.objects.filter(cache=self.cache).delete()
+
+    def flush(self):
+        """Add the counts of this process to the shared counters"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._flushed_at = time.monotonic()
+        try:
+            for (scope, key), count in pending.items():
+                CacheCounter.objects.get_or_create(
+                    cache=self.cache, scope=scope, key=key
+                )
+                CacheCounter.objects.filter(
+                    cache=self.cache, scope=scope, key=key
+                ).update(value=F("value") + count)
+        except Exception:
+            # Keep the counts for the next flush rather than failing the lookup
+            log.exception(f"Could not save the {self.cache} cache counters")
+            with self._lock:
+                self._pending.update(pending)
+
+    def totals(self, scope=None):
+        """Counts and hit rate of the lookups of every process"""
+        self.flush()
+        counters = CacheCounter.objects.filter(cache=self.cache)
+        if scope is not None:
+            counters = counters.filter(scope=str(scope))
+        counts = dict(
+            counters.values("key").annotate(total=Sum("value"))
+            .values_list("key", "total")
+        )
+        return self.summary(counts)
@@ -0,0 +1,209 @@
+"""
+Per collection index of the chunk texts stored in a project's vector store
+and of the documents using them, kept as a SQLite file next to the
+lexical index.
+Text shared by several documents (re-uploads, legal footers, cover pages)
+is embedded and stored once, under the first document writing it, the
+other documents only reference it. A stored chunk is deleted with the
+last document referencing it.
+"""
+import sqlite3
+from contextlib import closing
+
+# Index files whose schema this process already set up
+_initialized = set()
+
+
+class ChunkRefs:
+    """Chunk hash to document references of a project's collection"""
+
+    def __init__(self, path, collection_name):
+        self.path = path / f"refs-{collection_name}.sqlite3"
+
+    def connect(self):
+        # Same set up as the lexical index, once per file and process
+        fresh = not self.path.exists()
+        conn = sqlite3.connect(self.path, timeout=30)
+        if fresh or self.path not in _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # The stored chunk of each text, and the document it is stored under
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "chunk_hash TEXT PRIMARY KEY, chunk_id TEXT NOT NULL, "
+                "document_id INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                "chunk_hash TEXT NOT NULL, document_id INTEGER NOT NULL, "
+                "PRIMARY KEY (chunk_hash, document_id)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS refs_document ON refs (document_id)"
+            )
+            # Completely indexed documents, whole file re-uploads reuse them
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "document_id INTEGER PRIMARY KEY, content_hash TEXT, "
+                "chunks INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS documents_content_hash "
+                "ON documents (content_hash)"
+            )
+            _initialized.add(self.path)
+        return conn
+
+    def stored(self, hashes):
+        """Subset of the chunk `hashes` already stored in the collection"""
+        hashes = list(hashes)
+        if not hashes or not self.path.exists():
+            return set()
+        found = set()
+        with closing(self.connect()) as conn:
+            # Bounded number of parameters per statement
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                found.update(
+                    chunk_hash for chunk_hash, in conn.execute(
+                        "SELECT chunk_hash FROM chunks WHERE chunk_hash IN "
+                        f"({', '.join('?' * len(batch))})",
+                        batch
+                    )
+                )
+        return found
+
+    def add(self, doc_id, hashes, stored=()):
+        """
+        Record that document `doc_id` uses the chunk `hashes`, `stored`
+        are the (hash, chunk id) of the chunks it just stored
+        """
+        with closing(self.connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunks (chunk_hash, chunk_id, document_id) "
+                "VALUES (?, ?, ?)",
+                [(chunk_hash, chunk_id, doc_id) for chunk_hash, chunk_id in stored]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO refs (chunk_hash, document_id) VALUES (?, ?)",
+                [(chunk_hash, doc_id) for chunk_hash in set(hashes)]
+            )
+
+    def complete(self, doc_id, content_hash, chunks):
+        """Record that document `doc_id` is indexed, as `chunks` chunks"""
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (document_id, content_hash, chunks) "
+                "VALUES (?, ?, ?)",
+                (doc_id, content_hash, chunks)
+            )
+
+    def find_document(self, content_hash, exclude=None):
+        """
+        (document id, chunks) of an indexed document with the content
+        `content_hash`, other than `exclude`. None when there is none.
+        """
+        if not content_hash or not self.path.exists():
+            return None
+        with closing(self.connect()) as conn:
+            return conn.execute(
+                "SELECT document_id, chunks FROM documents "
+                "WHERE content_hash = ? AND document_id != ? "
+                "ORDER BY document_id LIMIT 1",
+                (content_hash, -1 if exclude is None else exclude)
+            ).fetchone()
+
+    def copy(self, source_id, doc_id):
+        """Make document `doc_id` reference the chunks of `source_id`"""
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO refs (chunk_hash, document_id) "
+                "SELECT chunk_hash, ? FROM refs WHERE document_id = ?",
+                (doc_id, source_id)
+            )
+
+    def unused(self, doc_id):
+        """
+        Hashes of the stored chunks no other document than `doc_id` uses.
+        None when the document has no references: it was indexed before
+        the references were kept, its chunks are all its own.
+        """
+        if not self.path.exists():
+            return None
+        with closing(self.connect()) as conn:
+            if conn.execute(
+                "SELECT 1 FROM refs WHERE document_id = ? LIMIT 1", (doc_id,)
+            ).fetchone() is None:
+                return None
+            return [
+                chunk_hash for chunk_hash, in conn.execute(
+                    "SELECT chunk_hash FROM refs AS ref WHERE document_id = ? "
+                    "AND NOT EXISTS (SELECT 1 FROM refs AS other "
+                    "WHERE other.chunk_hash = ref.chunk_hash "
+                    "AND other.document_id != ref.document_id)",
+                    (doc_id,)
+                )
+            ]
+
+    def remove(self, doc_id):
+        """Forget document `doc_id` and the stored chunks only it used"""
+        if not self.path.exists():
+            return
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM chunks WHERE chunk_hash IN ("
+                "SELECT chunk_hash FROM refs AS ref WHERE document_id = ? "
+                "AND NOT EXISTS (SELECT 1 FROM refs AS other "
+                "WHERE other.chunk_hash = ref.chunk_hash "
+                "AND other.document_id != ref.document_id))",
+                (doc_id,)
+            )
+            conn.execute("DELETE FROM refs WHERE document_id = ?", (doc_id,))
+            conn.execute("DELETE FROM documents WHERE document_id = ?", (doc_id,))
+
+    def borrowed(self, doc_ids):
+        """
+        Hashes of the chunks the documents `doc_ids` use but which are
+        stored under another document
+        """
+        if not doc_ids or not self.path.exists():
+            return []
+        with closing(self.connect()) as conn:
+            conn.execute(
+                "CREATE TEMP TABLE scope (document_id INTEGER PRIMARY KEY)"
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO scope VALUES (?)",
+                [(doc_id,) for doc_id in doc_ids]
+            )
+            return [
+                chunk_hash for chunk_hash, in conn.execute(
+                    "SELECT DISTINCT ref.chunk_hash FROM refs AS ref "
+                    "JOIN chunks USING (chunk_hash) "
+                    "WHERE ref.document_id IN (SELECT document_id FROM scope) "
+                    "AND chunks.document_id NOT IN (SELECT document_id FROM scope) "
+                    "ORDER BY ref.chunk_hash"
+                )
+            ]
+
+    def compact(self):
+        """Give the freed pages back to the disk"""
+        if not self.path.exists():
+            return
+        with closing(self.connect()) as conn:
+            conn.execute("VACUUM")
+
+    @classmethod
+    def all(cls, path):
+        """Indexes of every collection kept in the project directory `path`"""
+        indexes = []
+        for file in sorted(path.glob("refs-*.sqlite3")):
+            index = cls(path, "")
+            index.path = file
+            indexes.append(index)
+        return indexes
+
+    def drop(self):
+        """Remove the index files"""
+        _initialized.discard(self.path)
+        for suffix in ("", "-wal", "-shm"):
+            self.path.with_name(self.path.name + suffix).unlink(missing_ok=True)
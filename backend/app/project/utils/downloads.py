@@ -0,0 +1,143 @@
+"""
+Document download responses with conditional, range and sendfile support
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Size of the reads when streaming a byte range
+READ_SIZE = 64 * 1024
+
+
+def _etag(doc, stat):
+    """Strong ETag from the content hash, or from mtime and size"""
+    if doc.content_hash:
+        return f'"{doc.content_hash}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a single `bytes=` range against a file of `size` bytes.
+    Returns (start, end) inclusive, None when the header should be
+    ignored, or raises ValueError when the range is not satisfiable.
+    """
+    match = _RANGE.match(header.strip())
+    if match is None:
+        # Multiple ranges or other units, serve the whole file
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if size == 0:
+        # No byte of an empty file can be selected
+        raise ValueError("Empty file")
+    if not first:
+        # Suffix range, the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Whether the If-Range validator, if any, still matches the file"""
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def _iter_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def _sendfile_response(doc):
+    """Empty response asking the front proxy to serve the file"""
+    response = HttpResponse(content_type=doc.content_type)
+    if settings.DOCUMENT_DOWNLOAD_SENDFILE == "nginx":
+        response["X-Accel-Redirect"] = (
+            settings.DOCUMENT_DOWNLOAD_ACCEL_PREFIX + quote(doc.file.name)
+        )
+    else:
+        response["X-Sendfile"] = doc.file.path
+    return response
+
+
+def document_download_response(request, doc):
+    """
+    Build the download response of a document.
+    Supports ETag/Last-Modified validators, single byte ranges with
+    If-Range, and offloading the transfer to a front proxy through
+    X-Accel-Redirect (nginx) or X-Sendfile (apache) when configured.
+    """
+    stat = os.stat(doc.file.path)
+    etag = _etag(doc, stat)
+    last_modified = int(stat.st_mtime)
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return not_modified
+
+    if settings.DOCUMENT_DOWNLOAD_SENDFILE:
+        # The proxy handles ranges itself
+        response = _sendfile_response(doc)
+    else:
+        byte_range = None
+        range_header = request.headers.get("Range")
+        if range_header and _if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{stat.st_size}"
+                return response
+
+        file = open(doc.file.path, "rb")
+        if byte_range is None:
+            response = FileResponse(file, content_type=doc.content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _iter_range(file, start, length),
+                status=206,
+                content_type=doc.content_type
+            )
+            response["Content-Length"] = str(length)
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Content-Disposition"] = f'attachment; filename="{doc.name}"'
+    return response
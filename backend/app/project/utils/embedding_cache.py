@@ -0,0 +1,97 @@
+"""
+Persistent embedding cache keyed by (model name, text hash)
+"""
+import logging
+from array import array
+
+from django.db.models import F
+from django.utils import timezone
+from langchain_core.embeddings import Embeddings
+
+from ..models import EmbeddingCacheEntry
+from .cache_stats import CacheStats
+from .hashing import text_sha256
+
+log = logging.getLogger(__name__)
+
+# Hit/miss counters of the lookups
+stats = CacheStats("embedding")
+
+
+def get_cache_stats():
+    """Hits, misses and hit rate of the embedding cache in this process"""
+    return stats.get()
+
+
+def reset_cache_stats():
+    stats.reset()
+
+
+def evict_embedding_cache(max_entries):
+    """Delete the least recently used entries above `max_entries`"""
+    excess = EmbeddingCacheEntry.objects.count() - max_entries
+    if excess <= 0:
+        return 0
+    stale = list(
+        EmbeddingCacheEntry.objects
+        .order_by("last_used_at")
+        .values_list("pk", flat=True)[:excess]
+    )
+    deleted, _ = EmbeddingCacheEntry.objects.filter(pk__in=stale).delete()
+    log.info(f"Evicted {deleted} embedding cache entries")
+    return deleted
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that looks vectors up in the cache table before
+    calling the model, and stores the vectors it had to compute.
+    Queries are not cached, they are embedded once per question.
+    """
+
+    def __init__(self, embeddings, model_name):
+        self.embeddings = embeddings
+        self.model_name = model_name
+
+    def embed_documents(self, texts):
+        hashes = [text_sha256(text) for text in texts]
+        entries = EmbeddingCacheEntry.objects.filter(
+            model_name=self.model_name,
+            text_hash__in=set(hashes)
+        ).only("pk", "text_hash", "vector")
+        cached = {
+            entry.text_hash: array("f", bytes(entry.vector)).tolist()
+            for entry in entries
+        }
+        if cached:
+            EmbeddingCacheEntry.objects.filter(
+                model_name=self.model_name,
+                text_hash__in=cached.keys()
+            ).update(hits=F("hits") + 1, last_used_at=timezone.now())
+
+        # Encode each missing text once, even if repeated in the batch
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            EmbeddingCacheEntry.objects.bulk_create(
+                [
+                    EmbeddingCacheEntry(
+                        model_name=self.model_name,
+                        text_hash=text_hash,
+                        vector=array("f", vector).tobytes()
+                    )
+                    for text_hash, vector in computed.items()
+                ],
+                ignore_conflicts=True
+            )
+            cached.update(computed)
+
+        stats.record(hits=len(texts) - len(missing), misses=len(missing))
+        return [list(cached[text_hash]) for text_hash in hashes]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,90 @@
+"""
+Process-wide registry of embedding models
+"""
+import logging
+import threading
+
+from django.conf import settings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+log = logging.getLogger(__name__)
+
+# Loaded models keyed by model name, shared by every task run in the process
+_models = {}
+_lock = threading.Lock()
+
+# Rough characters per token for sentence-transformers vocabularies, good
+# enough to size batches without running the tokenizer twice
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Approximate number of tokens of `text`"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _set_num_threads():
+    """Apply the configured CPU thread count to torch"""
+    num_threads = settings.EMBEDDING_NUM_THREADS
+    if num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+
+
+def get_embedding_model(model_name=None):
+    """
+    Return the shared embedding model for `model_name`.
+    The weights are loaded from disk only the first time a model is requested
+    in this process, later calls reuse the same instance.
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another thread may have loaded it while we waited for the lock
+        model = _models.get(model_name)
+        if model is None:
+            log.info(f"Loading embedding model {model_name}")
+            _set_num_threads()
+            model = HuggingFaceEmbeddings(
+                model_name=model_name,
+                encode_kwargs={'batch_size': settings.EMBEDDING_BATCH_SIZE}
+            )
+            _models[model_name] = model
+    return model
+
+
+def warm_embedding_models(model_names=None):
+    """Load the configured embedding models ahead of the first task"""
+    for model_name in model_names or settings.EMBEDDING_WARM_MODELS:
+        get_embedding_model(model_name)
+
+
+def clear_embedding_models():
+    """Drop every loaded model, mostly useful for tests"""
+    with _lock:
+        _models.clear()
+
+
+def batch_by_tokens(chunks, max_tokens=None, max_size=None):
+    """
+    Group an iterable of chunks into micro-batches for encoding.
+    A batch is closed once adding the next chunk would exceed `max_tokens`
+    estimated tokens or `max_size` chunks. Chunks are consumed lazily so
+    only one batch is held in memory at a time.
+    """
+    max_tokens = max_tokens or settings.EMBEDDING_BATCH_TOKENS
+    max_size = max_size or settings.EMBEDDING_BATCH_SIZE
+
+    batch, batch_tokens = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk.page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_size):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch
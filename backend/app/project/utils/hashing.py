@@ -0,0 +1,22 @@
+"""
+Content hashing helpers used to deduplicate uploads and chunks
+"""
+import hashlib
+import re
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def file_sha256(file):
+    """SHA-256 hex digest of a Django file, read chunk by chunk"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def text_sha256(text):
+    """SHA-256 hex digest of `text` with whitespace normalized"""
+    normalized = _WHITESPACE.sub(" ", text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
@@ -0,0 +1,196 @@
+"""
+Per project lexical (BM25) index of the chunks, stored as a SQLite FTS5
+table next to the project's Chroma data.
+Embeddings miss exact identifiers like error codes and part numbers, the
+lexical index finds them and its results are fused with the vector ones.
+"""
+import json
+import logging
+import re
+import sqlite3
+from contextlib import closing
+
+log = logging.getLogger(__name__)
+
+INDEX_FILENAME = "lexical.sqlite3"
+
+# Index files whose schema this process already set up
+_initialized = set()
+
+
+def index_filename(collection_name=None):
+    """File of a collection's index, collections used to share one file"""
+    if collection_name is None:
+        return INDEX_FILENAME
+    return f"lexical-{collection_name}.sqlite3"
+
+
+# Words keep inner dashes and underscores so codes like E-1234 or AB_77
+# are indexed and searched as one token
+TOKEN_RE = re.compile(r"\w+(?:[-_]\w+)*")
+
+
+def query_terms(text):
+    """Distinct search terms of `text`, in order"""
+    return list(dict.fromkeys(token.lower() for token in TOKEN_RE.findall(text)))
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse ranked lists of chunks, each chunk scores sum(1 / (k + rank)) over
+    the lists it appears in. Chunks are identified by their text hash, the
+    copies of a text stored for other documents only count once per list.
+    """
+    scores, chunks = {}, {}
+    for ranking in rankings:
+        seen = set()
+        for rank, chunk in enumerate(ranking, start=1):
+            key = chunk.metadata.get("chunk_hash") or chunk.page_content
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            chunks.setdefault(key, chunk)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [chunks[key] for key in ranked]
+
+
+OPERATORS = {
+    "$eq": "=",
+    "$ne": "!=",
+    "$gt": ">",
+    "$gte": ">=",
+    "$lt": "<",
+    "$lte": "<=",
+}
+
+
+def where_sql(where):
+    """
+    SQL condition and parameters equivalent to a Chroma `where` filter over
+    the JSON metadata column. Supports $and, $or, $in, $nin and comparisons.
+    """
+    conditions, params = [], []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_sql(clause) for clause in value]
+            joiner = " AND " if key == "$and" else " OR "
+            conditions.append(
+                "(" + joiner.join(sql for sql, _ in parts) + ")"
+            )
+            params.extend(param for _, part_params in parts for param in part_params)
+            continue
+
+        field = f"json_extract(metadata, '$.{key}')"
+        if not isinstance(value, dict):
+            value = {"$eq": value}
+        for op, operand in value.items():
+            if op in ("$in", "$nin"):
+                placeholders = ", ".join("?" * len(operand)) or "NULL"
+                negate = "NOT " if op == "$nin" else ""
+                conditions.append(f"{field} {negate}IN ({placeholders})")
+                params.extend(operand)
+            else:
+                conditions.append(f"{field} {OPERATORS[op]} ?")
+                params.append(operand)
+    return " AND ".join(conditions), params
+
+
+class LexicalIndex:
+    """BM25 index of the chunks of a project's collection"""
+
+    def __init__(self, path, collection_name=None):
+        self.path = path / index_filename(collection_name)
+
+    def connect(self):
+        # The schema is set up once per file and process, the journal mode
+        # is stored in the file. A file removed since is set up again
+        fresh = not self.path.exists()
+        conn = sqlite3.connect(self.path, timeout=30)
+        if fresh or self.path not in _initialized:
+            # Readers in the web processes don't block the ingestion writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                "chunk_id UNINDEXED, content, metadata UNINDEXED, "
+                "tokenize=\"unicode61 tokenchars '-_'\")"
+            )
+            _initialized.add(self.path)
+        return conn
+
+    def add_chunks(self, ids, chunks):
+        """Index `chunks` under their vector ids, replacing previous versions"""
+        if not ids:
+            return
+        with closing(self.connect()) as conn, conn:
+            conn.executemany(
+                "DELETE FROM chunks WHERE chunk_id = ?",
+                [(chunk_id,) for chunk_id in ids]
+            )
+            conn.executemany(
+                "INSERT INTO chunks (chunk_id, content, metadata) VALUES (?, ?, ?)",
+                [
+                    (chunk_id, chunk.page_content, json.dumps(chunk.metadata))
+                    for chunk_id, chunk in zip(ids, chunks)
+                ]
+            )
+
+    def delete_chunks(self, ids):
+        """Remove the chunks with the given vector ids"""
+        if not ids or not self.path.exists():
+            return
+        with closing(self.connect()) as conn, conn:
+            conn.executemany(
+                "DELETE FROM chunks WHERE chunk_id = ?",
+                [(chunk_id,) for chunk_id in ids]
+            )
+
+    def compact(self):
+        """Merge the index segments and give the freed pages back to the disk"""
+        if not self.path.exists():
+            return
+        with closing(self.connect()) as conn:
+            with conn:
+                conn.execute("INSERT INTO chunks(chunks) VALUES('optimize')")
+            conn.execute("VACUUM")
+
+    @classmethod
+    def all(cls, path):
+        """Indexes of every collection kept in the project directory `path`"""
+        indexes = []
+        for file in sorted(path.glob("lexical*.sqlite3")):
+            index = cls(path)
+            index.path = file
+            indexes.append(index)
+        return indexes
+
+    def drop(self):
+        """Remove the index files"""
+        _initialized.discard(self.path)
+        for suffix in ("", "-wal", "-shm"):
+            self.path.with_name(self.path.name + suffix).unlink(missing_ok=True)
+
+    def search(self, query, k=20, filter=None):
+        """
+        Best `k` chunks for `query` by BM25, as (id, text, metadata).
+        `filter` is a Chroma style `where` on the chunk metadata.
+        """
+        terms = query_terms(query)
+        if not terms or not self.path.exists():
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        sql, params = "chunks MATCH ?", [match]
+        if filter:
+            condition, filter_params = where_sql(filter)
+            sql = f"{sql} AND {condition}"
+            params.extend(filter_params)
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                "SELECT chunk_id, content, metadata FROM chunks "
+                f"WHERE {sql} ORDER BY bm25(chunks) LIMIT ?",
+                (*params, k)
+            ).fetchall()
+        return [
+            (chunk_id, content, json.loads(metadata))
+            for chunk_id, content, metadata in rows
+        ]
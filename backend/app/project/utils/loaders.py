@@ -0,0 +1,34 @@
+"""
+Streaming helpers to chunk documents one page at a time
+"""
+from langchain_core.documents import Document as LCDocument
+
+
+def iter_chunks(pages, splitter, separator="\n\n"):
+    """
+    Split a stream of pages into chunks without loading the whole document.
+    The last piece of every page is carried over and split again together
+    with the next page, so chunks and their overlap span page boundaries
+    the same way they would if the full text had been split at once.
+    Only the current page and the carried piece are held in memory.
+    """
+    carry, carry_metadata = "", None
+    for page in pages:
+        text = page.page_content
+        if carry:
+            text = f"{carry}{separator}{text}"
+        pieces = splitter.split_text(text)
+        if not pieces:
+            continue
+
+        for index, piece in enumerate(pieces[:-1]):
+            # The first piece starts in the page the carried text came from
+            metadata = carry_metadata if index == 0 and carry else page.metadata
+            yield LCDocument(page_content=piece, metadata=dict(metadata))
+
+        if len(pieces) > 1 or not carry:
+            carry_metadata = page.metadata
+        carry = pieces[-1]
+
+    if carry:
+        yield LCDocument(page_content=carry, metadata=dict(carry_metadata))
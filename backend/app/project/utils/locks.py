@@ -0,0 +1,38 @@
+"""
+Cross worker locks backed by redis
+"""
+import logging
+
+import redis
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+_client = None
+
+
+def get_redis():
+    """Shared redis client of the process"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.INGESTION_LOCK_URL)
+    return _client
+
+
+def project_write_lock(project_id):
+    """
+    Lock serializing the vector writes of a project across every worker.
+    The timeout releases the lock if the worker holding it dies.
+    """
+    return get_redis().lock(
+        f"vaultq:project:{project_id}:vector-write",
+        timeout=settings.INGESTION_LOCK_TIMEOUT
+    )
+
+
+def release_lock(lock):
+    """Release `lock`, it may already have expired if the work ran long"""
+    try:
+        lock.release()
+    except redis.exceptions.LockError:
+        log.warning(f"Lock {lock.name} expired before being released")
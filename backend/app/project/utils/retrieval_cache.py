@@ -0,0 +1,163 @@
+"""
+Cache of vector search results keyed by
+(collection, collection version, query hash, k, filters).
+Results live in an in-process LRU and, when RETRIEVAL_CACHE_REDIS_URL is
+set, in redis so every process shares them. Entries are never
+invalidated, bumping the project's collection version changes the key.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import redis
+from django.conf import settings
+from django.db.models import F
+from langchain_core.documents import Document as Chunk
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from ..models import Project
+from .cache_stats import CacheStats
+from .hashing import text_sha256
+
+log = logging.getLogger(__name__)
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+_redis = None
+
+# Hit/miss counters of the lookups
+stats = CacheStats("retrieval", hits=("local_hits", "redis_hits"))
+
+
+def get_cache_stats():
+    """Local and redis hits, misses and hit rate of this process"""
+    return stats.get()
+
+
+def reset_cache_stats():
+    stats.reset()
+
+
+def clear_local_cache():
+    with _local_lock:
+        _local.clear()
+
+
+def get_redis():
+    """Redis client of the shared tier, None when not configured"""
+    global _redis
+    if not settings.RETRIEVAL_CACHE_REDIS_URL:
+        return None
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.RETRIEVAL_CACHE_REDIS_URL)
+    return _redis
+
+
+def bump_collection_version(project_id):
+    """Invalidate the cached results of a project, its vectors changed"""
+    Project.objects.filter(pk=project_id).update(
+        collection_version=F("collection_version") + 1
+    )
+
+
+def cache_key(collection_name, version, query, k, filters=None):
+    """Key of a search, the query is hashed with the embedding model"""
+    query_hash = text_sha256(f"{settings.EMBEDDING_MODEL_NAME}\n{query}")
+    raw = json.dumps(
+        [collection_name, version, query_hash, k, filters],
+        sort_keys=True
+    )
+    return f"vaultq:retrieval:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def _dump(chunks):
+    return json.dumps([
+        {"page_content": chunk.page_content, "metadata": chunk.metadata}
+        for chunk in chunks
+    ])
+
+
+def _load(data):
+    return [Chunk(**chunk) for chunk in json.loads(data)]
+
+
+def get_results(key):
+    """Cached chunks of `key`, or None"""
+    with _local_lock:
+        data = _local.get(key)
+        if data is not None:
+            _local.move_to_end(key)
+    if data is not None:
+        stats.record(local_hits=1)
+        return _load(data)
+
+    client = get_redis()
+    if client is not None:
+        try:
+            data = client.get(key)
+        except redis.RedisError:
+            log.warning("Retrieval cache redis unavailable", exc_info=True)
+        if data is not None:
+            stats.record(redis_hits=1)
+            _set_local(key, data)
+            return _load(data)
+    stats.record(misses=1)
+    return None
+
+
+def _set_local(key, data):
+    with _local_lock:
+        _local[key] = data
+        _local.move_to_end(key)
+        while len(_local) > settings.RETRIEVAL_CACHE_MAX_ENTRIES:
+            _local.popitem(last=False)
+
+
+def set_results(key, chunks):
+    """Store the chunks found for `key` in every tier"""
+    # Stored serialized so callers can't alter the cached chunks
+    data = _dump(chunks)
+    _set_local(key, data)
+    client = get_redis()
+    if client is not None:
+        try:
+            client.set(key, data, ex=settings.RETRIEVAL_CACHE_TTL)
+        except redis.RedisError:
+            log.warning("Retrieval cache redis unavailable", exc_info=True)
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Search of a project store, going through the cache first.
+    `vectorstore` is anything with a `search(query, k, filter)` method.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    collection_name: str
+    collection_version: int = 0
+    k: int = 4
+    filters: Optional[dict] = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        if not settings.RETRIEVAL_CACHE_MAX_ENTRIES:
+            return self._search(query)
+        key = cache_key(
+            self.collection_name,
+            self.collection_version,
+            query,
+            self.k,
+            self.filters
+        )
+        chunks = get_results(key)
+        if chunks is None:
+            chunks = self._search(query)
+            set_results(key, chunks)
+        return chunks
+
+    def _search(self, query):
+        return self.vectorstore.search(query, k=self.k, filter=self.filters)
@@ -0,0 +1,109 @@
+"""
+Helpers for resumable document uploads sent in parts
+"""
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import DocumentUpload
+
+log = logging.getLogger(__name__)
+
+# Size of the reads from the request body and from disk
+READ_SIZE = 64 * 1024
+
+
+class PartError(Exception):
+    """Raised when a part can not be appended to an upload"""
+
+
+def create_upload_file(upload, upload_to):
+    """
+    Create the empty file the parts are written to, at its final
+    `upload_to` location, and return its storage name.
+    """
+    name = upload_to(upload, upload.name)
+    return default_storage.save(name, ContentFile(b""))
+
+
+def write_part(upload, stream, length, checksum=""):
+    """
+    Append `length` bytes read from `stream` at the current end of the
+    upload, checking them against the part's SHA-256 `checksum` if given.
+    A part that fails the check is discarded so the client can resend it.
+    Returns the new number of received bytes.
+    """
+    offset = upload.received_bytes
+    if offset + length > upload.size:
+        raise PartError("Part goes past the declared file size.")
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(default_storage.path(upload.file_path), "r+b") as file:
+        file.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            digest.update(data)
+            file.write(data)
+            written += len(data)
+
+        error = None
+        if written != length:
+            error = "Part is shorter than its Content-Length."
+        elif checksum and digest.hexdigest() != checksum.lower():
+            error = "Part checksum mismatch."
+        if error:
+            file.truncate(offset)
+            raise PartError(error)
+
+    return offset + written
+
+
+def stored_file_sha256(name):
+    """SHA-256 hex digest of a file in storage, read from disk"""
+    digest = hashlib.sha256()
+    with default_storage.open(name, "rb") as file:
+        for chunk in iter(lambda: file.read(READ_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_head(name, size=5):
+    """First bytes of a file in storage"""
+    with default_storage.open(name, "rb") as file:
+        return file.read(size)
+
+
+def delete_stale_uploads(max_age):
+    """
+    Remove the uploads left in progress for more than `max_age` seconds
+    since their last part, with their partial files. Uploads receiving a
+    part right now are skipped. Returns the number of removed uploads.
+    """
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    stale = DocumentUpload.objects.filter(
+        status=DocumentUpload.UploadStatus.IN_PROGRESS,
+        updated_at__lt=cutoff
+    )
+    removed = 0
+    for upload_id in stale.values_list("pk", flat=True):
+        with transaction.atomic():
+            upload = (
+                stale.select_for_update(skip_locked=True)
+                .filter(pk=upload_id).first()
+            )
+            if upload is None:
+                continue
+            default_storage.delete(upload.file_path)
+            upload.delete()
+        removed += 1
+    if removed:
+        log.info(f"Removed {removed} stale uploads")
+    return removed
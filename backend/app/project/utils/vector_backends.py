@@ -0,0 +1,640 @@
+"""
+Storage backends of the project vector stores.
+A backend embeds and keeps the chunks of one collection and answers
+nearest neighbour searches. VECTOR_BACKEND picks the one new collections
+use, existing ones stay in the backend they were built in:
+- chroma: a persistent Chroma client per project
+- local: a flat index memory-mapped from the project directory, with an
+  IVF index once the project is big enough and optional float16 or int8
+  storage of the vectors searched
+"""
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+
+import chromadb
+from chromadb.errors import NotFoundError
+import numpy as np
+from django.conf import settings
+from langchain_chroma import Chroma
+from langchain_core.documents import Document as Chunk
+
+from .lexical_index import where_sql
+
+log = logging.getLogger(__name__)
+
+
+class ChromaBackend:
+    """Chroma collection stored in the project directory"""
+
+    def __init__(self, path, collection_name, embedding, precision=None):
+        # Chroma always stores float32, `precision` only applies to the
+        # local backend
+        self.client = chromadb.PersistentClient(path=str(path))
+        self.store = Chroma(
+            client=self.client,
+            collection_name=collection_name,
+            embedding_function=embedding
+        )
+
+    def add(self, ids, chunks):
+        self.store.add_documents(chunks, ids=ids)
+
+    def delete(self, where):
+        """Delete the chunks matching a metadata filter, returns their ids"""
+        ids = self.store.get(where=where, include=[])["ids"]
+        if ids:
+            self.store.delete(ids=ids)
+        return ids
+
+    def similarity_search(self, query, k=4, filter=None):
+        return self.store.similarity_search(query, k=k, filter=filter)
+
+    def optimize(self):
+        """Chroma maintains its own index"""
+
+    def close(self):
+        """Release the underlying client and its sqlite handles"""
+        close = getattr(self.client, 'close', None)
+        if close is not None:
+            close()
+
+    @classmethod
+    def compact(cls, path):
+        """
+        Chroma keeps its metadata and embeddings in sqlite, deleted rows
+        only free pages until the database is vacuumed
+        """
+        database = path / "chroma.sqlite3"
+        if database.exists():
+            with closing(sqlite3.connect(database, timeout=30)) as conn:
+                conn.execute("VACUUM")
+
+    @classmethod
+    def drop(cls, path, collection_name):
+        """Delete a collection of the project"""
+        if not (path / "chroma.sqlite3").exists():
+            return
+        client = chromadb.PersistentClient(path=str(path))
+        try:
+            client.delete_collection(collection_name)
+        except NotFoundError:
+            pass
+        finally:
+            close = getattr(client, 'close', None)
+            if close is not None:
+                close()
+
+
+# Rows converted to float32 at once when scoring compact vectors
+BLOCK_ROWS = 8192
+
+# Share of clipped values past which new vectors saturate the int8 codes
+SATURATED_SHARE = 0.01
+
+PRECISIONS = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+
+
+def normalize(vectors):
+    """Rows of `vectors` scaled to unit length, dot products become cosines"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    """Positions of the `k` highest scores, best first"""
+    if k < len(scores):
+        best = np.argpartition(-scores, k)[:k]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def int8_scale(vectors):
+    """
+    Per dimension step of the int8 codes of `vectors`, with headroom for
+    the vectors added later
+    """
+    return np.maximum(np.abs(vectors).max(axis=0) * 1.25, 1e-6) / 127
+
+
+def fit_scale(vectors, slots):
+    """int8 scale fitted to the `slots` rows of `vectors`, a block at a time"""
+    scale = np.zeros(vectors.shape[1], dtype=np.float32)
+    for start in range(0, len(slots), BLOCK_ROWS):
+        block = vectors[slots[start:start + BLOCK_ROWS]]
+        scale = np.maximum(scale, int8_scale(block))
+    return scale
+
+
+def quantize(vectors, precision, scale=None):
+    """Compact form of normalized `vectors` in `precision`"""
+    if precision == "int8":
+        return np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return vectors.astype(PRECISIONS[precision])
+
+
+def scan(matrix, slots, query):
+    """
+    Dot products of the `slots` rows of `matrix` with `query`. Compact rows
+    are converted to float32 a block at a time, never all at once.
+    """
+    if len(slots) > len(matrix) // 2:
+        # Contiguous blocks beat gathering most of the rows
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block = matrix[start:start + BLOCK_ROWS]
+            scores[start:start + BLOCK_ROWS] = block.astype(np.float32) @ query
+        return scores[slots]
+    scores = np.empty(len(slots), dtype=np.float32)
+    for start in range(0, len(slots), BLOCK_ROWS):
+        block = matrix[slots[start:start + BLOCK_ROWS]]
+        scores[start:start + BLOCK_ROWS] = block.astype(np.float32) @ query
+    return scores
+
+
+def write_rows(path, start, rows):
+    """
+    Write `rows` to the raw array file at `path` from row `start` on.
+    Bytes left after it by an interrupted write are dropped.
+    """
+    with open(path, "r+b" if path.exists() else "wb") as f:
+        f.seek(start * rows.shape[1] * rows.itemsize)
+        f.write(rows.tobytes())
+        f.truncate()
+
+
+def kmeans(vectors, n_lists, iterations=10, seed=0):
+    """Centroids of `vectors` by spherical k-means"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_lists)
+        # Empty lists keep their previous centroid
+        centroids = np.where(counts[:, None] > 0, normalize(sums), centroids)
+    return centroids
+
+
+class LocalBackend:
+    """
+    Flat vector index kept in files of the project directory, no client to
+    start. Vectors are normalized and appended to a raw float32 file read
+    through a memory map, the chunk texts and metadata are sqlite rows
+    pointing at their vector slot. A search is a single matrix product
+    over the live slots, or over the IVF lists closest to the query once
+    the project holds LOCAL_IVF_MIN_VECTORS vectors.
+    With a float16 or int8 `precision` a compact copy of the vectors is
+    the one scanned, and only the best LOCAL_RESCORE_FACTOR * k candidates
+    are re-scored against the float32 vectors, so only the compact copy
+    stays in memory. The precision is fixed when the collection is created,
+    the int8 scale is fitted again as the collection grows.
+    Deleted chunks only lose their row, their slot is reclaimed by compact.
+    """
+
+    DIRNAME = "local"
+
+    def __init__(self, path, collection_name, embedding, precision=None):
+        self.path = Path(path) / self.DIRNAME / collection_name
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.database = self.path / "index.sqlite3"
+        self.embedding = embedding
+        self.precision = precision or "float32"
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"Unknown vector precision {self.precision!r}")
+        self._lock = threading.Lock()
+        # Views of the files, reloaded when another process wrote to them
+        self._vectors = self._codes = self._scale = self._vectors_key = None
+        self._live = self._live_key = None
+        self._ivf = self._ivf_key = None
+
+    def connect(self):
+        conn = sqlite3.connect(self.database, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "slot INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL, "
+            "chunk_hash TEXT, content TEXT, metadata TEXT)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS rows_chunk_hash ON rows (chunk_hash)"
+        )
+        return conn
+
+    @staticmethod
+    def read_meta(conn):
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        meta.setdefault("generation", 0)
+        meta.setdefault("size", 0)
+        meta.setdefault("revision", 0)
+        meta.setdefault("dim", 0)
+        return meta
+
+    @staticmethod
+    def write_meta(conn, **values):
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            values.items()
+        )
+
+    def vectors_file(self, generation):
+        return self.path / f"vectors-{generation}.f32"
+
+    def codes_file(self, generation, precision):
+        return self.path / f"codes-{generation}.{precision}"
+
+    def scale_file(self, generation):
+        return self.path / f"scale-{generation}.npy"
+
+    def ivf_file(self, generation):
+        return self.path / f"ivf-{generation}.npz"
+
+    def add(self, ids, chunks):
+        """Embed `chunks` and store them under `ids`, replacing older ones"""
+        vectors = normalize(
+            self.embedding.embed_documents([chunk.page_content for chunk in chunks])
+        )
+        with closing(self.connect()) as conn, conn:
+            meta = self.read_meta(conn)
+            if meta["dim"] and meta["dim"] != vectors.shape[1]:
+                raise ValueError(
+                    f"Vectors of {vectors.shape[1]} dimensions can't be added "
+                    f"to an index of {meta['dim']}"
+                )
+            start, generation = meta["size"], meta["generation"]
+            size = start + len(vectors)
+            precision = meta.get("precision") or self.precision
+            fitted = {}
+            # Written after the committed slots, over anything left by an
+            # interrupted write
+            write_rows(self.vectors_file(generation), start, vectors)
+            if precision == "int8" and start and self.scale_outgrown(meta, vectors, size):
+                generation = self.requantize(meta, size, vectors.shape[1])
+                fitted = {"generation": generation, "scale_size": size}
+            elif precision != "float32":
+                scale = None
+                if precision == "int8":
+                    if not start:
+                        np.save(self.scale_file(generation), int8_scale(vectors))
+                        fitted = {"scale_size": size}
+                    scale = np.load(self.scale_file(generation))
+                write_rows(
+                    self.codes_file(generation, precision),
+                    start,
+                    quantize(vectors, precision, scale)
+                )
+            conn.executemany(
+                "DELETE FROM rows WHERE chunk_id = ?",
+                [(chunk_id,) for chunk_id in ids]
+            )
+            conn.executemany(
+                "INSERT INTO rows (slot, chunk_id, chunk_hash, content, metadata) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        start + n,
+                        chunk_id,
+                        chunk.metadata.get("chunk_hash"),
+                        chunk.page_content,
+                        json.dumps(chunk.metadata)
+                    )
+                    for n, (chunk_id, chunk) in enumerate(zip(ids, chunks))
+                ]
+            )
+            self.write_meta(
+                conn,
+                dim=vectors.shape[1],
+                precision=precision,
+                size=size,
+                revision=meta["revision"] + 1,
+                **fitted
+            )
+
+    def scale_outgrown(self, meta, vectors, size):
+        """
+        Whether the int8 scale must be fitted again before adding `vectors`:
+        they saturate the codes, or the collection doubled since the fit.
+        A scale fitted to the first few chunks clips most later ones.
+        """
+        if size >= 2 * meta.get("scale_size", meta["size"]):
+            return True
+        scale = np.load(self.scale_file(meta["generation"]))
+        return np.mean(np.abs(vectors) > scale * 127) > SATURATED_SHARE
+
+    def requantize(self, meta, size, dim):
+        """
+        Move the collection to a new generation whose int8 codes use a
+        scale fitted to all of its `size` vectors, searches under way keep
+        the codes they started with. The vectors and IVF index are linked,
+        not copied. Returns the new generation.
+        """
+        source, generation = meta["generation"], meta["generation"] + 1
+        self.remove_generation(generation)
+        for file in (self.vectors_file, self.ivf_file):
+            if file(source).exists():
+                try:
+                    os.link(file(source), file(generation))
+                except OSError:
+                    shutil.copyfile(file(source), file(generation))
+        vectors = np.memmap(
+            self.vectors_file(generation), dtype=np.float32, mode="r",
+            shape=(size, dim)
+        )
+        scale = fit_scale(vectors, np.arange(size))
+        np.save(self.scale_file(generation), scale)
+        for start in range(0, size, BLOCK_ROWS):
+            write_rows(
+                self.codes_file(generation, "int8"),
+                start,
+                quantize(np.asarray(vectors[start:start + BLOCK_ROWS]), "int8", scale)
+            )
+        log.info(f"Fitted the int8 scale of {self.path} to {size} vectors")
+        return generation
+
+    def delete(self, where):
+        """Delete the chunks matching a metadata filter, returns their ids"""
+        condition, params = where_sql(where)
+        with closing(self.connect()) as conn, conn:
+            ids = [
+                chunk_id for chunk_id, in conn.execute(
+                    f"SELECT chunk_id FROM rows WHERE {condition}", params
+                )
+            ]
+            if ids:
+                conn.execute(f"DELETE FROM rows WHERE {condition}", params)
+                meta = self.read_meta(conn)
+                self.write_meta(conn, revision=meta["revision"] + 1)
+        return ids
+
+    def load(self, conn, meta):
+        """
+        Memory maps of the float32 and compact vectors, the int8 scale, the
+        live slots and the IVF index, as of `meta`. `conn` must read in the
+        transaction `meta` was read in.
+        """
+        key = (meta["generation"], meta["size"])
+        if self._vectors_key != key:
+            generation, shape = meta["generation"], (meta["size"], meta["dim"])
+            precision = meta.get("precision") or "float32"
+            self._vectors = self._codes = self._scale = None
+            if meta["size"]:
+                self._vectors = np.memmap(
+                    self.vectors_file(generation),
+                    dtype=np.float32,
+                    mode="r",
+                    shape=shape
+                )
+                if precision != "float32":
+                    self._codes = np.memmap(
+                        self.codes_file(generation, precision),
+                        dtype=PRECISIONS[precision],
+                        mode="r",
+                        shape=shape
+                    )
+                if precision == "int8":
+                    self._scale = np.load(self.scale_file(generation))
+            else:
+                self._vectors = np.zeros((0, 0), dtype=np.float32)
+            self._vectors_key = key
+
+        key = (meta["generation"], meta["revision"])
+        if self._live_key != key:
+            slots = np.fromiter(
+                (slot for slot, in conn.execute("SELECT slot FROM rows")),
+                dtype=np.int64
+            )
+            self._live = np.zeros(meta["size"], dtype=bool)
+            self._live[slots] = True
+            self._live_key = key
+
+        ivf_path = self.ivf_file(meta["generation"])
+        key = (meta["generation"], ivf_path.exists() and ivf_path.stat().st_mtime_ns)
+        if self._ivf_key != key:
+            self._ivf = dict(np.load(ivf_path)) if ivf_path.exists() else None
+            self._ivf_key = key
+        return self._vectors, self._codes, self._scale, self._live, self._ivf
+
+    def candidates(self, query, live, ivf):
+        """Slots worth scoring for `query`: all of them, or the probed lists"""
+        if ivf is None:
+            return np.flatnonzero(live)
+        lists = top_k(ivf["centroids"] @ query, settings.LOCAL_IVF_NPROBE)
+        offsets = ivf["offsets"]
+        slots = np.concatenate(
+            [ivf["slots"][offsets[n]:offsets[n + 1]] for n in lists]
+            # Slots written after the index was built are always scanned
+            + [np.arange(int(ivf["size"]), len(live))]
+        )
+        return slots[live[slots]]
+
+    def similarity_search(self, query, k=4, filter=None):
+        query = normalize(self.embedding.embed_query(query))
+        with closing(self.connect()) as conn:
+            # One read transaction, the meta, slots and rows are all seen as
+            # of the same write even while another process adds chunks
+            conn.execute("BEGIN")
+            with self._lock:
+                meta = self.read_meta(conn)
+                vectors, codes, scale, live, ivf = self.load(conn, meta)
+            if filter:
+                condition, params = where_sql(filter)
+                live = np.zeros_like(live)
+                live[[
+                    slot for slot, in conn.execute(
+                        f"SELECT slot FROM rows WHERE {condition}", params
+                    )
+                ]] = True
+            slots = self.candidates(query, live, ivf)
+            if not len(slots):
+                return []
+            if codes is not None:
+                # Shortlist on the compact vectors, int8 codes times the
+                # scaled query are the dequantized dot products
+                approx = scan(codes, slots, query if scale is None else query * scale)
+                slots = np.sort(
+                    slots[top_k(approx, k * settings.LOCAL_RESCORE_FACTOR)]
+                )
+            scores = scan(vectors, slots, query)
+            best = [int(slot) for slot in slots[top_k(scores, k)]]
+
+            rows = {
+                slot: (chunk_id, content, metadata)
+                for slot, chunk_id, content, metadata in conn.execute(
+                    "SELECT slot, chunk_id, content, metadata FROM rows "
+                    f"WHERE slot IN ({', '.join('?' * len(best))})",
+                    best
+                )
+            }
+        return [
+            Chunk(page_content=rows[slot][1], metadata=json.loads(rows[slot][2]),
+                  id=rows[slot][0])
+            for slot in best if slot in rows
+        ]
+
+    def optimize(self):
+        """
+        Build the IVF index once the project is big enough, and rebuild it
+        when the vectors written since outgrow a tenth of it.
+        The caller must hold the project's write lock.
+        """
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN")
+            meta = self.read_meta(conn)
+            vectors, _, _, live, ivf = self.load(conn, meta)
+        count = int(live.sum())
+        if count < settings.LOCAL_IVF_MIN_VECTORS:
+            return
+        if ivf is not None and meta["size"] - int(ivf["size"]) < count // 10:
+            return
+
+        log.info(f"Building IVF index of {count} vectors in {self.path}")
+        slots = np.flatnonzero(live)
+        n_lists = max(int(np.sqrt(count)), 1)
+        rng = np.random.default_rng(0)
+        sample = slots[rng.choice(count, min(count, n_lists * 64), replace=False)]
+        centroids = kmeans(np.asarray(vectors[np.sort(sample)]), n_lists)
+
+        assignment = np.empty(len(slots), dtype=np.int64)
+        # Assign in blocks, the full similarity matrix could be huge
+        for start in range(0, len(slots), BLOCK_ROWS):
+            block = np.asarray(vectors[slots[start:start + BLOCK_ROWS]])
+            assignment[start:start + BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]
+        )
+        path = self.ivf_file(meta["generation"])
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp,
+            centroids=centroids,
+            slots=slots[order],
+            offsets=offsets,
+            size=meta["size"]
+        )
+        os.replace(tmp, path)
+
+    def close(self):
+        self._vectors = self._codes = self._scale = self._vectors_key = None
+        self._ivf = self._ivf_key = None
+
+    @classmethod
+    def compact(cls, path):
+        """
+        Rewrite the vectors of every local collection of the project
+        without the slots of deleted chunks, int8 codes are quantized again
+        with a scale fitted to all the vectors. The new files get a new
+        generation so open readers keep using the old ones until they
+        see the committed switch, the old files are removed by the next
+        compaction.
+        """
+        root = Path(path) / cls.DIRNAME
+        if not root.exists():
+            return
+        for collection in root.iterdir():
+            if collection.is_dir():
+                cls(path, collection.name, embedding=None).rewrite()
+
+    @classmethod
+    def drop(cls, path, collection_name):
+        """Delete a collection of the project"""
+        shutil.rmtree(Path(path) / cls.DIRNAME / collection_name, ignore_errors=True)
+
+    def generations(self):
+        """Files of the collection by the generation they belong to"""
+        files = {}
+        for file in self.path.iterdir():
+            kind, _, rest = file.name.partition("-")
+            generation = rest.split(".", 1)[0]
+            if kind in ("vectors", "codes", "scale", "ivf") and generation.isdigit():
+                files.setdefault(int(generation), []).append(file)
+        return files
+
+    def remove_generation(self, generation):
+        """
+        Delete the files of a generation, left behind by a compaction or
+        by an interrupted write. Vectors linked from another generation
+        must not be written to through the old link.
+        """
+        for file in self.generations().get(generation, []):
+            file.unlink(missing_ok=True)
+
+    def rewrite(self):
+        with closing(self.connect()) as conn:
+            meta = self.read_meta(conn)
+            # The generation replaced by the previous compaction was kept for
+            # the searches that had just read its meta, they are long done
+            for generation in self.generations():
+                if generation < meta["generation"]:
+                    self.remove_generation(generation)
+            if not meta["size"]:
+                return
+            slots = [slot for slot, in conn.execute("SELECT slot FROM rows ORDER BY slot")]
+            if len(slots) == meta["size"]:
+                return
+            vectors, _, _, _, ivf = self.load(conn, meta)
+            generation = meta["generation"] + 1
+            precision = meta.get("precision") or "float32"
+            self.remove_generation(generation)
+            scale = None
+            if precision == "int8":
+                scale = fit_scale(vectors, slots)
+                np.save(self.scale_file(generation), scale)
+            for start in range(0, len(slots), BLOCK_ROWS):
+                block = np.asarray(vectors[slots[start:start + BLOCK_ROWS]])
+                write_rows(self.vectors_file(generation), start, block)
+                if precision != "float32":
+                    write_rows(
+                        self.codes_file(generation, precision),
+                        start,
+                        quantize(block, precision, scale)
+                    )
+            with conn:
+                conn.execute("UPDATE rows SET slot = -1 - slot")
+                conn.executemany(
+                    "UPDATE rows SET slot = ? WHERE slot = ?",
+                    [(new, -1 - old) for new, old in enumerate(slots)]
+                )
+                self.write_meta(
+                    conn,
+                    generation=generation,
+                    size=len(slots),
+                    scale_size=len(slots),
+                    revision=meta["revision"] + 1
+                )
+        self.close()
+        log.info(
+            f"Compacted {self.path} from {meta['size']} to {len(slots)} vectors"
+        )
+        if ivf is not None:
+            self.optimize()
+
+
+BACKENDS = {
+    "chroma": ChromaBackend,
+    "local": LocalBackend,
+}
+
+
+def get_backend(name=None):
+    """Backend class called `name`, VECTOR_BACKEND by default"""
+    name = name or settings.VECTOR_BACKEND
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown vector backend {name!r}") from None
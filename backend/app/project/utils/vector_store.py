@@ -0,0 +1,474 @@
+"""
+Long lived handles to the per project vector stores
+"""
+import logging
+import os
+import shutil
+import threading
+import weakref
+from itertools import count
+from pathlib import Path
+
+from django.conf import settings
+from langchain_core.documents import Document as Chunk
+
+from .chunk_refs import ChunkRefs
+from .embeddings import get_embedding_model
+from .embedding_cache import CachedEmbeddings
+from .hashing import text_sha256
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
+from .vector_backends import BACKENDS, get_backend
+
+log = logging.getLogger(__name__)
+
+
+# Chunk hashes per delete statement
+DELETE_BATCH = 500
+
+
+def chunk_id(doc_id, index):
+    """Stable vector id of the `index`-th chunk of a document"""
+    return f"doc_{doc_id}_chunk_{index}"
+
+
+class ProjectVectorStore:
+    """
+    Handle to the vector collection of a single project, in the configured
+    backend, and the lexical and chunk reference indexes kept alongside it
+    """
+
+    def __init__(self, project_id, collection_name, embedding, backend=None,
+                 precision=None):
+        self.project_id = project_id
+        self.collection_name = collection_name
+        self.path = registry.path(project_id)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.backend = get_backend(backend)(
+            self.path, collection_name, embedding, precision=precision
+        )
+        self.lexical = LexicalIndex(self.path, collection_name)
+        self.refs = ChunkRefs(self.path, collection_name)
+
+    def add_chunks(self, doc_id, chunks, start=0):
+        """
+        Append the chunks of a document to the collection.
+        Ids are derived from the document and chunk position so re-running
+        the ingestion of a document overwrites its vectors instead of
+        duplicating them. Text already stored in the collection, for this
+        or another document (re-uploads, boilerplate pages), is neither
+        embedded nor stored again, the document references the stored
+        chunk. Returns the written ids.
+        """
+        for chunk in chunks:
+            chunk.metadata["chunk_hash"] = text_sha256(chunk.page_content)
+        hashes = [chunk.metadata["chunk_hash"] for chunk in chunks]
+        seen = self.refs.stored(hashes)
+
+        ids, new_chunks = [], []
+        for n, chunk in enumerate(chunks):
+            if chunk.metadata["chunk_hash"] in seen:
+                continue
+            seen.add(chunk.metadata["chunk_hash"])
+            ids.append(chunk_id(doc_id, start + n))
+            new_chunks.append(chunk)
+        if ids:
+            self.backend.add(ids, new_chunks)
+            self.lexical.add_chunks(ids, new_chunks)
+        self.refs.add(
+            doc_id,
+            hashes,
+            stored=[
+                (chunk.metadata["chunk_hash"], stored_id)
+                for stored_id, chunk in zip(ids, new_chunks)
+            ]
+        )
+        return ids
+
+    def complete_document(self, doc_id, content_hash, chunks):
+        """Record that every chunk of a document was added"""
+        self.refs.complete(doc_id, content_hash, chunks)
+
+    def reuse_document(self, doc_id, content_hash):
+        """
+        Index a document as a copy of an indexed document with the same
+        content, nothing is loaded, embedded or stored. Returns its number
+        of chunks, None when there is no such document.
+        """
+        source = self.refs.find_document(content_hash, exclude=doc_id)
+        if source is None:
+            return None
+        source_id, chunks = source
+        self.refs.copy(source_id, doc_id)
+        self.refs.complete(doc_id, content_hash, chunks)
+        log.info(f"Doc {doc_id} has the same content as doc {source_id}")
+        return chunks
+
+    def delete_chunks(self, where):
+        """
+        Delete the chunks matching a metadata filter from the collection and
+        the lexical index. Returns the deleted ids.
+        """
+        ids = self.backend.delete(where)
+        if ids:
+            self.lexical.delete_chunks(ids)
+        return ids
+
+    def delete_document(self, doc_id):
+        """
+        Remove a document from the collection: its references, and the
+        stored chunks no other document uses. Chunks stored under it that
+        other documents still use are kept. Returns the deleted ids.
+        """
+        unused = self.refs.unused(doc_id)
+        if unused is None:
+            # Indexed before the references were kept, nothing is shared
+            return self.delete_chunks({"document_id": doc_id})
+        ids = []
+        for start in range(0, len(unused), DELETE_BATCH):
+            ids += self.delete_chunks(
+                {"chunk_hash": {"$in": unused[start:start + DELETE_BATCH]}}
+            )
+        self.refs.remove(doc_id)
+        return ids
+
+    def scope_filter(self, doc_ids):
+        """
+        Filter matching the chunks the documents `doc_ids` use but which
+        are stored under other documents, None when there are none
+        """
+        borrowed = self.refs.borrowed(doc_ids)
+        if not borrowed:
+            return None
+        return {"chunk_hash": {"$in": borrowed}}
+
+    def search(self, query, k=4, filter=None):
+        """
+        Best `k` chunks for `query`. With RAG_HYBRID_SEARCH the vector and
+        lexical candidates are fused by reciprocal rank, so chunks quoting
+        the exact terms of the question rank high without raising `k`.
+        """
+        fetch_k = max(k, settings.RAG_FETCH_K)
+        if not settings.RAG_HYBRID_SEARCH:
+            # Text stored for several documents is returned once
+            semantic = self.backend.similarity_search(query, k=fetch_k, filter=filter)
+            return reciprocal_rank_fusion([semantic])[:k]
+
+        semantic = self.backend.similarity_search(query, k=fetch_k, filter=filter)
+        lexical = [
+            Chunk(page_content=content, metadata=metadata, id=chunk_id)
+            for chunk_id, content, metadata
+            in self.lexical.search(query, fetch_k, filter=filter)
+        ]
+        fused = reciprocal_rank_fusion([semantic, lexical], k=settings.RAG_RRF_K)
+        return fused[:k]
+
+    def optimize(self):
+        """Refresh the backend's search index after a batch of writes"""
+        self.backend.optimize()
+
+    def close(self):
+        """Release the backend's files and clients"""
+        self.backend.close()
+
+
+def get_store_embeddings(model_name=None):
+    """
+    Embedding model `model_name` of the stores, EMBEDDING_MODEL_NAME by
+    default, behind the cache when enabled
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    embeddings = get_embedding_model(model_name)
+    if settings.EMBEDDING_CACHE_MAX_ENTRIES:
+        embeddings = CachedEmbeddings(embeddings, model_name)
+    return embeddings
+
+
+def collection_config(project):
+    """Settings a new collection of `project` is built with"""
+    return {
+        'embedding_model': settings.EMBEDDING_MODEL_NAME,
+        'chunk_size': settings.CHUNK_SIZE,
+        'chunk_overlap': settings.CHUNK_OVERLAP,
+        'backend': settings.VECTOR_BACKEND,
+        'precision': project.vector_precision,
+    }
+
+
+def open_store(project_id, collection_name, config):
+    """
+    Store of a collection, with the embedding model, backend and precision
+    of the `config` it was built with. The settings only apply to new
+    collections: another model would give vectors of another space, another
+    backend an empty collection.
+    """
+    return ProjectVectorStore(
+        project_id,
+        collection_name,
+        get_store_embeddings(config.get('embedding_model')),
+        backend=config.get('backend'),
+        precision=config.get('precision')
+    )
+
+
+class VectorStoreRegistry:
+    """
+    Owner of the on-disk layout and the open handles of the project stores.
+    Every project keeps its collection and lexical index in
+    CHROMA_ROOT/projects/<id>. At most VECTOR_STORE_MAX_OPEN stores stay
+    open per process, past that the least recently used one is closed
+    once nothing holds it anymore.
+    """
+
+    def __init__(self):
+        # Open stores keyed by (project id, collection name), shared by
+        # every task run in the process, and when each was last handed out
+        self._stores = {}
+        self._used = {}
+        self._clock = count()
+        self._lock = threading.Lock()
+
+    @property
+    def root(self):
+        return Path(settings.CHROMA_ROOT) / "projects"
+
+    def path(self, project_id):
+        """Directory holding the persistent vector data of a project"""
+        return self.root / str(project_id)
+
+    def collection_name(self, project_id, revision=None):
+        """
+        Name of the collection a project's chunks are written to, rebuilt
+        collections are told apart by their `revision`
+        """
+        if revision is None:
+            return f"proj_{project_id}"
+        return f"proj_{project_id}_r{revision}"
+
+    def assign_collection(self, project):
+        """
+        Give `project` its collection on the first ingestion, built with
+        the current settings
+        """
+        if not project.chroma_collection:
+            project.chroma_collection = self.collection_name(project.id)
+            project.collection_config = collection_config(project)
+            project.save(update_fields=["chroma_collection", "collection_config"])
+        return project.chroma_collection
+
+    def adopt_shared_lexical_index(self, project):
+        """
+        Projects indexed before each collection got its own lexical index
+        kept it in a file shared by the project, it belongs to the
+        collection in use
+        """
+        path = self.path(project.id)
+        shared = LexicalIndex(path)
+        own = LexicalIndex(path, project.chroma_collection)
+        if not shared.path.exists() or own.path.exists():
+            return
+        for suffix in ("-wal", "-shm", ""):
+            source = shared.path.with_name(shared.path.name + suffix)
+            if source.exists():
+                os.replace(source, own.path.with_name(own.path.name + suffix))
+
+    def get(self, project):
+        """
+        Return the open store for `project`, opening it on first use.
+        The project must already have a collection assigned.
+        """
+        key = (project.id, project.chroma_collection)
+        # Open stores are handed out without taking the lock
+        store = self._stores.get(key)
+        if store is None:
+            store = self._open(project, key)
+        self._used[key] = next(self._clock)
+        return store
+
+    def _open(self, project, key):
+        with self._lock:
+            self.adopt_shared_lexical_index(project)
+        # Opening can take a while, the lock is not held meanwhile so the
+        # stores of other projects stay available
+        log.info(f"Opening vector store for project {project.id}")
+        store = open_store(
+            project.id, project.chroma_collection, project.collection_config
+        )
+        with self._lock:
+            current = self._stores.get(key)
+            if current is not None:
+                # Another thread opened it first
+                self._close(store)
+                return current
+            self._stores[key] = store
+            self._used[key] = next(self._clock)
+            while len(self._stores) > max(settings.VECTOR_STORE_MAX_OPEN, 1):
+                oldest = min(self._stores, key=lambda key: self._used.get(key, -1))
+                self._used.pop(oldest, None)
+                self._retire(self._stores.pop(oldest))
+        return store
+
+    def _retire(self, store):
+        """
+        Close an evicted store once the tasks and retrievers still holding
+        it are done with it, closing it under them would fail their writes
+        and searches
+        """
+        log.info(f"Closing idle vector store of project {store.project_id}")
+        weakref.finalize(store, self._close_backend, store.project_id, store.backend)
+
+    @staticmethod
+    def _close_backend(project_id, backend):
+        try:
+            backend.close()
+        except Exception:
+            log.exception(f"Error closing store of project {project_id}")
+
+    def _close(self, store):
+        try:
+            store.close()
+        except Exception:
+            log.exception(f"Error closing store of project {store.project_id}")
+
+    def close(self, project_id):
+        """Close the open stores of a project, before its files are moved"""
+        with self._lock:
+            for key in [key for key in self._stores if key[0] == project_id]:
+                self._used.pop(key, None)
+                self._close(self._stores.pop(key))
+
+    def close_all(self):
+        """Close every open store, called when the process shuts down"""
+        with self._lock:
+            for store in self._stores.values():
+                self._close(store)
+            self._stores.clear()
+            self._used.clear()
+
+    def open_count(self):
+        """Number of stores currently open in this process"""
+        return len(self._stores)
+
+    def delete(self, project_id):
+        """Remove the whole vector directory of a project"""
+        self.close(project_id)
+        path = self.path(project_id)
+        if path.exists():
+            shutil.rmtree(path)
+            log.info(f"Deleted vector directory of project {project_id}")
+
+    def compact(self, project_id):
+        """
+        Give the space of deleted vectors back to the disk, in every
+        backend the project has data in. The caller must hold the
+        project's write lock.
+        """
+        path = self.path(project_id)
+        for backend in BACKENDS.values():
+            backend.compact(path)
+        for index in LexicalIndex.all(path) + ChunkRefs.all(path):
+            index.compact()
+
+    def drop_collection(self, project_id, collection_name):
+        """
+        Remove a collection of the project, from every backend, and its
+        lexical index. Used once a rebuilt collection replaced it.
+        """
+        with self._lock:
+            self._used.pop((project_id, collection_name), None)
+            store = self._stores.pop((project_id, collection_name), None)
+            if store is not None:
+                self._close(store)
+        path = self.path(project_id)
+        for backend in BACKENDS.values():
+            backend.drop(path, collection_name)
+        LexicalIndex(path, collection_name).drop()
+        ChunkRefs(path, collection_name).drop()
+        log.info(f"Dropped collection {collection_name} of project {project_id}")
+
+    def orphans(self, project_ids):
+        """Vector directories of projects not in `project_ids`"""
+        if not self.root.exists():
+            return []
+        known = {str(project_id) for project_id in project_ids}
+        return sorted(
+            path for path in self.root.iterdir()
+            if path.is_dir() and path.name not in known
+        )
+
+    def legacy_paths(self, project_id):
+        """
+        Directories older layouts kept a project's vectors in: directly
+        under CHROMA_ROOT, or under one of CHROMA_LEGACY_ROOTS
+        """
+        paths = [Path(settings.CHROMA_ROOT) / f"project_{project_id}"]
+        for root in settings.CHROMA_LEGACY_ROOTS:
+            root = Path(root)
+            paths += [root / "projects" / str(project_id), root / f"project_{project_id}"]
+        current = self.path(project_id).resolve()
+        return [
+            path for path in paths
+            if path.is_dir() and path.resolve() != current
+        ]
+
+    def consolidate(self, project_id, dry_run=False):
+        """
+        Move the vectors of a project from an older layout to its current
+        directory. Returns the moved directory, None when there was nothing
+        to move. Directories that would overwrite existing vectors are left
+        in place and reported with a ValueError.
+        """
+        sources = self.legacy_paths(project_id)
+        if not sources:
+            return None
+        target = self.path(project_id)
+        if len(sources) > 1 or (target.exists() and any(target.iterdir())):
+            raise ValueError(
+                f"Project {project_id} has vectors in "
+                f"{', '.join(str(path) for path in sources + [target])}"
+            )
+        if not dry_run:
+            self.close(project_id)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if target.exists():
+                target.rmdir()
+            shutil.move(str(sources[0]), str(target))
+            log.info(f"Moved vectors of project {project_id} from {sources[0]}")
+        return sources[0]
+
+
+registry = VectorStoreRegistry()
+
+
+def get_project_vector_path(project_id):
+    """Directory holding the persistent vector data of a project"""
+    return registry.path(project_id)
+
+
+def get_project_store(project):
+    """Open store of `project`, see VectorStoreRegistry.get"""
+    return registry.get(project)
+
+
+def close_project_store(project_id):
+    """Close the open stores of a project"""
+    registry.close(project_id)
+
+
+def delete_project_vectors(project_id):
+    """Remove the whole vector directory of a project"""
+    registry.delete(project_id)
+
+
+def compact_project_vectors(project_id):
+    """Reclaim the space of deleted vectors, see VectorStoreRegistry.compact"""
+    registry.compact(project_id)
+
+
+def orphan_vector_dirs(project_ids):
+    """Vector directories of projects not in `project_ids`"""
+    return registry.orphans(project_ids)
+
+
+def close_project_stores():
+    """Close every open store, called when the worker process shuts down"""
+    registry.close_all()
@@ -3,28 +3,45 @@ API Views for the Project model
 """
 
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse
 from django.db import transaction
 from .models import (
     Project,
-    Document
+    Document,
+    DocumentUpload
 )
 from .serializers import (
     ProjectListSerializer,
     ProjectDetailSerializer,
     DocumentDetailSerializer,
     DocumentListSerializer,
-    DocumentUploadSerializer
+    DocumentUploadSerializer,
+    DocumentBulkUploadSerializer,
+    DocumentUploadSessionSerializer
 )
+from .utils.downloads import document_download_response
+from .utils.uploads import (
+    PartError,
+    write_part,
+    stored_file_sha256,
+    read_head
+)
+from django.conf import settings
+from django.core.files.storage import default_storage
 
 from rest_framework import (
     viewsets,
-    mixins
+    mixins,
+    status
 )
 from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
-from project.tasks import process_document_task
+from project.tasks import (
+    process_document_task,
+    process_documents_task
+)
 
 
 class ProjectViewSet(viewsets.ModelViewSet):
@@ -79,6 +96,10 @@ class DocumentViewSet(mixins.ListModelMixin,
             return DocumentListSerializer
         if self.action == 'create':
             return DocumentUploadSerializer
+        if self.action == 'bulk_upload':
+            return DocumentBulkUploadSerializer
+        if self.action in ('start_upload', 'upload_detail', 'upload_part', 'complete_upload'):
+            return DocumentUploadSessionSerializer
         return self.serializer_class
 
     def get_serializer_context(self):
@@ -100,13 +121,147 @@ class DocumentViewSet(mixins.ListModelMixin,
         # Guarantee document insert is fully committed to db before celery task
         transaction.on_commit(lambda: process_document_task.delay(doc.id)) # type: ignore
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_upload(self, request, project_pk=None):
+        """
+        Upload many PDFs (or zip archives of PDFs) in one request.
+        All rows are inserted at once and indexed by a single ingestion job.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            docs = serializer.save()
+            doc_ids = [doc.id for doc in docs]
+            transaction.on_commit(lambda: process_documents_task.delay(doc_ids)) # type: ignore
+
+        return Response(
+            DocumentListSerializer(docs, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    def get_upload(self, upload_id, lock=False):
+        """Get an in progress upload of the current user and project"""
+        uploads = DocumentUpload.objects.filter(
+            project=self.get_project(),
+            uploaded_by=self.request.user,
+            status=DocumentUpload.UploadStatus.IN_PROGRESS
+        )
+        if lock:
+            uploads = uploads.select_for_update()
+        return get_object_or_404(uploads, pk=upload_id)
+
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def start_upload(self, request, project_pk=None):
+        """
+        Start a resumable upload, the file is then sent in parts
+        and the document is created once the upload is completed.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=False,
+        methods=['get', 'delete'],
+        url_path=r'uploads/(?P<upload_id>[0-9]+)'
+    )
+    def upload_detail(self, request, upload_id=None, project_pk=None):
+        """
+        GET the upload progress, `received_bytes` is the offset to resume from.
+        DELETE aborts the upload and removes the partial file.
+        """
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                upload = self.get_upload(upload_id, lock=True)
+                default_storage.delete(upload.file_path)
+                upload.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        upload = self.get_upload(upload_id)
+        return Response(self.get_serializer(upload).data)
+
+    @action(
+        detail=False,
+        methods=['put'],
+        url_path=r'uploads/(?P<upload_id>[0-9]+)/parts'
+    )
+    def upload_part(self, request, upload_id=None, project_pk=None):
+        """
+        Append the raw request body to the upload.
+        The `Upload-Offset` header must match the bytes received so far and
+        the optional `Upload-Checksum` header holds the part's SHA-256.
+        """
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            raise ValidationError("Upload-Offset and Content-Length headers are required.")
+        if length <= 0 or length > settings.DOCUMENT_UPLOAD_MAX_PART_BYTES:
+            raise ValidationError("Invalid part size.")
+
+        with transaction.atomic():
+            upload = self.get_upload(upload_id, lock=True)
+            if offset != upload.received_bytes:
+                return Response(
+                    self.get_serializer(upload).data,
+                    status=status.HTTP_409_CONFLICT
+                )
+            try:
+                upload.received_bytes = write_part(
+                    upload,
+                    request.stream,
+                    length,
+                    request.headers.get('Upload-Checksum', '')
+                )
+            except PartError as e:
+                raise ValidationError(str(e))
+            upload.save(update_fields=['received_bytes', 'updated_at'])
+
+        return Response(self.get_serializer(upload).data)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path=r'uploads/(?P<upload_id>[0-9]+)/complete'
+    )
+    def complete_upload(self, request, upload_id=None, project_pk=None):
+        """Check the received file, create its document and index it"""
+        with transaction.atomic():
+            upload = self.get_upload(upload_id, lock=True)
+            if upload.received_bytes != upload.size:
+                raise ValidationError("Upload is missing parts.")
+            if read_head(upload.file_path) != b'%PDF-':
+                raise ValidationError("Only PDF files are allowed.")
+            content_hash = stored_file_sha256(upload.file_path)
+            if upload.sha256 and upload.sha256 != content_hash:
+                raise ValidationError("File checksum mismatch.")
+
+            doc = Document.objects.create(
+                project=upload.project,
+                uploaded_by=request.user,
+                name=upload.name,
+                file=upload.file_path,
+                file_size=upload.size,
+                content_type='application/pdf',
+                content_hash=content_hash
+            )
+            upload.document = doc
+            upload.status = DocumentUpload.UploadStatus.COMPLETED
+            upload.save(update_fields=['document', 'status', 'updated_at'])
+            transaction.on_commit(lambda: process_document_task.delay(doc.id)) # type: ignore
+
+        return Response(
+            self.get_serializer(upload).data,
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=True, methods=['get'], url_path='download')
     def download(self, request, project_pk=None, pk=None):
         # DRF injected `project_pk` and `pk` for URL resolution
         # but get_object() will automatically do:
         #   Document.objects.filter(project__id=project_pk, …).get(pk=pk)
         doc = self.get_object()
-        # Stream the file
-        response = FileResponse(open(doc.file.path, 'rb'), content_type=doc.content_type)
-        response['Content-Disposition'] = f'attachment; filename="{doc.name}"'
-        return response
\ No newline at end of file
+        # Stream the file, or the requested range of it, or hand the
+        # transfer over to the front proxy once authorized
+        return document_download_response(request, doc)
@@ -1,6 +1,10 @@
+import os
+
 from ollama import chat
 
-MODEL = 'llama3.2:1b'
+MODEL = os.getenv('CHATBOT_MODEL', 'llama3.2:1b')
+# Keep the model loaded between questions
+KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
 
 system_message = 'You are a helpful assistant that responds what your asked if you have knowledge of it. I you are not sure about something just say you do not know'
 conversation_history = [
@@ -21,7 +25,8 @@ def chat_with_history(user_input):
     stream = chat(
         model=MODEL, 
         messages=conversation_history,
-        stream=True
+        stream=True,
+        keep_alive=KEEP_ALIVE
     )
 
     for chunk in stream:
@@ -16,7 +16,7 @@ from langchain_ollama.llms import OllamaLLM
 
 load_dotenv(override=True)
 
-MODEL = 'qwen3:1.7b'
+MODEL = os.getenv('RAG_MODEL', 'qwen3:1.7b')
 OPENAI_MODEL = 'o4-mini'
 # Set our paths
 ROOT = Path(__file__).parent
@@ -37,14 +37,17 @@ else:
     loader = DirectoryLoader(str(DOCS_DIR), glob="**/*.pdf")
     docs = loader.load()
     # Chunk the data
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=int(os.getenv('CHUNK_SIZE', 1000)),
+        chunk_overlap=int(os.getenv('CHUNK_OVERLAP', 200))
+    )
     chunks = splitter.split_documents(docs)
     # Build the DB
     vector_store = Chroma.from_documents(documents=chunks, embedding=embeddings, persist_directory=str(CHROMA_DB))
     print(f'Vector store created with {len(chunks)} chunks')
 
 # Instantiate llama chat
-llm = OllamaLLM(model=MODEL)
+llm = OllamaLLM(model=MODEL, keep_alive=os.getenv('OLLAMA_KEEP_ALIVE', '30m'))
 # openai_llm = ChatOpenAI(model=OPENAI_MODEL)
 
 # Set up the conversation memory for the chat